@@ -1,4 +1,21 @@
-from drvi.scvi_tools_based.model import DRVI
+from drvi.scvi_tools_based.model import (
+    DRVI,
+    DRVIRuntime,
+    benchmark_quantization,
+    calibrate_quantization,
+    export_model,
+    quantization_report,
+    quantize_model,
+)
 from drvi.scvi_tools_based.module import DRVIModule
 
-__all__ = ["DRVI", "DRVIModule"]
+__all__ = [
+    "DRVI",
+    "DRVIModule",
+    "DRVIRuntime",
+    "export_model",
+    "benchmark_quantization",
+    "calibrate_quantization",
+    "quantization_report",
+    "quantize_model",
+]
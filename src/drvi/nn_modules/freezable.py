@@ -1,3 +1,4 @@
+import torch
 from torch import nn
 
 
@@ -11,9 +12,11 @@ def freezable(base_norm_class):
             self._freeze = freeze_status
 
         def forward(self, *args, **kwargs):
+            if not self._freeze:
+                # keep the common path free of module state changes (e.g. for torch.compile)
+                return super().forward(*args, **kwargs)
             training_status = self.training
-            if self._freeze:
-                self.train(False)
+            self.train(False)
             result = super().forward(*args, **kwargs)
             self.train(training_status)
             return result
@@ -21,11 +24,97 @@ def freezable(base_norm_class):
     return FreezableNormClass
 
 
+def _distributed_world_size() -> int:
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_world_size()
+    return 1
+
+
+class _AllReduceSum(torch.autograd.Function):
+    """Sum a tensor over all processes; the gradient of every process is the sum of all gradients."""
+
+    @staticmethod
+    def forward(ctx, tensor):
+        tensor = tensor.clone()
+        torch.distributed.all_reduce(tensor)
+        return tensor
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad_output = grad_output.clone()
+        torch.distributed.all_reduce(grad_output)
+        return grad_output
+
+
+class SyncableBatchNorm1d(nn.BatchNorm1d):
+    """
+    BatchNorm1d that can normalize with the statistics of the minibatches of all distributed processes.
+
+    When `sync_statistics` is set and a process group with more than one process is initialized,
+    the sum, sum of squares and count of the batch are all-reduced (with gradients) during training,
+    so that every process normalizes and updates its running statistics as if it saw the global batch.
+    This works with any backend, including gloo on CPU, unlike :class:`torch.nn.SyncBatchNorm`.
+    Otherwise, each process normalizes with its local batch statistics.
+    """
+
+    sync_statistics = False
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        if self.training and self.sync_statistics and _distributed_world_size() > 1:
+            return self._synced_forward(input)
+        return super().forward(input)
+
+    def _synced_forward(self, input: torch.Tensor) -> torch.Tensor:
+        x = input.float()
+        count = torch.full((1,), x.shape[0], dtype=x.dtype, device=x.device)
+        stats = _AllReduceSum.apply(torch.cat([x.sum(dim=0), (x * x).sum(dim=0), count]))
+        n_features = x.shape[1]
+        n = stats[-1]
+        mean = stats[:n_features] / n
+        var = (stats[n_features : 2 * n_features] / n - mean * mean).clamp(min=0.0)
+
+        if self.track_running_stats:
+            with torch.no_grad():
+                self.num_batches_tracked.add_(1)
+                momentum = self.momentum if self.momentum is not None else 1.0 / float(self.num_batches_tracked)
+                unbiased_var = var * n / (n - 1).clamp(min=1.0)
+                self.running_mean.lerp_(mean.to(self.running_mean.dtype), momentum)
+                self.running_var.lerp_(unbiased_var.to(self.running_var.dtype), momentum)
+
+        output = (x - mean) * torch.rsqrt(var + self.eps)
+        if self.affine:
+            output = output * self.weight + self.bias
+        return output.to(input.dtype)
+
+
 @freezable
-class FreezableBatchNorm1d(nn.BatchNorm1d):
+class FreezableBatchNorm1d(SyncableBatchNorm1d):
     pass
 
 
 @freezable
 class FreezableLayerNorm(nn.LayerNorm):
     pass
+
+
+def set_batch_norm_sync(module: nn.Module, sync: bool = True) -> nn.Module:
+    """
+    Set whether the batch normalization layers of a module synchronize statistics between distributed processes.
+
+    Parameters
+    ----------
+    module
+        Module containing :class:`SyncableBatchNorm1d` layers.
+    sync
+        Whether to normalize with the statistics of the global batch of all processes.
+        If False, each process uses its local batch statistics and the running statistics of rank 0
+        are broadcast to the other processes by DDP.
+
+    Returns
+    -------
+    The module itself.
+    """
+    for layer in module.modules():
+        if isinstance(layer, SyncableBatchNorm1d):
+            layer.sync_statistics = sync
+    return module
@@ -53,3 +53,79 @@ class StackedLinearLayer(nn.Module):
             f"in_features={self.in_features}, out_features={self.out_features}, "
             f"n_channels={self.n_channels}, bias={self.bias is not None}"
         )
+
+
+class QuantizedStackedLinearLayer(nn.Module):
+    """
+    Int8 weight-only quantized version of :class:`StackedLinearLayer`.
+
+    Weights are stored in int8 with a float scale per output feature (or per channel).
+    Activations stay in floating point. Weights are dequantized on the fly for `channels_per_chunk`
+    channels at a time, each chunk computed in a single batched matrix multiplication, so that at most
+    `channels_per_chunk` channels of float weights exist at once. Dequantization is extra work on every call:
+    the layer saves storage and peak memory of the weights, not compute.
+    """
+
+    def __init__(
+        self,
+        n_channels: int,
+        in_features: int,
+        out_features: int,
+        bias: bool = True,
+        per_channel: bool = True,
+        channels_per_chunk: int = 8,
+    ):
+        super().__init__()
+        self.n_channels = n_channels
+        self.in_features = in_features
+        self.out_features = out_features
+        self.channels_per_chunk = channels_per_chunk
+        self.register_buffer("weight_int8", torch.zeros((n_channels, in_features, out_features), dtype=torch.int8))
+        self.register_buffer("weight_scale", torch.ones((n_channels, 1, out_features if per_channel else 1)))
+        if bias:
+            self.register_buffer("bias", torch.zeros(n_channels, out_features))
+        else:
+            self.bias = None
+
+    @classmethod
+    def from_float(
+        cls, layer: StackedLinearLayer, per_channel: bool = True, channels_per_chunk: int = 8
+    ) -> "QuantizedStackedLinearLayer":
+        """Quantize the weights of a :class:`StackedLinearLayer`, per output feature or per channel."""
+        quantized_layer = cls(
+            layer.n_channels,
+            layer.in_features,
+            layer.out_features,
+            bias=layer.bias is not None,
+            per_channel=per_channel,
+            channels_per_chunk=channels_per_chunk,
+        )
+        with torch.no_grad():
+            weight = layer.weight.detach().float().cpu()
+            reduce_dims = (1,) if per_channel else (1, 2)
+            scale = weight.abs().amax(dim=reduce_dims, keepdim=True).clamp(min=1e-12) / 127
+            quantized_layer.weight_int8.copy_(torch.round(weight / scale).clamp(-127, 127).to(torch.int8))
+            quantized_layer.weight_scale.copy_(scale)
+            if layer.bias is not None:
+                quantized_layer.bias.copy_(layer.bias.detach())
+        return quantized_layer
+
+    def _dequantize(self, start: int, end: int, dtype: torch.dtype) -> torch.Tensor:
+        return self.weight_int8[start:end].to(dtype) * self.weight_scale[start:end].to(dtype)
+
+    def forward(self, input: torch.Tensor) -> torch.Tensor:
+        if self.n_channels <= self.channels_per_chunk:
+            mm = torch.einsum("bci,cio->bco", input, self._dequantize(0, self.n_channels, input.dtype))
+        else:
+            mm = input.new_empty(input.shape[0], self.n_channels, self.out_features)
+            for start in range(0, self.n_channels, self.channels_per_chunk):
+                end = start + self.channels_per_chunk
+                mm[:, start:end] = torch.einsum(
+                    "bci,cio->bco", input[:, start:end], self._dequantize(start, end, input.dtype)
+                )
+        if self.bias is not None:
+            mm = mm + self.bias
+        return mm
+
+    def extra_repr(self) -> str:
+        return f"in_features={self.in_features}, out_features={self.out_features}, n_channels={self.n_channels}"
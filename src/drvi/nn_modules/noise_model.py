@@ -5,6 +5,8 @@ from scvi.distributions import NegativeBinomial
 from torch.distributions import Distribution, Normal, Poisson
 from torch.nn import functional as F
 
+from drvi.nn_modules.precision import fp32_function
+
 
 class NoiseModel:
     def __init__(self):
@@ -18,6 +20,11 @@ class NoiseModel:
     def main_param(self):
         return "mean"
 
+    @property
+    def supports_feature_subset(self):
+        # whether `dist` can be computed from parameters of a subset of features
+        return False
+
     def initial_transformation(self, x, x_mask=1.0):
         x = x
         aux_info = {}
@@ -77,6 +84,10 @@ class NormalNoiseModel(NoiseModel):
         self.model_var = model_var
         self.eps = eps
 
+    @property
+    def supports_feature_subset(self):
+        return True
+
     @property
     def parameters(self):
         if self.model_var == "fixed":
@@ -112,6 +123,10 @@ class PoissonNoiseModel(NoiseModel):
         self.mean_transformation = mean_transformation
         self.library_normalization = library_normalization
 
+    @property
+    def supports_feature_subset(self):
+        return self.mean_transformation == "exp"
+
     @property
     def parameters(self):
         return {
@@ -149,6 +164,10 @@ class NegativeBinomialNoiseModel(NoiseModel):
         self.mean_transformation = mean_transformation
         self.library_normalization = library_normalization
 
+    @property
+    def supports_feature_subset(self):
+        return self.mean_transformation == "exp"
+
     @property
     def parameters(self):
         params = {
@@ -208,7 +227,9 @@ class LogNegativeBinomial(Distribution):
         raise NotImplementedError()
 
     @staticmethod
+    @fp32_function
     def negative_binomial_log_ver(k, m_log, r_log, eps=1e-8):
+        # lgamma and softplus are computed in float32 under autocast
         # r :D
         r = torch.exp(r_log)
 
@@ -232,6 +253,10 @@ class LogNegativeBinomialNoiseModel(NoiseModel):
         self.mean_transformation = mean_transformation
         self.library_normalization = library_normalization
 
+    @property
+    def supports_feature_subset(self):
+        return self.mean_transformation == "none"
+
     @property
     def parameters(self):
         params = {
@@ -265,3 +290,45 @@ class LogNegativeBinomialNoiseModel(NoiseModel):
             raise NotImplementedError()
         trans_r = r
         return LogNegativeBinomial(log_m=trans_mean, log_r=trans_r)
+
+
+def _map_distribution_params(dist: Distribution, fn) -> Distribution:
+    """Build a distribution of the same type with `fn` applied to each parameter."""
+    if isinstance(dist, Normal):
+        return Normal(fn(dist.loc), fn(dist.scale), validate_args=False)
+    if isinstance(dist, Poisson):
+        return Poisson(fn(dist.rate), validate_args=False)
+    if isinstance(dist, NegativeBinomial):
+        return NegativeBinomial(mu=fn(dist.mu), theta=fn(dist.theta), scale=None)
+    if isinstance(dist, LogNegativeBinomial):
+        return LogNegativeBinomial(log_m=fn(dist.log_m), log_r=fn(dist.log_r), eps=dist._eps)
+    raise NotImplementedError()
+
+
+def gather_features(dist: Distribution, index: torch.Tensor) -> Distribution:
+    """
+    Restrict a distribution over features (last dimension) to a subset of features per cell.
+
+    Parameters
+    ----------
+    dist
+        Distribution returned by the `dist` method of a noise model.
+    index
+        Feature indices of shape ``(n_cells, n_selected)``.
+
+    Returns
+    -------
+    Distribution
+        Distribution of the same type over the selected features.
+    """
+
+    def gather(param):
+        param = torch.broadcast_to(param, (*index.shape[:-1], param.shape[-1]))
+        return torch.gather(param, -1, index)
+
+    return _map_distribution_params(dist, gather)
+
+
+def select_cells(dist: Distribution, cells: torch.Tensor) -> Distribution:
+    """Restrict a distribution over cells (first dimension) and features to the cells in `cells`."""
+    return _map_distribution_params(dist, lambda param: param[cells] if param.dim() > 1 else param)
@@ -0,0 +1,70 @@
+import contextlib
+import functools
+
+import torch
+
+
+def _is_autocast_enabled(device_type: str) -> bool:
+    try:
+        return torch.is_autocast_enabled(device_type)
+    except TypeError:  # torch < 2.4
+        return torch.is_autocast_cpu_enabled() if device_type == "cpu" else torch.is_autocast_enabled()
+
+
+def _needs_fp32_cast(t) -> bool:
+    if not isinstance(t, torch.Tensor) or not t.is_floating_point() or t.dtype == torch.float32:
+        return False
+    return torch.finfo(t.dtype).bits < 32 or _is_autocast_enabled(t.device.type)
+
+
+def to_fp32(*tensors):
+    """
+    Cast floating point tensors to float32 when they are of lower precision or autocast is active.
+
+    Other values, and higher precision tensors outside of autocast (e.g. of a float64 model), are returned unchanged.
+    """
+    return tuple(t.float() if _needs_fp32_cast(t) else t for t in tensors)
+
+
+def fp32_region(device_type: str = "cpu"):
+    """Context manager disabling autocast, so that operations on float32 inputs run in float32."""
+    return torch.autocast(device_type=device_type, enabled=False)
+
+
+def fp32_function(func):
+    """
+    Decorator running a function in float32 under autocast.
+
+    Lower precision floating point tensor arguments are cast to float32 (see :func:`to_fp32`) and autocast
+    is disabled for the device of the first tensor argument. Without autocast, float32 and float64 arguments
+    are passed through unchanged.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        args = to_fp32(*args)
+        kwargs = dict(zip(kwargs.keys(), to_fp32(*kwargs.values()), strict=True))
+        device_type = next(
+            (t.device.type for t in [*args, *kwargs.values()] if isinstance(t, torch.Tensor)),
+            "cpu",
+        )
+        with fp32_region(device_type):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def autocast_context(dtype: torch.dtype | None, device_type: str = "cpu"):
+    """
+    Autocast context for inference.
+
+    Parameters
+    ----------
+    dtype
+        Lower precision dtype (e.g. `torch.bfloat16`). No autocast is applied if None.
+    device_type
+        Device type of the model.
+    """
+    if dtype is None or dtype == torch.float32:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type=device_type, dtype=dtype)
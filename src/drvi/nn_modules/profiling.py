@@ -0,0 +1,69 @@
+import collections
+import contextlib
+import time
+
+import torch
+
+_stage_timer = None
+
+
+class StageTimer:
+    """
+    Accumulate the wall time of the stages annotated with :func:`record_stage`.
+
+    Parameters
+    ----------
+    synchronize
+        Synchronize CUDA before reading the clock, so that the time of asynchronously launched kernels
+        is attributed to the stage that launched them.
+    """
+
+    def __init__(self, synchronize: bool = False):
+        self.synchronize = synchronize
+        self.seconds = collections.defaultdict(float)
+
+    def now(self) -> float:
+        """Current time in seconds."""
+        if self.synchronize:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def pop(self) -> dict[str, float]:
+        """Return the accumulated seconds per stage and start over."""
+        seconds, self.seconds = dict(self.seconds), collections.defaultdict(float)
+        return seconds
+
+
+def set_stage_timer(timer: StageTimer | None) -> StageTimer | None:
+    """Set the timer accumulating the wall time of stages (None to stop timing). Returns the previous timer."""
+    global _stage_timer
+    previous, _stage_timer = _stage_timer, timer
+    return previous
+
+
+@contextlib.contextmanager
+def record_stage(name: str):
+    """
+    Annotate a stage of the model for :mod:`torch.profiler` traces as `drvi::<name>`.
+
+    The wall time of the stage is also accumulated by the timer set with :func:`set_stage_timer`, if any.
+    Does nothing if neither a timer is set nor a profiler is running.
+    Can be used as a context manager or as a decorator.
+
+    With gradient checkpointing, parts of the decoder are run again during backward. That work is not
+    part of the decoder stages, but it is part of the enclosing backward time, so the recomputed decoder
+    work is counted twice over a training step: once in the forward stages and once in `backward`.
+    """
+    timer = _stage_timer
+    if timer is None and not torch.autograd._profiler_enabled():
+        yield
+        return
+    with torch.profiler.record_function(f"drvi::{name}"):
+        if timer is None:
+            yield
+            return
+        start_time = timer.now()
+        try:
+            yield
+        finally:
+            timer.seconds[name] += timer.now() - start_time
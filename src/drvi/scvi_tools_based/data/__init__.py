@@ -1,3 +1,5 @@
 from . import fields
+from ._data_loader import ChunkAlignedBatchSampler, DRVIAnnDataLoader
+from ._data_splitter import DRVIDataSplitter
 
-__all__ = ["fields"]
+__all__ = ["fields", "ChunkAlignedBatchSampler", "DRVIAnnDataLoader", "DRVIDataSplitter"]
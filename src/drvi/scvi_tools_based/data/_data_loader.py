@@ -0,0 +1,285 @@
+import inspect
+import math
+from typing import NamedTuple
+
+import numpy as np
+import torch
+from scipy import sparse
+from scvi import REGISTRY_KEYS
+from scvi.data import AnnDataManager
+from scvi.dataloaders import AnnDataLoader
+
+
+def is_lazy_anndata(adata_manager: AnnDataManager) -> bool:
+    """Whether the registered data matrix is read from disk (h5ad opened with `backed="r"` or a lazy zarr array)."""
+    if adata_manager.adata.isbacked:
+        return True
+    data = adata_manager.get_from_registry(REGISTRY_KEYS.X_KEY)
+    return not (isinstance(data, np.ndarray | torch.Tensor) or sparse.issparse(data) or hasattr(data, "to_numpy"))
+
+
+def is_csr_anndata(adata_manager: AnnDataManager) -> bool:
+    """Whether the registered data matrix is a CSR matrix, in memory or backed."""
+    data = adata_manager.get_from_registry(REGISTRY_KEYS.X_KEY)
+    return getattr(data, "format", None) == "csr"
+
+
+class CSRBatch(NamedTuple):
+    """Rows of a CSR matrix as plain tensors, which can be sent from worker processes through shared memory."""
+
+    crow_indices: torch.Tensor
+    col_indices: torch.Tensor
+    values: torch.Tensor
+    n_cols: int
+
+
+def _unbatched_collate(batch: dict | list[dict]) -> dict:
+    """Convert a batch given by a batch sampler to tensors.
+
+    scvi passes custom samplers to the torch data loader with a batch size of 1, so batches of
+    a batch sampler arrive as a list of a single batch.
+    """
+    if isinstance(batch, list):
+        (batch,) = batch
+    return torch.utils.data.default_convert(batch)
+
+
+def _csr_collate(batch: dict | list[dict]) -> dict:
+    """Replace sparse CSR tensors of a batch by their index and value tensors.
+
+    Other values are converted to tensors as by the default collate function of unbatched loading.
+    """
+    if isinstance(batch, list):
+        (batch,) = batch
+    return {
+        key: (
+            CSRBatch(value.crow_indices(), value.col_indices(), value.values(), value.shape[1])
+            if isinstance(value, torch.Tensor) and value.layout == torch.sparse_csr
+            else torch.utils.data.default_convert(value)
+        )
+        for key, value in batch.items()
+    }
+
+
+class ChunkAlignedBatchSampler(torch.utils.data.sampler.Sampler):
+    """
+    Batch sampler that yields positions reading a few contiguous blocks of rows.
+
+    Positions are ordered by their row in the underlying matrix and split into blocks of
+    ``batch_size // chunks_per_batch`` rows. Every epoch, the order of blocks is shuffled and
+    ``chunks_per_batch`` consecutive blocks form a mini-batch. Positions within a batch are sorted,
+    so reading a batch from a backed matrix touches ``chunks_per_batch`` contiguous slices.
+
+    Parameters
+    ----------
+    indices
+        Rows of the underlying matrix for each position of the dataset.
+    batch_size
+        Number of positions per batch.
+    shuffle
+        Whether to shuffle the blocks every epoch.
+    drop_last
+        Whether to drop the last incomplete batch.
+    chunks_per_batch
+        Number of contiguous blocks per batch. Larger values give better shuffling at the cost of more reads.
+    seed
+        Seed for shuffling. Epoch `i` uses `seed + i`. Must be the same on all ranks when `num_replicas > 1`.
+    num_replicas
+        Number of distributed processes sharing the data.
+        Every process gets the same number of batches, the last ones wrapping around to the first batches.
+    rank
+        Rank of this process. Batches are assigned to ranks round-robin.
+    """
+
+    def __init__(
+        self,
+        indices: np.ndarray,
+        batch_size: int,
+        shuffle: bool = False,
+        drop_last: bool = False,
+        chunks_per_batch: int = 4,
+        seed: int | None = None,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ):
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"Invalid rank {rank} for {num_replicas} replicas.")
+        self.indices = np.asarray(indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.chunks_per_batch = chunks_per_batch
+        self.chunk_size = max(batch_size // chunks_per_batch, 1)
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+        positions = np.argsort(self.indices, kind="stable")
+        self.chunks = [positions[i : i + self.chunk_size] for i in range(0, len(positions), self.chunk_size)]
+        # a shorter last block stays last, so that it does not shift the blocks of the following batches
+        self.n_full_chunks = len(positions) // self.chunk_size
+
+    @property
+    def n_total_batches(self) -> int:
+        """Number of batches over all ranks."""
+        if self.drop_last:
+            return len(self.indices) // self.batch_size
+        return math.ceil(len(self.indices) / self.batch_size)
+
+    def __len__(self):
+        return math.ceil(self.n_total_batches / self.num_replicas)
+
+    def __iter__(self):
+        rng = np.random.default_rng(None if self.seed is None else self.seed + self.epoch)
+        self.epoch += 1
+        chunk_order = np.arange(len(self.chunks))
+        if self.shuffle:
+            chunk_order[: self.n_full_chunks] = rng.permutation(self.n_full_chunks)
+        positions = np.concatenate([self.chunks[i] for i in chunk_order])
+        n_total_batches = self.n_total_batches
+        for j in range(len(self)):
+            # pad with the first batches so that all ranks run the same number of steps
+            i = (j * self.num_replicas + self.rank) % max(n_total_batches, 1)
+            batch = positions[i * self.batch_size : (i + 1) * self.batch_size]
+            # sorted positions keep reads from the backed matrix in increasing row order
+            yield batch[np.argsort(self.indices[batch], kind="stable")].tolist()
+
+
+class DRVIAnnDataLoader(AnnDataLoader):
+    """
+    AnnDataLoader that uses chunk-aligned batches for backed AnnData objects.
+
+    For in-memory AnnData objects this behaves as :class:`scvi.dataloaders.AnnDataLoader`.
+
+    Parameters
+    ----------
+    adata_manager
+        AnnDataManager object that has been created via ``setup_anndata``.
+    indices
+        The indices of the observations in the adata to load.
+    batch_size
+        Minibatch size to load each iteration.
+    shuffle
+        Whether the data should be shuffled.
+    sampler
+        Custom batch sampler. Overrides the chunk-aligned sampler.
+    drop_last
+        If `True` and the dataset is not evenly divisible by `batch_size`, the last
+        incomplete batch is dropped.
+    chunks_per_batch
+        Number of contiguous blocks per batch for backed data. See :class:`ChunkAlignedBatchSampler`.
+    seed
+        Seed for shuffling backed data.
+    csr_collate
+        For CSR data, only slice `indptr/indices/data` in the dataset (and worker processes when `num_workers > 0`)
+        and scatter them into reusable dense buffers in the main process. Buffers are pinned if `pin_memory` is set.
+        With the default fork start method, worker processes share the CSR arrays with the main process.
+    n_buffers
+        Number of dense buffers recycled in a ring for `csr_collate`. A batch stays valid until `n_buffers`
+        more batches are produced.
+    num_replicas
+        Number of distributed processes. When larger than 1, batches are sharded between ranks with
+        :class:`ChunkAlignedBatchSampler` (one row per block for in-memory data) and the seed defaults to 0,
+        so that all ranks agree on the order of batches.
+    rank
+        Rank of this process.
+    **kwargs
+        Additional keyword arguments passed into :class:`scvi.dataloaders.AnnDataLoader`.
+    """
+
+    def __init__(
+        self,
+        adata_manager: AnnDataManager,
+        indices: np.ndarray | None = None,
+        batch_size: int = 128,
+        shuffle: bool = False,
+        sampler: torch.utils.data.sampler.Sampler | None = None,
+        drop_last: bool = False,
+        chunks_per_batch: int = 4,
+        seed: int | None = None,
+        csr_collate: bool = True,
+        n_buffers: int = 4,
+        num_replicas: int = 1,
+        rank: int = 0,
+        **kwargs,
+    ):
+        if indices is None:
+            indices = np.arange(adata_manager.adata.shape[0])
+        elif hasattr(indices, "dtype") and indices.dtype is np.dtype("bool"):
+            indices = np.where(indices)[0].ravel()
+        indices = np.asarray(indices)
+
+        distributed = num_replicas > 1
+        if distributed:
+            # ranks are assigned their batches by the sampler below
+            kwargs.pop("distributed_sampler", None)
+        lazy = is_lazy_anndata(adata_manager)
+        if sampler is None and (distributed or (lazy and not kwargs.get("distributed_sampler", False))):
+            sampler = ChunkAlignedBatchSampler(
+                indices,
+                batch_size=batch_size,
+                shuffle=shuffle,
+                drop_last=drop_last,
+                chunks_per_batch=chunks_per_batch if lazy else batch_size,
+                seed=0 if distributed and seed is None else seed,
+                num_replicas=num_replicas,
+                rank=rank,
+            )
+            shuffle = False
+        if sampler is not None:
+            kwargs.setdefault("collate_fn", _unbatched_collate)
+
+        # scvi's DataSplitter passes load_sparse_tensor=False by default, which we can override
+        # since batches are densified again before they are returned
+        self.use_csr_collate = (
+            csr_collate
+            and not kwargs.get("load_sparse_tensor", False)
+            and "load_sparse_tensor" in inspect.signature(AnnDataLoader.__init__).parameters
+            and is_csr_anndata(adata_manager)
+        )
+        if self.use_csr_collate:
+            kwargs["load_sparse_tensor"] = True
+        super().__init__(
+            adata_manager,
+            indices=indices,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            sampler=sampler,
+            drop_last=drop_last,
+            **kwargs,
+        )
+        if self.use_csr_collate:
+            self.collate_fn = _csr_collate
+        self.n_buffers = n_buffers
+        self._buffers = {}
+        self._buffer_position = 0
+
+    def _get_buffer(self, shape, dtype):
+        """Return the next dense buffer of the ring."""
+        position = self._buffer_position % self.n_buffers
+        self._buffer_position += 1
+        buffer = self._buffers.get(position)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            pin_memory = self.pin_memory and torch.cuda.is_available()
+            buffer = torch.empty(shape, dtype=dtype, pin_memory=pin_memory)
+            self._buffers[position] = buffer
+        return buffer
+
+    def _densify(self, csr: CSRBatch) -> torch.Tensor:
+        n_rows = len(csr.crow_indices) - 1
+        shape = (n_rows, csr.n_cols)
+        output = self._get_buffer(shape, csr.values.dtype) if self.n_buffers > 0 else None
+        if output is None:
+            output = torch.empty(shape, dtype=csr.values.dtype)
+        output.zero_()
+        rows = torch.repeat_interleave(torch.arange(n_rows), csr.crow_indices.diff())
+        output.view(-1).index_copy_(0, rows * csr.n_cols + csr.col_indices, csr.values)
+        return output
+
+    def __iter__(self):
+        if not self.use_csr_collate:
+            yield from super().__iter__()
+            return
+        for batch in super().__iter__():
+            yield {key: self._densify(value) if isinstance(value, CSRBatch) else value for key, value in batch.items()}
@@ -0,0 +1,26 @@
+from scvi.dataloaders import DataSplitter
+
+from drvi.scvi_tools_based.data._data_loader import DRVIAnnDataLoader
+from drvi.scvi_tools_based.train._distributed import get_rank_and_world_size
+
+
+class DRVIDataSplitter(DataSplitter):
+    """DataSplitter that creates :class:`DRVIAnnDataLoader` data loaders.
+
+    Keyword arguments such as ``chunks_per_batch`` and ``seed`` are passed to the data loaders.
+    Under distributed training, every rank loads its own shard of each split.
+    """
+
+    data_loader_cls = DRVIAnnDataLoader
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the split is deterministic, and forked distributed training only sets up the data splitter
+        # of the worker processes, while the model reads the indices from the main process
+        self.setup()
+
+    def setup(self, stage: str | None = None):
+        super().setup(stage)
+        rank, world_size = get_rank_and_world_size()
+        if world_size > 1:
+            self.data_loader_kwargs.update({"num_replicas": world_size, "rank": rank})
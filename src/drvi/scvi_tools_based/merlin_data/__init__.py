@@ -3,17 +3,37 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-if importlib.util.find_spec("merlin"):
+if importlib.util.find_spec("pyarrow"):
     from . import fields
+    from ._benchmark import batch_covariate_entropy, benchmark_shuffle_settings
+    from ._converter import anndata_to_parquet
+    from ._data_manager import MerlinDataManager
+    from ._metadata_cache import clear_metadata_cache
+    from ._parquet_data import ParquetData
+    from ._parquet_data_loader import ParquetDataLoader, ParquetDataset
+    from ._parquet_data_splitter import ParquetDataSplitter
+    from ._sparse import SparseColumnPair
+else:
+    fields = None
+    anndata_to_parquet = None
+    batch_covariate_entropy = None
+    benchmark_shuffle_settings = None
+    MerlinDataManager = None
+    clear_metadata_cache = None
+    ParquetData = None
+    ParquetDataLoader = None
+    ParquetDataset = None
+    ParquetDataSplitter = None
+    SparseColumnPair = None
+    logger.warning("Pyarrow is not installed. To use parquet dataloader please install it.")
+
+if importlib.util.find_spec("merlin"):
     from ._data import MerlinData
     from ._data_loader import MerlinTransformedDataLoader
-    from ._data_manager import MerlinDataManager
     from ._data_splitter import MerlinDataSplitter
 else:
-    fields = None
     MerlinData = None
     MerlinTransformedDataLoader = None
-    MerlinDataManager = None
     MerlinDataSplitter = None
     logger.warning("Merlin is not installed. To use merline dataloader please install it.")
 
@@ -22,5 +42,14 @@ __all__ = [
     "MerlinTransformedDataLoader",
     "MerlinDataManager",
     "MerlinDataSplitter",
+    "ParquetData",
+    "ParquetDataLoader",
+    "ParquetDataset",
+    "ParquetDataSplitter",
+    "SparseColumnPair",
+    "anndata_to_parquet",
+    "batch_covariate_entropy",
+    "clear_metadata_cache",
+    "benchmark_shuffle_settings",
     "fields",
 ]
@@ -0,0 +1,99 @@
+import time
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+from scvi import REGISTRY_KEYS
+
+
+def batch_covariate_entropy(labels_per_batch: Sequence[np.ndarray]) -> float:
+    """
+    Shuffle quality as the mean entropy of a covariate within mini-batches relative to its overall entropy.
+
+    A value close to 1 means mini-batches are as mixed as the whole data, 0 means each
+    mini-batch contains a single category.
+
+    Parameters
+    ----------
+    labels_per_batch
+        Integer covariate codes of the cells in each mini-batch.
+
+    Returns
+    -------
+    float
+        Normalized mean within-batch entropy.
+    """
+
+    def entropy(labels):
+        p = np.bincount(labels) / len(labels)
+        p = p[p > 0]
+        return -np.sum(p * np.log(p))
+
+    labels_per_batch = [np.asarray(labels).astype(np.int64).reshape(-1) for labels in labels_per_batch]
+    total_entropy = entropy(np.concatenate(labels_per_batch))
+    if total_entropy == 0:
+        return 1.0
+    return float(np.mean([entropy(labels) for labels in labels_per_batch]) / total_entropy)
+
+
+def benchmark_shuffle_settings(
+    model,
+    settings: Sequence[dict],
+    covariate_key: str = REGISTRY_KEYS.CAT_COVS_KEY,
+    covariate_index: int = 0,
+    batch_size: int = 128,
+    max_batches: int | None = None,
+) -> pd.DataFrame:
+    """
+    Measure throughput and shuffle quality of the train data loader for several shuffle settings.
+
+    Parameters
+    ----------
+    model
+        DRVI model set up with MerlinData or ParquetData.
+    settings
+        Keyword arguments passed to the data splitter for each run,
+        e.g. ``[{"shuffle_buffer_size": 10_000}, {"parts_per_chunk": 32, "seed": 0}]``.
+    covariate_key
+        Registry key of the covariate used for the shuffle quality metric.
+    covariate_index
+        Column of the covariate if the registry key holds several covariates.
+    batch_size
+        Mini-batch size.
+    max_batches
+        Maximum number of mini-batches loaded per run. All batches of an epoch are loaded if None.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per setting with the number of parts per chunk, cells per second, the mean time in milliseconds
+        the consumer waited for a batch of the loader and batch covariate entropy.
+    """
+    results = []
+    for setting in settings:
+        data_splitter = model._data_splitter_cls(model.adata_manager, batch_size=batch_size, **setting)
+        data_loader = data_splitter.train_dataloader()
+
+        labels_per_batch = []
+        n_cells = 0
+        start_time = time.perf_counter()
+        for i, batch in enumerate(data_loader):
+            if max_batches is not None and i >= max_batches:
+                break
+            labels = batch[covariate_key]
+            if labels.ndim > 1:
+                labels = labels[:, covariate_index]
+            labels_per_batch.append(labels.numpy(force=True))
+            n_cells += len(labels)
+        elapsed = time.perf_counter() - start_time
+
+        results.append(
+            {
+                **{key: str(value) for key, value in setting.items()},
+                "parts_per_chunk": data_loader.parts_per_chunk,
+                "cells_per_sec": n_cells / elapsed,
+                "mean_stall_ms": data_loader.mean_stall_time * 1000,
+                "batch_covariate_entropy": batch_covariate_entropy(labels_per_batch),
+            }
+        )
+    return pd.DataFrame(results)
@@ -0,0 +1,231 @@
+import logging
+import math
+import multiprocessing
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse
+
+from drvi.scvi_tools_based.merlin_data._sparse import SparseColumnPair
+
+logger = logging.getLogger(__name__)
+
+# AnnData read by the worker processes, either inherited through fork or opened from disk once per process
+_SOURCE = {"path": None, "adata": None}
+
+
+def _get_source_adata(source_path: str | None) -> ad.AnnData:
+    if source_path is not None and _SOURCE["path"] != source_path:
+        _SOURCE["adata"] = ad.read_h5ad(source_path, backed="r")
+        _SOURCE["path"] = source_path
+    return _SOURCE["adata"]
+
+
+def _read_rows(adata: ad.AnnData, layer: str | None, rows: np.ndarray, as_sparse: bool = False):
+    """Read sorted rows of a (backed) AnnData object as a dense float32 array or a CSR matrix."""
+    matrix = adata.X if layer is None else adata.layers[layer]
+    data = matrix[rows]
+    if as_sparse:
+        return sparse.csr_matrix(data, dtype=np.float32)
+    if sparse.issparse(data):
+        data = data.toarray()
+    return np.asarray(data, dtype=np.float32)
+
+
+def _dense_to_list_array(data: np.ndarray) -> pa.ListArray:
+    """Wrap a dense 2D array as a list array without copying the values."""
+    n_rows, n_cols = data.shape
+    assert n_rows * n_cols < 2**31, "Row groups are too large for a list column. Reduce row_group_size."
+    offsets = pa.array(np.arange(0, (n_rows + 1) * n_cols, n_cols, dtype=np.int32))
+    return pa.ListArray.from_arrays(offsets, pa.array(data.reshape(-1)))
+
+
+def _csr_to_list_arrays(data: sparse.csr_matrix) -> tuple[pa.ListArray, pa.ListArray]:
+    """Indices and values list arrays of the rows of a CSR matrix."""
+    data.sort_indices()
+    offsets = pa.array(data.indptr.astype(np.int32))
+    indices = pa.ListArray.from_arrays(offsets, pa.array(data.indices.astype(np.int32)))
+    values = pa.ListArray.from_arrays(offsets, pa.array(data.data.astype(np.float32)))
+    return indices, values
+
+
+def _write_part(
+    source_path: str | None,
+    layer: str | None,
+    layer_key: str,
+    row_groups: list[np.ndarray],
+    obs_columns: dict[str, np.ndarray],
+    output_file: str,
+    compression: str,
+    as_sparse: bool = False,
+) -> int:
+    """Write one parquet part. Every entry of `row_groups` holds the AnnData rows of one row group."""
+    adata = _get_source_adata(source_path)
+    writer = None
+    start = 0
+    try:
+        for rows in row_groups:
+            # read in increasing row order and write in the (random) order of the row group
+            order = np.argsort(rows, kind="stable")
+            if as_sparse:
+                data = _read_rows(adata, layer, rows[order], as_sparse=True)[np.argsort(order)]
+                pair = SparseColumnPair(layer_key, adata.n_vars)
+                layer_columns = dict(zip(pair.columns, _csr_to_list_arrays(data), strict=True))
+            else:
+                data = np.empty((len(rows), adata.n_vars), dtype=np.float32)
+                data[order] = _read_rows(adata, layer, rows[order])
+                layer_columns = {layer_key: _dense_to_list_array(data)}
+            table = pa.table(
+                {
+                    **layer_columns,
+                    **{key: values[start : start + len(rows)] for key, values in obs_columns.items()},
+                }
+            )
+            start += len(rows)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, table.schema, compression=compression)
+            writer.write_table(table, row_group_size=len(rows))
+    finally:
+        if writer is not None:
+            writer.close()
+    return start
+
+
+def _encode_obs(obs: pd.DataFrame, obs_keys: Sequence[str]) -> tuple[dict[str, np.ndarray], dict[str, pd.Index]]:
+    """Encode categorical and string columns as integer codes."""
+    columns, categories = {}, {}
+    for key in obs_keys:
+        values = obs[key]
+        if isinstance(values.dtype, pd.CategoricalDtype) or values.dtype == object:
+            values = values.astype("category")
+            columns[key] = values.cat.codes.to_numpy().astype(np.int64)
+            categories[key] = values.cat.categories
+        else:
+            columns[key] = values.to_numpy()
+    return columns, categories
+
+
+def anndata_to_parquet(
+    adata: ad.AnnData | str,
+    output_path: str,
+    layer: str | None = None,
+    obs_keys: Sequence[str] = (),
+    split_key: str | None = None,
+    split_fractions: Sequence[float] = (0.9, 0.05, 0.05),
+    part_size: int = 100_000,
+    row_group_size: int = 10_000,
+    compression: str = "zstd",
+    layer_key: str = "X",
+    n_workers: int = 1,
+    seed: int = 0,
+    sparse_layer: bool = False,
+) -> str:
+    """
+    Convert an AnnData object to the sharded parquet layout read by :class:`ParquetData` and :class:`MerlinData`.
+
+    The expression matrix is streamed one row group at a time, so the full matrix is never loaded.
+    Cells are shuffled before they are distributed over balanced parts and row groups.
+
+    Parameters
+    ----------
+    adata
+        AnnData object or path to an h5ad file, which is opened in backed mode.
+    output_path
+        Directory to write to. Split directories must not exist yet.
+    layer
+        Layer of the expression matrix. `X` is used if None.
+    obs_keys
+        Columns of `.obs` to write. Categorical and string columns are stored as integer codes with
+        a lookup table in `categorical_lookup/`.
+    split_key
+        Column of `.obs` with values 'train', 'val' and 'test'. If None, cells are split at random.
+    split_fractions
+        Fractions of train, validation and test cells for the random split.
+    part_size
+        Approximate number of cells per parquet file.
+    row_group_size
+        Number of cells per row group, which is also the number of cells read at once.
+    compression
+        Parquet compression codec.
+    layer_key
+        Name of the expression column.
+    n_workers
+        Number of processes writing parts in parallel.
+    seed
+        Seed for the split and shuffling.
+    sparse_layer
+        Store the expression matrix as list columns `{layer_key}__indices` and `{layer_key}__values`
+        of the non-zero entries of each cell instead of one dense list column.
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    source_path = None
+    if isinstance(adata, str):
+        source_path = adata
+        adata = ad.read_h5ad(source_path, backed="r")
+    elif adata.isbacked:
+        source_path = str(adata.filename)
+
+    rng = np.random.default_rng(seed)
+    if split_key is not None:
+        split = adata.obs[split_key].astype(str).to_numpy()
+    else:
+        split_fractions = np.asarray(split_fractions, dtype=float)
+        split = rng.choice(["train", "val", "test"], size=adata.n_obs, p=split_fractions / split_fractions.sum())
+
+    os.makedirs(output_path, exist_ok=True)
+    obs_columns, categories = _encode_obs(adata.obs, obs_keys)
+    if len(categories) > 0:
+        os.makedirs(os.path.join(output_path, "categorical_lookup"), exist_ok=True)
+    for key, values in categories.items():
+        lookup_path = os.path.join(output_path, "categorical_lookup", f"{key}.parquet")
+        pd.DataFrame({key: values.astype(str)}).to_parquet(lookup_path)
+    adata.var.reset_index().to_parquet(os.path.join(output_path, "var.parquet"))
+
+    tasks = []
+    for split_name in ["train", "val", "test"]:
+        cells = rng.permutation(np.flatnonzero(split == split_name))
+        if len(cells) == 0:
+            continue
+        os.makedirs(os.path.join(output_path, split_name))
+        for part, part_cells in enumerate(np.array_split(cells, math.ceil(len(cells) / part_size))):
+            row_groups = np.array_split(part_cells, math.ceil(len(part_cells) / row_group_size))
+            tasks.append(
+                (
+                    source_path,
+                    layer,
+                    layer_key,
+                    row_groups,
+                    {key: values[part_cells] for key, values in obs_columns.items()},
+                    os.path.join(output_path, split_name, f"part.{part}.parquet"),
+                    compression,
+                    sparse_layer,
+                )
+            )
+
+    if n_workers > 1:
+        # in-memory AnnData objects are shared with the workers through fork, backed ones are opened by each worker
+        _SOURCE["path"], _SOURCE["adata"] = None, (adata if source_path is None else None)
+        try:
+            with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context("fork")) as executor:
+                futures = [executor.submit(_write_part, *task) for task in tasks]
+                n_written = sum(future.result() for future in futures)
+        finally:
+            _SOURCE["path"], _SOURCE["adata"] = None, None
+    else:
+        _SOURCE["path"], _SOURCE["adata"] = source_path, adata
+        try:
+            n_written = sum(_write_part(*task) for task in tasks)
+        finally:
+            _SOURCE["path"], _SOURCE["adata"] = None, None
+    logger.info(f"Wrote {n_written} cells in {len(tasks)} parts to {output_path}")
+    return output_path
@@ -1,17 +1,13 @@
-import math
 import os
 from typing import Literal
-from uuid import uuid4
 
 import merlin.io
-import pandas as pd
-import pyarrow.parquet as pq
-from scvi.data import _constants
 
-from drvi.scvi_tools_based.merlin_data._utils import read_first_row, transfer_type_from_pyarrow
+from drvi.scvi_tools_based.merlin_data._parquet_data import ParquetData
+from drvi.scvi_tools_based.merlin_data._utils import transfer_type_from_pyarrow
 
 
-class MerlinData:
+class MerlinData(ParquetData):
     """
     Wrapper for merlin data object.
 
@@ -30,11 +26,26 @@ class MerlinData:
     layer_key : str, optional
         Key for layer data. Default is None, which will be replaced with 'X'.
     sub_sample_frac : float
-        The fraction of data to subsample. Default is 1.0.
+        The fraction of data to subsample by keeping a random subset of the parquet files. Default is 1.0.
+        Use :class:`ParquetData` for row group and (stratified) row level sub-sampling.
+    sub_sample_seed : int
+        Seed for the choice of parquet files to keep. Default is 0.
     var_names_col_num : int
         The column number of the variable names in the var.parquet file. Default is 0.
+    metadata_manifest : bool or str
+        Persist metadata in a JSON manifest. See :class:`ParquetData`.
+    part_size : str or dict, optional
+        Size of the partitions merlin reads at once (e.g. '100MB'), either for all splits or per split.
+        Partitions are the unit of shuffling, so smaller partitions give better shuffling at the cost of
+        read throughput. Default is '100MB' for train and val and '300MB' for test.
     """
 
+    default_part_size = {
+        "train": "100MB",
+        "val": "100MB",
+        "test": "300MB",
+    }
+
     def __init__(
         self,
         data_path: str,
@@ -44,30 +55,31 @@ class MerlinData:
         default_track: Literal["train", "val", "test"] = "train",
         layer_key: str | None = None,
         sub_sample_frac: float = 1.0,
+        sub_sample_seed: int = 0,
         var_names_col_num=0,
+        metadata_manifest: bool | str = False,
+        part_size: str | dict[str, str] | None = None,
     ) -> None:
-        self.data_path = data_path
-        self.train_key = train_key
-        self.validation_key = validation_key
-        self.test_key = test_key
-        self.default_track = self.set_default_track(default_track)
-        self.layer_key = "X" if layer_key is None else layer_key
-        self.sub_sample_frac = sub_sample_frac
-
-        self.var_names_col_num = var_names_col_num
-
-        self.uns = {}
-        self.schema, self.first_row = self.resolve_schema()
-
-        assert self.schema.get(self.layer_key) is not None
-
-    def get_default_track(self):
-        return self.default_track
-
-    def set_default_track(self, track):
-        assert track in ["train", "val", "test"]
-        self.default_track = track
-        return track
+        if part_size is None:
+            part_size = self.default_part_size
+        elif isinstance(part_size, str):
+            part_size = dict.fromkeys(self.default_part_size, part_size)
+        else:
+            part_size = {**self.default_part_size, **part_size}
+        self.part_size = part_size
+        super().__init__(
+            data_path,
+            train_key=train_key,
+            validation_key=validation_key,
+            test_key=test_key,
+            default_track=default_track,
+            layer_key=layer_key,
+            sub_sample_frac=sub_sample_frac,
+            var_names_col_num=var_names_col_num,
+            sub_sample_mode="files",
+            sub_sample_seed=sub_sample_seed,
+            metadata_manifest=metadata_manifest,
+        )
 
     def resolve_schema(self):
         """
@@ -80,9 +92,7 @@ class MerlinData:
         first_row : dict
             The first row of the merlin data.
         """
-        single_parquet_filename = os.path.join(self.data_path, self.train_key, "part.0.parquet")
-        first_row = read_first_row(single_parquet_filename)
-        parquet_schema = pq.read_schema(single_parquet_filename)
+        parquet_schema, first_row = super().resolve_schema()
         merlin_schema = transfer_type_from_pyarrow(parquet_schema, first_row=first_row)
         return merlin_schema, first_row
 
@@ -102,27 +112,6 @@ class MerlinData:
         """
         return self.schema.get(key) is not None
 
-    def get_categorical_mapping(self, key):
-        """
-        Get the categorical mapping for a specific column.
-
-        Parameters
-        ----------
-        key : str
-            The column key to get the mapping for.
-
-        Returns
-        -------
-        dict
-            The categorical mapping for the column.
-        """
-        lookup_table = pd.read_parquet(os.path.join(self.data_path, "categorical_lookup", f"{key}.parquet"))
-        lookup_table.columns = ["col_value"]
-        mapping = lookup_table.to_dict()["col_value"]
-        # correct mapping (int key to str) for compatbility with anndata summarization (attrdict)
-        mapping = {str(k): v for k, v in mapping.items()}
-        return mapping
-
     @property
     def n_vars(self):
         """
@@ -133,54 +122,15 @@ class MerlinData:
         int
             The number of variables.
         """
+        if self.is_sparse_layer(self.layer_key):
+            return len(self.var)
         return self.schema.get(self.layer_key).value_count.max
 
-    @property
-    def var(self):
-        """
-        Get the variable metadata in the merlin data.
-
-        Returns
-        -------
-        pd.DataFrame
-            The variable metadata.
-        """
-        return pd.read_parquet(os.path.join(self.data_path, "var.parquet"))
-
-    @property
-    def var_names(self):
-        """
-        Get the variable names in the merlin data.
-
-        Returns
-        -------
-        List[str]
-            The variable names.
-        """
-        return self.var.iloc[:, self.var_names_col_num]
-
-    @property
-    def is_view(self):
-        """For compatibility with anndata"""
-        return False
-
-    def _set_uuid(self, overwrite: bool = False):
-        """
-        Set the UUID for the merlin data.
-
-        Parameters
-        ----------
-        overwrite : bool, optional
-            Whether to overwrite the existing UUID. Default is False.
-        """
-        if _constants._SCVI_UUID_KEY not in self.uns or overwrite:
-            self.uns[_constants._SCVI_UUID_KEY] = str(uuid4())
-
     def __repr__(self) -> str:
         return f"MerlinData object with schema: {self.schema.to_pandas()}"
 
-    @staticmethod
-    def _get_data_files(base_path: str, ds_key_disk: str, sub_sample_frac: float = 1.0):
+    @classmethod
+    def _get_data_files(cls, base_path: str, ds_key_disk: str, sub_sample_frac: float = 1.0, seed: int = 0):
         """
         Get the data files for a specific key.
 
@@ -192,6 +142,8 @@ class MerlinData:
             The key on disk to get the data files for.
         sub_sample_frac : float, optional
             The fraction of data to subsample. Default is 1.0.
+        seed : int, optional
+            Seed for the choice of files when subsampling. Default is 0.
 
         Returns
         -------
@@ -202,11 +154,7 @@ class MerlinData:
             # if no subsampling -> just return base path and merlin takes care of the rest
             return os.path.join(base_path, ds_key_disk)
         else:
-            files = [file for file in os.listdir(os.path.join(base_path, ds_key_disk)) if file.endswith(".parquet")]
-            files = [
-                os.path.join(base_path, ds_key_disk, file) for file in sorted(files, key=lambda x: int(x.split(".")[1]))
-            ]
-            return files[: math.ceil(sub_sample_frac * len(files))]
+            return cls._list_data_files(base_path, ds_key_disk, sub_sample_frac=sub_sample_frac, seed=seed)
 
     def get_dataset(self, split, columns, **dataset_kwargs):
         """
@@ -228,19 +176,12 @@ class MerlinData:
         """
         if split == "default":
             split = self.default_track
-        sub_sample_frac = self.sub_sample_frac
-        part_size = {
-            "train": "100MB",
-            "val": "100MB",
-            "test": "300MB",
-        }[split]
-        ds_key_disk = {
-            "train": self.train_key,
-            "val": self.validation_key,
-            "test": self.test_key,
-        }[split]
+        part_size = self.part_size[split]
+        ds_key_disk = self._get_split_key(split)
         return merlin.io.Dataset(
-            self._get_data_files(self.data_path, ds_key_disk=ds_key_disk, sub_sample_frac=sub_sample_frac),
+            self._get_data_files(
+                self.data_path, ds_key_disk=ds_key_disk, sub_sample_frac=self.sub_sample_frac, seed=self.sub_sample_seed
+            ),
             engine="parquet",
             part_size=part_size,
             schema=self.schema.select_by_name(columns),
@@ -1,8 +1,12 @@
 import gc
+import itertools
+import time
 
 import torch
 from merlin.dataloader.torch import Loader
 
+from drvi.scvi_tools_based.merlin_data._sparse import SparseColumnPair, decode_sparse_batch
+
 
 class MerlinTransformedDataLoader(Loader):
     """
@@ -11,29 +15,94 @@ class MerlinTransformedDataLoader(Loader):
     Parameters
     ----------
     mapping : list of tuple specifying (target_col, source_col)
+    n_buffers : int
+        Number of preallocated output tensors per target column that are recycled in a ring. This covers
+        joint (stacked) columns and dense layers decoded from sparse column pairs; single dense columns
+        are passed through from merlin as is. Batches stay valid until `n_buffers` more batches are produced.
+        Set to 0 to allocate new tensors for every batch.
+    gc_every_n_iter : int or None
+        Run a full garbage collection every `gc_every_n_iter` batches. Disabled if None (default),
+        since output buffers are recycled and the full-heap pauses are not worth it.
+    seed : int, optional
+        Seed for shuffling. Epoch `i` uses `seed + i`. Ignored if `seed_fn` is given.
+    sparse_output : bool
+        Return layers stored as sparse column pairs as sparse CSR tensors instead of dense tensors.
     """
 
-    def __init__(self, *args, mapping=None, gc_every_n_iter=100, **kwargs):
+    def __init__(
+        self, *args, mapping=None, n_buffers=4, gc_every_n_iter=None, seed=None, sparse_output=False, **kwargs
+    ):
+        if seed is not None and kwargs.get("seed_fn") is None:
+            kwargs["seed_fn"] = itertools.count(seed).__next__
         super().__init__(*args, **kwargs)
         self.mapping = mapping
+        self.sparse_output = sparse_output
+        self.n_buffers = n_buffers
         self.gc_every_n_iter = gc_every_n_iter
         self.iters_to_gc = gc_every_n_iter
+        self._buffers = {}
+        self._buffer_position = 0
+        self.stall_time = 0.0
+        self.n_batches_loaded = 0
+
+    def __next__(self):
+        start_time = time.perf_counter()
+        with torch.profiler.record_function("drvi::merlin_next_batch"):
+            batch = super().__next__()
+        self.stall_time += time.perf_counter() - start_time
+        self.n_batches_loaded += 1
+        return batch
+
+    @property
+    def mean_stall_time(self):
+        """Average time in seconds the consumer waited for a batch."""
+        return self.stall_time / max(self.n_batches_loaded, 1)
+
+    def _get_buffer(self, key, shape, dtype, device):
+        """Return the next buffer of the ring for the given target column."""
+        position = self._buffer_position % self.n_buffers
+        buffer = self._buffers.get((key, position))
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype or buffer.device != device:
+            buffer = torch.empty(shape, dtype=dtype, device=device)
+            self._buffers[(key, position)] = buffer
+        return buffer
+
+    def _convert_column(self, new_col, tensors):
+        # Single columns are passed through as is, so only joint columns need an output tensor
+        if len(tensors) == 1:
+            return tensors[0]
+        if self.n_buffers == 0:
+            return torch.stack(tensors, dim=1)
+        shape = (tensors[0].shape[0], len(tensors), *tensors[0].shape[1:])
+        buffer = self._get_buffer(new_col, shape, tensors[0].dtype, tensors[0].device)
+        return torch.stack(tensors, dim=1, out=buffer)
+
+    def _convert_sparse_column(self, new_col, pair, batch):
+        if self.sparse_output or self.n_buffers == 0:
+            return decode_sparse_batch(batch, pair, sparse_output=self.sparse_output)
+        values = batch[f"{pair.values}__values"]
+        shape = (batch[f"{pair.indices}__offsets"].shape[0] - 1, pair.n_vars)
+        buffer = self._get_buffer(new_col, shape, values.dtype, values.device)
+        return decode_sparse_batch(batch, pair, out=buffer)
 
     def convert_batch(self, batch):
-        batch = super().convert_batch(batch)
-        batch, _ = batch
-        self.iters_to_gc -= 1
-        if self.iters_to_gc < 1:
-            self.iters_to_gc = self.gc_every_n_iter
-            gc.collect()
-        if self.mapping is None:
-            return batch
-        result = {}
-        for new_col, col in self.mapping:
-            if isinstance(col, list):
-                result[new_col] = torch.stack([batch[c] for c in col], dim=1)
-                for c in col:
-                    del batch[c]
-            else:
-                result[new_col] = batch[col]
-        return result
+        with torch.profiler.record_function("drvi::merlin_convert_batch"):
+            batch = super().convert_batch(batch)
+            batch, _ = batch
+            if self.gc_every_n_iter is not None:
+                self.iters_to_gc -= 1
+                if self.iters_to_gc < 1:
+                    self.iters_to_gc = self.gc_every_n_iter
+                    gc.collect()
+            if self.mapping is None:
+                return batch
+            result = {}
+            for new_col, col in self.mapping:
+                if isinstance(col, SparseColumnPair):
+                    result[new_col] = self._convert_sparse_column(new_col, col, batch)
+                    continue
+                cols = col if isinstance(col, list) else [col]
+                # source columns may be mapped to more than one target, so they are not removed from the batch
+                result[new_col] = self._convert_column(new_col, [batch[c] for c in cols])
+            self._buffer_position += 1
+            return result
@@ -5,7 +5,8 @@ import scvi
 from scvi._types import AnnOrMuData
 from scvi.data import AnnDataManager, AnnDataManagerValidationCheck, _constants
 
-from drvi.scvi_tools_based.merlin_data._data import MerlinData
+from drvi.scvi_tools_based.merlin_data._parquet_data import ParquetData
+from drvi.scvi_tools_based.merlin_data._sparse import SparseColumnPair
 from drvi.scvi_tools_based.merlin_data.fields import (
     MerlinCategoricalJointObsField,
     MerlinCategoricalObsField,
@@ -17,7 +18,7 @@ from drvi.scvi_tools_based.merlin_data.fields import (
 
 class MerlinDataManager(AnnDataManager):
     """
-    Provides an interface to validate and process a MerlinData object for use in scvi-tools.
+    Provides an interface to validate and process a MerlinData or ParquetData object for use in scvi-tools.
 
     Parameters
     ----------
@@ -49,9 +50,9 @@ class MerlinDataManager(AnnDataManager):
         if setup_method_args is not None:
             self._registry.update(setup_method_args)
 
-    def _validate_anndata_object(self, adata: AnnOrMuData | MerlinData):
+    def _validate_anndata_object(self, adata: AnnOrMuData | ParquetData):
         """For a given AnnData object, runs general scvi-tools compatibility checks."""
-        if isinstance(adata, MerlinData):
+        if isinstance(adata, ParquetData):
             return True
         return super()._validate_anndata_object(adata)
 
@@ -60,7 +61,10 @@ class MerlinDataManager(AnnDataManager):
         for field in self.fields:
             if isinstance(field, MerlinLayerField):
                 assert field.attr_name == _constants._ADATA_ATTRS.LAYERS
-                mapping.append((field.registry_key, field.attr_key))
+                if self.adata.is_sparse_layer(field.attr_key):
+                    mapping.append((field.registry_key, SparseColumnPair(field.attr_key, self.adata.n_vars)))
+                else:
+                    mapping.append((field.registry_key, field.attr_key))
             elif isinstance(field, MerlinCategoricalObsField):
                 if field.is_default:
                     continue
@@ -94,7 +98,9 @@ class MerlinDataManager(AnnDataManager):
         merlin_data = self.adata
         columns = []
         for _, col in self.get_fields_schema_mapping():
-            if isinstance(col, list):
+            if isinstance(col, SparseColumnPair):
+                columns.extend(col.columns)
+            elif isinstance(col, list):
                 columns.extend(col)
             else:
                 columns.append(col)
@@ -1,10 +1,13 @@
-import lightning.pytorch as pl
+import math
+
+import merlin.io
+import numpy as np
 
 from drvi.scvi_tools_based.merlin_data._data_loader import MerlinTransformedDataLoader
-from drvi.scvi_tools_based.merlin_data._data_manager import MerlinDataManager
+from drvi.scvi_tools_based.merlin_data._parquet_data_splitter import ParquetDataSplitter
 
 
-class MerlinDataSplitter(pl.LightningDataModule):
+class MerlinDataSplitter(ParquetDataSplitter):
     """Creates data loaders for MerlinData object given the MerlinDataManager.
 
     Parameters
@@ -15,46 +18,14 @@ class MerlinDataSplitter(pl.LightningDataModule):
 
     data_loader_cls = MerlinTransformedDataLoader
 
-    def __init__(
-        self,
-        adata_manager: MerlinDataManager,
-        **kwargs,
-    ):
-        super().__init__()
-        self.adata_manager = adata_manager
-        # We some usual inputs
-        for key in ["train_size", "validation_size", "shuffle_set_split", "pin_memory"]:
-            # print("Discarding key:", key)
-            kwargs.pop(key, None)
-        self.kwargs = kwargs
-
-    def setup(self, stage: str | None = None):
-        self.val_idx = None
-        self.train_idx = None
-        self.test_idx = None
-
-    def _get_dataloader(self, split, shuffle=False, **kwargs):
-        parts_per_chunk = {
-            "train": 8,
-            "val": 1,
-            "test": 1,
-        }[split]
-        return self.data_loader_cls(
-            self.adata_manager.get_dataset(split),
-            mapping=self.adata_manager.get_fields_schema_mapping(),
-            shuffle=shuffle,
-            parts_per_chunk=parts_per_chunk,
-            **kwargs,
-        )
-
-    def train_dataloader(self):
-        """Create train data loader."""
-        return self._get_dataloader("train", shuffle=True, **self.kwargs)
-
-    def val_dataloader(self):
-        """Create validation data loader."""
-        return self._get_dataloader("val", shuffle=False, **self.kwargs)
-
-    def test_dataloader(self):
-        """Create test data loader."""
-        return self._get_dataloader("test", shuffle=False, **self.kwargs)
+    def _get_distributed_kwargs(self, rank, world_size):
+        """Merlin loaders split partitions between ranks themselves."""
+        return {"global_size": world_size, "global_rank": rank}
+
+    def _sub_sample_dataset(self, dataset, frac, seed):
+        """Keep a fixed random subset of the partitions of a merlin dataset."""
+        ddf = dataset.to_ddf()
+        rng = np.random.default_rng(seed)
+        n_keep = max(math.ceil(frac * ddf.npartitions), 1)
+        keep = np.sort(rng.choice(ddf.npartitions, n_keep, replace=False))
+        return merlin.io.Dataset(ddf.partitions[keep.tolist()], schema=dataset.schema)
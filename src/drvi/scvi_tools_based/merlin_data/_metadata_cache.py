@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import threading
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = ".drvi_metadata.json"
+MANIFEST_VERSION = 1
+
+# Entries shared by all caches of the process, keyed by (absolute file path, entry key)
+_MEMORY_CACHE: dict[tuple[str, str], tuple[int, Any]] = {}
+_MEMORY_CACHE_LOCK = threading.Lock()
+
+
+class MetadataCache:
+    """
+    Cache for metadata derived from files of a dataset directory.
+
+    Entries are validated by the modification time of the file they are derived from.
+    They are kept in memory for the whole process and optionally persisted in a JSON manifest,
+    so that only a `stat` call is needed to reuse them across objects and sessions.
+
+    Parameters
+    ----------
+    data_path : str
+        Directory of the dataset.
+    manifest_path : str, optional
+        Path of the JSON manifest. Entries are only kept in memory if None.
+    """
+
+    def __init__(self, data_path: str, manifest_path: str | None = None):
+        self.data_path = os.path.abspath(data_path)
+        self.manifest_path = manifest_path
+        self._manifest = self._read_manifest()
+
+    def _read_manifest(self) -> dict:
+        if self.manifest_path is None or not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable metadata manifest {self.manifest_path}: {e}")
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("entries", {})
+
+    def _write_manifest(self) -> None:
+        try:
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": MANIFEST_VERSION, "entries": self._manifest}, f)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError as e:
+            logger.warning(f"Could not write metadata manifest {self.manifest_path}: {e}")
+
+    def get(
+        self,
+        key: str,
+        relative_path: str,
+        compute: Callable[[str], Any],
+        serialize: Callable[[Any], Any] | None = None,
+        deserialize: Callable[[Any], Any] | None = None,
+    ) -> Any:
+        """
+        Get a cached entry or compute it from its source file.
+
+        Parameters
+        ----------
+        key : str
+            Name of the entry.
+        relative_path : str
+            Path of the source file relative to the data path.
+        compute : Callable
+            Function computing the entry from the absolute path of the source file.
+        serialize : Callable, optional
+            Function converting the entry to a JSON serializable object.
+            Entries are not persisted in the manifest if None.
+        deserialize : Callable, optional
+            Inverse of `serialize`.
+
+        Returns
+        -------
+        The entry.
+        """
+        path = os.path.join(self.data_path, relative_path)
+        mtime = os.stat(path).st_mtime_ns
+        memory_key = (path, key)
+        with _MEMORY_CACHE_LOCK:
+            cached = _MEMORY_CACHE.get(memory_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        persist = self.manifest_path is not None and serialize is not None
+        manifest_entry = self._manifest.get(key) if persist else None
+        if manifest_entry is not None and manifest_entry["path"] == relative_path and manifest_entry["mtime"] == mtime:
+            value = manifest_entry["value"] if deserialize is None else deserialize(manifest_entry["value"])
+        else:
+            value = compute(path)
+            if persist:
+                self._manifest[key] = {"path": relative_path, "mtime": mtime, "value": serialize(value)}
+                self._write_manifest()
+
+        with _MEMORY_CACHE_LOCK:
+            _MEMORY_CACHE[memory_key] = (mtime, value)
+        return value
+
+
+def clear_metadata_cache() -> None:
+    """Clear the in-memory metadata cache of the process."""
+    with _MEMORY_CACHE_LOCK:
+        _MEMORY_CACHE.clear()
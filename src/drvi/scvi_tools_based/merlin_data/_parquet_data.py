@@ -0,0 +1,344 @@
+import base64
+import math
+import os
+from typing import Literal
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scvi.data import _constants
+
+from drvi.scvi_tools_based.merlin_data._metadata_cache import MANIFEST_FILENAME, MetadataCache
+from drvi.scvi_tools_based.merlin_data._parquet_data_loader import ParquetDataset
+from drvi.scvi_tools_based.merlin_data._sparse import SparseColumnPair
+
+
+def read_first_row(path):
+    """Read first row of a parquet file in a memory efficient way"""
+    parquet_file = pq.ParquetFile(path)
+    first_row = next(parquet_file.iter_batches(batch_size=1))
+    df = pa.Table.from_batches([first_row])
+    return df.to_pylist()[0]
+
+
+def _serialize_schema(schema_and_first_row):
+    schema, first_row = schema_and_first_row
+    return {"schema": base64.b64encode(schema.serialize().to_pybytes()).decode(), "first_row": first_row}
+
+
+def _deserialize_schema(value):
+    schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(value["schema"])))
+    return schema, value["first_row"]
+
+
+class ParquetData:
+    """
+    Wrapper for parquet data stored in the merlin layout, readable with pyarrow only.
+
+    The expression layer is either a list column with one entry per variable or a pair of list columns
+    `{layer}__indices` and `{layer}__values` holding the non-zero entries of each row.
+    The expected layout on disk is::
+
+        data_path/
+            train/part.0.parquet, train/part.1.parquet, ...
+            val/part.0.parquet, ...
+            test/part.0.parquet, ...
+            var.parquet
+            categorical_lookup/<column>.parquet
+
+    Parameters
+    ----------
+    data_path : str
+        Path to parquet data.
+    train_key : str, optional
+        Key for train data. Default is 'train'.
+    validation_key : str, optional
+        Key for validation data. Default is 'val'.
+    test_key : str, optional
+        Key for test data. Default is None.
+    default_track : str, optional
+        Default track to use for data. Default is 'train'. Possible values are 'train', 'val', 'test'.
+    layer_key : str, optional
+        Key for layer data. Default is None, which will be replaced with 'X'.
+    sub_sample_frac : float
+        The fraction of data to subsample. Default is 1.0.
+    var_names_col_num : int
+        The column number of the variable names in the var.parquet file. Default is 0.
+    sub_sample_mode : str
+        How to subsample. 'files' keeps random parquet files, 'row_groups' keeps random row groups
+        and 'rows' keeps random rows selected at read time. Default is 'row_groups'.
+    sub_sample_stratify_key : str, optional
+        Categorical column to stratify the 'rows' sub-sampling by.
+    sub_sample_seed : int
+        Seed for the sub-sampling. Default is 0.
+    metadata_manifest : bool or str
+        Persist the schema, first row and categorical mappings in a JSON manifest, so later sessions
+        only check file modification times instead of reading parquet files. If True, the manifest is
+        written to `data_path/.drvi_metadata.json`, a string gives its path. Metadata is cached in memory
+        for the whole process in any case. Default is False.
+    """
+
+    def __init__(
+        self,
+        data_path: str,
+        train_key: str = "train",
+        validation_key: str = "val",
+        test_key: str | None = "test",
+        default_track: Literal["train", "val", "test"] = "train",
+        layer_key: str | None = None,
+        sub_sample_frac: float = 1.0,
+        var_names_col_num=0,
+        sub_sample_mode: Literal["files", "row_groups", "rows"] = "row_groups",
+        sub_sample_stratify_key: str | None = None,
+        sub_sample_seed: int = 0,
+        metadata_manifest: bool | str = False,
+    ) -> None:
+        self.data_path = data_path
+        self.train_key = train_key
+        self.validation_key = validation_key
+        self.test_key = test_key
+        self.default_track = self.set_default_track(default_track)
+        self.layer_key = "X" if layer_key is None else layer_key
+        self.sub_sample_frac = sub_sample_frac
+        assert sub_sample_mode in ["files", "row_groups", "rows"]
+        self.sub_sample_mode = sub_sample_mode
+        self.sub_sample_stratify_key = sub_sample_stratify_key
+        self.sub_sample_seed = sub_sample_seed
+
+        self.var_names_col_num = var_names_col_num
+
+        if metadata_manifest is True:
+            metadata_manifest = os.path.join(data_path, MANIFEST_FILENAME)
+        self.metadata_cache = MetadataCache(data_path, manifest_path=metadata_manifest or None)
+
+        self.uns = {}
+        self.schema, self.first_row = self.resolve_schema()
+
+        assert self.has_col(self.layer_key) or self.is_sparse_layer(self.layer_key)
+
+    def get_default_track(self):
+        return self.default_track
+
+    def set_default_track(self, track):
+        assert track in ["train", "val", "test"]
+        self.default_track = track
+        return track
+
+    def resolve_schema(self):
+        """
+        Resolve the schema of the parquet data.
+
+        Returns
+        -------
+        schema : pa.Schema
+            The pyarrow schema of the parquet data.
+        first_row : dict
+            The first row of the parquet data.
+        """
+        return self.metadata_cache.get(
+            "schema",
+            os.path.join(self.train_key, "part.0.parquet"),
+            lambda path: (pq.read_schema(path), read_first_row(path)),
+            serialize=_serialize_schema,
+            deserialize=_deserialize_schema,
+        )
+
+    def has_col(self, key):
+        """
+        Check if the parquet data has a specific column.
+
+        Parameters
+        ----------
+        key : str
+            The column key to check.
+
+        Returns
+        -------
+        bool
+            True if the column exists, False otherwise.
+        """
+        return key in self.schema.names
+
+    def is_sparse_layer(self, key):
+        """
+        Check if a layer is stored as a sparse column pair `{key}__indices` and `{key}__values`.
+
+        Parameters
+        ----------
+        key : str
+            The layer key to check.
+
+        Returns
+        -------
+        bool
+            True if the layer is stored sparse, False otherwise.
+        """
+        pair = SparseColumnPair(key, 0)
+        return not self.has_col(key) and self.has_col(pair.indices) and self.has_col(pair.values)
+
+    def get_categorical_mapping(self, key):
+        """
+        Get the categorical mapping for a specific column.
+
+        Parameters
+        ----------
+        key : str
+            The column key to get the mapping for.
+
+        Returns
+        -------
+        dict
+            The categorical mapping for the column.
+        """
+
+        def read_mapping(path):
+            lookup_table = pd.read_parquet(path)
+            lookup_table.columns = ["col_value"]
+            mapping = lookup_table.to_dict()["col_value"]
+            # correct mapping (int key to str) for compatbility with anndata summarization (attrdict)
+            return {str(k): v for k, v in mapping.items()}
+
+        mapping = self.metadata_cache.get(
+            f"categorical_mapping/{key}",
+            os.path.join("categorical_lookup", f"{key}.parquet"),
+            read_mapping,
+            serialize=dict,
+        )
+        return mapping.copy()
+
+    @property
+    def n_vars(self):
+        """
+        Get the number of variables in the parquet data.
+
+        Returns
+        -------
+        int
+            The number of variables.
+        """
+        if self.is_sparse_layer(self.layer_key):
+            return len(self.var)
+        return len(self.first_row[self.layer_key])
+
+    @property
+    def var(self):
+        """
+        Get the variable metadata in the parquet data.
+
+        Returns
+        -------
+        pd.DataFrame
+            The variable metadata.
+        """
+        return self.metadata_cache.get("var", "var.parquet", pd.read_parquet).copy()
+
+    @property
+    def var_names(self):
+        """
+        Get the variable names in the parquet data.
+
+        Returns
+        -------
+        List[str]
+            The variable names.
+        """
+        return self.var.iloc[:, self.var_names_col_num]
+
+    @property
+    def is_view(self):
+        """For compatibility with anndata"""
+        return False
+
+    def _set_uuid(self, overwrite: bool = False):
+        """
+        Set the UUID for the parquet data.
+
+        Parameters
+        ----------
+        overwrite : bool, optional
+            Whether to overwrite the existing UUID. Default is False.
+        """
+        if _constants._SCVI_UUID_KEY not in self.uns or overwrite:
+            self.uns[_constants._SCVI_UUID_KEY] = str(uuid4())
+
+    def __repr__(self) -> str:
+        return f"ParquetData object with schema: {self.schema}"
+
+    def _get_split_key(self, split):
+        if split == "default":
+            split = self.default_track
+        return {
+            "train": self.train_key,
+            "val": self.validation_key,
+            "test": self.test_key,
+        }[split]
+
+    @staticmethod
+    def _list_data_files(base_path: str, ds_key_disk: str, sub_sample_frac: float = 1.0, seed: int = 0):
+        """
+        List the parquet files of a split ordered by part number.
+
+        With sub-sampling, a fixed random subset of the files is kept, so that the kept data does not depend on
+        the order in which the files were written.
+
+        Parameters
+        ----------
+        base_path : str
+            The base path of the data.
+        ds_key_disk : str
+            The key on disk to get the data files for.
+        sub_sample_frac : float, optional
+            The fraction of data to subsample. Default is 1.0.
+        seed : int, optional
+            Seed for the choice of files. Default is 0.
+
+        Returns
+        -------
+        List[str]
+            The paths to the data files.
+        """
+        files = [file for file in os.listdir(os.path.join(base_path, ds_key_disk)) if file.endswith(".parquet")]
+        files = [
+            os.path.join(base_path, ds_key_disk, file) for file in sorted(files, key=lambda x: int(x.split(".")[1]))
+        ]
+        if sub_sample_frac >= 1.0:
+            return files
+        rng = np.random.default_rng(seed)
+        keep = np.sort(rng.choice(len(files), max(math.ceil(sub_sample_frac * len(files)), 1), replace=False))
+        return [files[i] for i in keep]
+
+    def get_dataset(self, split, columns, **dataset_kwargs):
+        """
+        Get the dataset for a specific split and columns.
+
+        Parameters
+        ----------
+        split : str
+            The split to get the dataset for.
+        columns : List[str]
+            The columns to include in the dataset.
+        dataset_kwargs : dict, optional
+            Additional keyword arguments to pass to the dataset.
+
+        Returns
+        -------
+        ParquetDataset
+            The dataset object.
+        """
+        ds_key_disk = self._get_split_key(split)
+        if self.sub_sample_mode == "files":
+            files = self._list_data_files(
+                self.data_path, ds_key_disk=ds_key_disk, sub_sample_frac=self.sub_sample_frac, seed=self.sub_sample_seed
+            )
+            return ParquetDataset(files, columns=columns, **dataset_kwargs)
+        return ParquetDataset(
+            self._list_data_files(self.data_path, ds_key_disk=ds_key_disk),
+            columns=columns,
+            sub_sample_frac=self.sub_sample_frac,
+            sub_sample_mode=self.sub_sample_mode,
+            stratify_key=self.sub_sample_stratify_key,
+            seed=self.sub_sample_seed,
+            **dataset_kwargs,
+        )
@@ -0,0 +1,406 @@
+import itertools
+import math
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+
+from drvi.scvi_tools_based.merlin_data._sparse import SparseColumnPair, decode_sparse_rows, is_sparse_column
+
+
+def _column_to_numpy(column: pa.ChunkedArray) -> np.ndarray:
+    """Convert a parquet column to numpy, sharing memory with the arrow buffers when possible.
+
+    Fixed length list columns (e.g. the expression matrix) become 2D arrays.
+    """
+    arrays = []
+    for chunk in column.chunks:
+        if pa.types.is_list(chunk.type) or pa.types.is_large_list(chunk.type):
+            # flatten respects offsets of sliced arrays and does not copy the values buffer
+            values = chunk.flatten().to_numpy(zero_copy_only=False)
+            arrays.append(values.reshape(len(chunk), -1))
+        else:
+            arrays.append(chunk.to_numpy(zero_copy_only=False))
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.concatenate(arrays)
+
+
+def _ragged_column_to_numpy(column: pa.ChunkedArray) -> tuple[np.ndarray, np.ndarray]:
+    """Convert a list column with rows of different lengths to flat values and row offsets."""
+    array = column.combine_chunks()
+    offsets = array.offsets.to_numpy()
+    return array.flatten().to_numpy(zero_copy_only=False), offsets - offsets[0]
+
+
+def _numpy_to_tensor(array: np.ndarray) -> torch.Tensor:
+    with warnings.catch_warnings():
+        # Arrow buffers are immutable; batches are not written to in place
+        warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+        return torch.from_numpy(array)
+
+
+class ParquetDataset:
+    """
+    Row groups of a set of parquet files.
+
+    Parameters
+    ----------
+    files : List[str]
+        Paths of the parquet files.
+    columns : List[str], optional
+        Columns to read. All columns are read if None.
+    sub_sample_frac : float
+        The fraction of rows to keep. Default is 1.0.
+    sub_sample_mode : str
+        'row_groups' keeps a random subset of row groups, which also reduces I/O.
+        'rows' keeps a random subset of rows of every row group, selected at read time.
+    stratify_key : str, optional
+        Categorical column to stratify the 'rows' sub-sampling by. Every category keeps at least one row.
+    seed : int
+        Seed for sub-sampling.
+    """
+
+    def __init__(
+        self,
+        files,
+        columns=None,
+        sub_sample_frac: float = 1.0,
+        sub_sample_mode: Literal["row_groups", "rows"] = "row_groups",
+        stratify_key: str | None = None,
+        seed: int = 0,
+    ):
+        self.files = list(files)
+        self.columns = columns
+        # (file index, row group index, number of rows)
+        self.row_groups = []
+        for file_index, path in enumerate(self.files):
+            metadata = pq.read_metadata(path)
+            for row_group in range(metadata.num_row_groups):
+                self.row_groups.append((file_index, row_group, metadata.row_group(row_group).num_rows))
+        # rows to keep of each row group, None keeps all rows
+        self.row_selection = [None] * len(self.row_groups)
+        if sub_sample_frac < 1.0:
+            self.sub_sample(sub_sample_frac, sub_sample_mode, stratify_key=stratify_key, seed=seed)
+
+    def _read_column(self, key):
+        """Read a single column of every (sub-sampled) row group."""
+        columns = []
+        for (file_index, row_group, _), selection in zip(self.row_groups, self.row_selection, strict=True):
+            values = _column_to_numpy(
+                pq.ParquetFile(self.files[file_index]).read_row_group(row_group, columns=[key]).column(key)
+            )
+            columns.append(values if selection is None else values[selection])
+        return columns
+
+    def sub_sample(
+        self,
+        frac: float,
+        mode: Literal["row_groups", "rows"] = "row_groups",
+        stratify_key: str | None = None,
+        seed: int = 0,
+    ):
+        """
+        Keep a random subset of the dataset in place.
+
+        Parameters
+        ----------
+        frac : float
+            The fraction of row groups or rows to keep.
+        mode : str
+            'row_groups' or 'rows'. See the class description.
+        stratify_key : str, optional
+            Categorical column to stratify the 'rows' sub-sampling by.
+        seed : int
+            Seed for sub-sampling.
+
+        Returns
+        -------
+        ParquetDataset
+            The dataset itself.
+        """
+        rng = np.random.default_rng(seed)
+        if mode == "row_groups":
+            if stratify_key is not None:
+                raise ValueError("Stratified sub-sampling is only supported with sub_sample_mode='rows'.")
+            n_keep = max(math.ceil(frac * len(self.row_groups)), 1)
+            keep = np.sort(rng.choice(len(self.row_groups), n_keep, replace=False))
+            self.row_groups = [self.row_groups[i] for i in keep]
+            self.row_selection = [self.row_selection[i] for i in keep]
+            return self
+        if mode != "rows":
+            raise ValueError(f"Unknown sub_sample_mode {mode}.")
+
+        offsets = np.cumsum([0] + [n_rows for _, _, n_rows in self.row_groups])
+        if stratify_key is None:
+            keep = rng.choice(offsets[-1], max(round(frac * offsets[-1]), 1), replace=False)
+        else:
+            labels = np.concatenate(self._read_column(stratify_key))
+            keep = []
+            for label in np.unique(labels):
+                positions = np.flatnonzero(labels == label)
+                keep.append(rng.choice(positions, max(round(frac * len(positions)), 1), replace=False))
+            keep = np.concatenate(keep)
+        keep = np.sort(keep)
+
+        row_groups, row_selection = [], []
+        bounds = np.searchsorted(keep, offsets)
+        for i, (file_index, row_group, _) in enumerate(self.row_groups):
+            selection = keep[bounds[i] : bounds[i + 1]] - offsets[i]
+            if len(selection) > 0:
+                if self.row_selection[i] is not None:
+                    selection = self.row_selection[i][selection]
+                row_groups.append((file_index, row_group, len(selection)))
+                row_selection.append(selection)
+        self.row_groups = row_groups
+        self.row_selection = row_selection
+        return self
+
+    @property
+    def num_rows(self):
+        return sum(n_rows for _, _, n_rows in self.row_groups)
+
+    @property
+    def npartitions(self):
+        """Number of row groups, the unit of shuffling."""
+        return len(self.row_groups)
+
+    def read_row_groups(self, row_group_indices):
+        """
+        Read row groups as numpy arrays.
+
+        Parameters
+        ----------
+        row_group_indices : List[int]
+            Indices into `self.row_groups`.
+
+        Returns
+        -------
+        dict
+            Mapping from column name to a numpy array with one entry per row.
+        Columns of sparse layers are returned as `{column}__values` and `{column}__offsets`.
+        """
+        tables = []
+        for index in row_group_indices:
+            file_index, row_group, _ = self.row_groups[index]
+            parquet_file = pq.ParquetFile(self.files[file_index], memory_map=True)
+            table = parquet_file.read_row_group(row_group, columns=self.columns)
+            if self.row_selection[index] is not None:
+                table = table.take(self.row_selection[index])
+            tables.append(table)
+        table = pa.concat_tables(tables)
+        arrays = {}
+        for name in table.column_names:
+            if is_sparse_column(name):
+                arrays[f"{name}__values"], arrays[f"{name}__offsets"] = _ragged_column_to_numpy(table.column(name))
+            else:
+                arrays[name] = _column_to_numpy(table.column(name))
+        return arrays
+
+    def __repr__(self) -> str:
+        return (
+            f"ParquetDataset with {len(self.files)} files, {len(self.row_groups)} row groups and {self.num_rows} rows"
+        )
+
+
+class ParquetDataLoader:
+    """
+    Data loader for ParquetData without the merlin dependency.
+
+    Row groups are the unit of shuffling: their order is shuffled every epoch and `parts_per_chunk` row groups
+    are read together and shuffled at row level. Chunks are read and converted to numpy by background threads.
+
+    Parameters
+    ----------
+    dataset : ParquetDataset
+        Dataset to iterate over.
+    batch_size : int
+        Number of rows per batch.
+    shuffle : bool
+        Whether to shuffle row groups and rows within each chunk.
+    mapping : list of tuple specifying (target_col, source_col)
+    parts_per_chunk : int
+        Number of row groups that are read and shuffled together.
+    drop_last : bool
+        Whether to drop the last incomplete batch.
+    n_threads : int
+        Number of background threads reading row groups.
+    prefetch_chunks : int
+        Number of chunks read ahead of the consumer.
+    seed : int, optional
+        Seed for shuffling. Epoch `i` uses `seed + i`.
+    sparse_output : bool
+        Return layers stored as sparse column pairs as sparse CSR tensors instead of dense tensors.
+    num_replicas : int
+        Number of distributed processes sharing the data. Every epoch, the (shuffled) row groups are assigned
+        to ranks round-robin and all ranks yield the number of batches of the rank with the fewest rows,
+        so a few batches of the other ranks are skipped. The seed defaults to 0, as it must be the same on all ranks.
+    rank : int
+        Rank of this process.
+    """
+
+    def __init__(
+        self,
+        dataset: ParquetDataset,
+        batch_size: int = 1,
+        shuffle: bool = False,
+        mapping=None,
+        parts_per_chunk: int = 1,
+        drop_last: bool = False,
+        n_threads: int = 2,
+        prefetch_chunks: int = 2,
+        seed: int | None = None,
+        sparse_output: bool = False,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ):
+        if not 0 <= rank < num_replicas:
+            raise ValueError(f"Invalid rank {rank} for {num_replicas} replicas.")
+        if dataset.npartitions < num_replicas:
+            raise ValueError(f"Cannot shard {dataset.npartitions} row groups between {num_replicas} replicas.")
+        if num_replicas > 1 and seed is None:
+            seed = 0
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.mapping = mapping
+        self.parts_per_chunk = parts_per_chunk
+        self.drop_last = drop_last
+        self.n_threads = n_threads
+        self.prefetch_chunks = prefetch_chunks
+        self.seed = seed
+        self.sparse_output = sparse_output
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.stall_time = 0.0
+        self.n_batches_loaded = 0
+
+    def _n_batches(self, n_rows):
+        if self.drop_last:
+            return n_rows // self.batch_size
+        return math.ceil(n_rows / self.batch_size)
+
+    def _n_shard_batches(self, order):
+        """Number of batches every rank yields given the order of row groups of an epoch."""
+        n_rows = np.array([n_rows for _, _, n_rows in self.dataset.row_groups])[order]
+        return min(self._n_batches(n_rows[rank :: self.num_replicas].sum()) for rank in range(self.num_replicas))
+
+    def __len__(self):
+        if self.num_replicas == 1:
+            return self._n_batches(self.dataset.num_rows)
+        # the first draw of an epoch is the order of row groups
+        return self._n_shard_batches(self._get_order(np.random.default_rng(self.seed + self.epoch)))
+
+    @property
+    def mean_stall_time(self):
+        """Average time in seconds the consumer waited for a batch."""
+        return self.stall_time / max(self.n_batches_loaded, 1)
+
+    def _get_order(self, rng):
+        order = np.arange(len(self.dataset.row_groups))
+        if self.shuffle:
+            order = rng.permutation(order)
+        return order
+
+    def _get_chunks(self, order):
+        order = order[self.rank :: self.num_replicas]
+        return [order[i : i + self.parts_per_chunk] for i in range(0, len(order), self.parts_per_chunk)]
+
+    def convert_batch(self, batch):
+        if self.mapping is None:
+            return batch
+        result = {}
+        with torch.profiler.record_function("drvi::parquet_convert_batch"):
+            for new_col, col in self.mapping:
+                if isinstance(col, SparseColumnPair):
+                    # sparse layers are decoded to dense rows when the chunk is read
+                    result[new_col] = batch[col.name].to_sparse_csr() if self.sparse_output else batch[col.name]
+                elif isinstance(col, list):
+                    result[new_col] = torch.stack([batch[c] for c in col], dim=1)
+                else:
+                    result[new_col] = batch[col]
+        return result
+
+    def _read_chunk(self, chunk):
+        # runs in reader threads, which appear as separate threads in profiler traces
+        with torch.profiler.record_function("drvi::parquet_read_chunk"):
+            tensors = {name: _numpy_to_tensor(array) for name, array in self.dataset.read_row_groups(chunk).items()}
+            for _, col in self.mapping or []:
+                if isinstance(col, SparseColumnPair):
+                    tensors[col.name] = decode_sparse_rows(
+                        tensors.pop(f"{col.indices}__offsets"),
+                        tensors.pop(f"{col.indices}__values"),
+                        tensors.pop(f"{col.values}__values"),
+                        col.n_vars,
+                    )
+                    tensors.pop(f"{col.values}__offsets")
+        return tensors
+
+    def _iter_chunks(self, chunks):
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            pending = deque()
+            chunks = iter(chunks)
+            for chunk in chunks:
+                pending.append(executor.submit(self._read_chunk, chunk))
+                if len(pending) >= self.prefetch_chunks:
+                    break
+            while pending:
+                start_time = time.perf_counter()
+                with torch.profiler.record_function("drvi::parquet_wait_chunk"):
+                    tensors = pending.popleft().result()
+                self.stall_time += time.perf_counter() - start_time
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.append(executor.submit(self._read_chunk, next_chunk))
+                yield tensors
+
+    def __iter__(self):
+        rng = np.random.default_rng(None if self.seed is None else self.seed + self.epoch)
+        self.epoch += 1
+        order = self._get_order(rng)
+        batches = self._iter_batches(self._get_chunks(order), rng)
+        if self.num_replicas == 1:
+            yield from batches
+            return
+        try:
+            yield from itertools.islice(batches, self._n_shard_batches(order))
+        finally:
+            # stop the background readers of the skipped batches
+            batches.close()
+
+    def _iter_batches(self, chunks, rng):
+        leftover = None
+        for tensors in self._iter_chunks(chunks):
+            n_rows = len(next(iter(tensors.values())))
+            order = torch.from_numpy(rng.permutation(n_rows)) if self.shuffle else None
+            start = 0
+            if leftover is not None:
+                # complete the batch carried over from the previous chunk
+                n_missing = self.batch_size - len(next(iter(leftover.values())))
+                rows = slice(0, n_missing) if order is None else order[:n_missing]
+                leftover = {k: torch.cat([v, tensors[k][rows]]) for k, v in leftover.items()}
+                start = min(n_missing, n_rows)
+                if len(next(iter(leftover.values()))) < self.batch_size:
+                    continue
+                self.n_batches_loaded += 1
+                yield self.convert_batch(leftover)
+                leftover = None
+            for batch_start in range(start, n_rows, self.batch_size):
+                batch_end = min(batch_start + self.batch_size, n_rows)
+                rows = slice(batch_start, batch_end) if order is None else order[batch_start:batch_end]
+                batch = {k: v[rows] for k, v in tensors.items()}
+                if batch_end - batch_start < self.batch_size:
+                    leftover = batch
+                    break
+                self.n_batches_loaded += 1
+                yield self.convert_batch(batch)
+        if leftover is not None and not self.drop_last:
+            self.n_batches_loaded += 1
+            yield self.convert_batch(leftover)
@@ -0,0 +1,146 @@
+import logging
+
+import lightning.pytorch as pl
+
+from drvi.scvi_tools_based.merlin_data._data_manager import MerlinDataManager
+from drvi.scvi_tools_based.merlin_data._parquet_data_loader import ParquetDataLoader
+from drvi.scvi_tools_based.train._distributed import get_rank_and_world_size
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTS_PER_CHUNK = {
+    "train": 8,
+    "val": 1,
+    "test": 1,
+}
+
+
+class ParquetDataSplitter(pl.LightningDataModule):
+    """Creates data loaders for ParquetData object given the MerlinDataManager.
+
+    Parameters
+    ----------
+    adata_manager
+        MerlinDataManager object that has been created by setup_merlin_data.
+    parts_per_chunk
+        Number of parts (merlin partitions or parquet row groups) that are loaded and shuffled together.
+        An int applies to the train split, a dict sets it per split. Defaults to 8 for train and 1 otherwise.
+    shuffle_buffer_size
+        Approximate number of cells shuffled together in the train split.
+        Overrides `parts_per_chunk` for the train split when given.
+    seed
+        Seed for shuffling the train split.
+    val_sub_sample_frac
+        Fraction of the validation parts (parquet row groups or merlin partitions) to validate on.
+        The same random subset is used for the whole training. All validation data is used if None.
+    val_sub_sample_seed
+        Seed for selecting the validation subset.
+
+    Notes
+    -----
+    Under distributed training, the parts of every split are partitioned between ranks
+    and the seed of the train split defaults to 0, as all ranks must shuffle the same way.
+
+    To validate every N steps instead of every epoch, pass `val_every_n_steps=N` to :meth:`drvi.model.DRVI.train`
+    or a :class:`~drvi.scvi_tools_based.train.StepValidationCallback` to `callbacks`.
+    """
+
+    data_loader_cls = ParquetDataLoader
+
+    def __init__(
+        self,
+        adata_manager: MerlinDataManager,
+        parts_per_chunk: int | dict[str, int] | None = None,
+        shuffle_buffer_size: int | None = None,
+        seed: int | None = None,
+        val_sub_sample_frac: float | None = None,
+        val_sub_sample_seed: int = 0,
+        **kwargs,
+    ):
+        super().__init__()
+        self.adata_manager = adata_manager
+        if parts_per_chunk is None:
+            parts_per_chunk = DEFAULT_PARTS_PER_CHUNK
+        elif isinstance(parts_per_chunk, int):
+            parts_per_chunk = {**DEFAULT_PARTS_PER_CHUNK, "train": parts_per_chunk}
+        else:
+            parts_per_chunk = {**DEFAULT_PARTS_PER_CHUNK, **parts_per_chunk}
+        self.parts_per_chunk = parts_per_chunk
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.val_sub_sample_frac = val_sub_sample_frac
+        self.val_sub_sample_seed = val_sub_sample_seed
+        # We some usual inputs
+        discarded_keys = [
+            "train_size",
+            "validation_size",
+            "shuffle_set_split",
+            "pin_memory",
+            "distributed_sampler",
+            "load_sparse_tensor",
+        ]
+        for key in discarded_keys:
+            # print("Discarding key:", key)
+            kwargs.pop(key, None)
+        self.kwargs = kwargs
+        self.distributed_kwargs = {}
+        self.setup()
+
+    def setup(self, stage: str | None = None):
+        self.val_idx = None
+        self.train_idx = None
+        self.test_idx = None
+        rank, world_size = get_rank_and_world_size()
+        self.distributed_kwargs = self._get_distributed_kwargs(rank, world_size) if world_size > 1 else {}
+
+    def _get_distributed_kwargs(self, rank, world_size):
+        """Keyword arguments of the data loaders to load the shard of a rank."""
+        return {"num_replicas": world_size, "rank": rank}
+
+    def get_parts_per_chunk(self, split, dataset):
+        """Number of parts loaded together for a split, derived from `shuffle_buffer_size` if given."""
+        if split == "train" and self.shuffle_buffer_size is not None:
+            cells_per_part = dataset.num_rows / max(dataset.npartitions, 1)
+            parts_per_chunk = min(max(round(self.shuffle_buffer_size / cells_per_part), 1), dataset.npartitions)
+            logger.info(
+                f"Using {parts_per_chunk} parts per chunk (~{cells_per_part:.0f} cells per part) "
+                f"for a shuffle buffer of {self.shuffle_buffer_size} cells"
+            )
+            return parts_per_chunk
+        return self.parts_per_chunk[split]
+
+    def _sub_sample_dataset(self, dataset, frac, seed):
+        """Keep a fixed random subset of the row groups of a dataset."""
+        return dataset.sub_sample(frac, mode="row_groups", seed=seed)
+
+    def get_dataset(self, split):
+        """Get the dataset of a split, sub-sampled for validation if requested."""
+        dataset = self.adata_manager.get_dataset(split)
+        if split == "val" and self.val_sub_sample_frac is not None:
+            dataset = self._sub_sample_dataset(dataset, self.val_sub_sample_frac, self.val_sub_sample_seed)
+        return dataset
+
+    def _get_dataloader(self, split, shuffle=False, seed=None, **kwargs):
+        dataset = self.get_dataset(split)
+        return self.data_loader_cls(
+            dataset,
+            mapping=self.adata_manager.get_fields_schema_mapping(),
+            shuffle=shuffle,
+            parts_per_chunk=self.get_parts_per_chunk(split, dataset),
+            seed=seed,
+            **self.distributed_kwargs,
+            **kwargs,
+        )
+
+    def train_dataloader(self):
+        """Create train data loader."""
+        seed = 0 if self.seed is None and self.distributed_kwargs else self.seed
+        return self._get_dataloader("train", shuffle=True, seed=seed, **self.kwargs)
+
+    def val_dataloader(self):
+        """Create validation data loader."""
+        return self._get_dataloader("val", shuffle=False, **self.kwargs)
+
+    def test_dataloader(self):
+        """Create test data loader."""
+        return self._get_dataloader("test", shuffle=False, **self.kwargs)
@@ -0,0 +1,94 @@
+from typing import NamedTuple
+
+import torch
+
+SPARSE_INDICES_SUFFIX = "__indices"
+SPARSE_VALUES_SUFFIX = "__values"
+
+
+class SparseColumnPair(NamedTuple):
+    """
+    A layer stored as a pair of list columns holding the indices and values of non-zero entries of each row.
+
+    Parameters
+    ----------
+    name : str
+        Name of the layer. Columns are stored as `{name}__indices` and `{name}__values`.
+    n_vars : int
+        Number of variables of the dense layer.
+    """
+
+    name: str
+    n_vars: int
+
+    @property
+    def indices(self):
+        return f"{self.name}{SPARSE_INDICES_SUFFIX}"
+
+    @property
+    def values(self):
+        return f"{self.name}{SPARSE_VALUES_SUFFIX}"
+
+    @property
+    def columns(self):
+        return [self.indices, self.values]
+
+
+def is_sparse_column(name: str) -> bool:
+    """Whether a column holds the indices or values of a sparse layer."""
+    return name.endswith(SPARSE_INDICES_SUFFIX) or name.endswith(SPARSE_VALUES_SUFFIX)
+
+
+def decode_sparse_rows(
+    offsets: torch.Tensor,
+    indices: torch.Tensor,
+    values: torch.Tensor,
+    n_vars: int,
+    sparse_output: bool = False,
+    out: torch.Tensor | None = None,
+) -> torch.Tensor:
+    """
+    Decode rows given as CSR offsets, column indices and values.
+
+    Parameters
+    ----------
+    offsets
+        Start of each row in `indices` and `values`, with one more entry than rows.
+    indices
+        Column index of each non-zero entry.
+    values
+        Value of each non-zero entry.
+    n_vars
+        Number of columns.
+    sparse_output
+        Return a sparse CSR tensor instead of a dense tensor.
+    out
+        Dense tensor of shape n_rows x n_vars to decode into, instead of allocating a new one.
+        Ignored if `sparse_output`.
+
+    Returns
+    -------
+    torch.Tensor
+        Tensor of shape n_rows x n_vars.
+    """
+    n_rows = len(offsets) - 1
+    offsets = offsets - offsets[0]
+    if sparse_output:
+        return torch.sparse_csr_tensor(offsets.long(), indices.long(), values, size=(n_rows, n_vars))
+    rows = torch.repeat_interleave(torch.arange(n_rows, device=offsets.device), offsets.diff())
+    if out is not None:
+        output = out.zero_()
+    else:
+        output = torch.zeros(n_rows, n_vars, dtype=values.dtype, device=values.device)
+    output.view(-1).index_copy_(0, rows * n_vars + indices.long(), values)
+    return output
+
+
+def decode_sparse_batch(
+    batch: dict, pair: SparseColumnPair, sparse_output: bool = False, out: torch.Tensor | None = None
+) -> torch.Tensor:
+    """Decode a sparse layer from the `__values` and `__offsets` tensors of its ragged columns in a batch."""
+    offsets = batch[f"{pair.indices}__offsets"]
+    indices = batch[f"{pair.indices}__values"]
+    values = batch[f"{pair.values}__values"]
+    return decode_sparse_rows(offsets, indices, values, pair.n_vars, sparse_output=sparse_output, out=out)
@@ -2,13 +2,8 @@ import merlin.dtypes
 import merlin.schema
 import pyarrow as pa
 
-
-def read_first_row(path):
-    """Read first row of a parquet file in a memory efficient way"""
-    parquet_file = pa.parquet.ParquetFile(path)
-    first_row = next(parquet_file.iter_batches(batch_size=1))
-    df = pa.Table.from_batches([first_row])
-    return df.to_pylist()[0]
+from drvi.scvi_tools_based.merlin_data._parquet_data import read_first_row  # noqa: F401
+from drvi.scvi_tools_based.merlin_data._sparse import is_sparse_column
 
 
 def transfer_type_from_pyarrow(schema, first_row=None):
@@ -17,13 +12,20 @@ def transfer_type_from_pyarrow(schema, first_row=None):
         fields = []
         for field in schema:
             coresponsing_first_row = None
-            if first_row is not None:
+            # columns of sparse layers have a different length in every row
+            if first_row is not None and not is_sparse_column(field.name):
                 coresponsing_first_row = first_row[field.name]
             fields.append(transfer_type_from_pyarrow(field, first_row=coresponsing_first_row))
         return merlin.schema.Schema(fields)
     elif isinstance(schema, pa.Field):
         return merlin.schema.ColumnSchema(schema.name, **transfer_type_from_pyarrow(schema.type, first_row=first_row))
     elif isinstance(schema, pa.lib.ListType):
+        if first_row is None:
+            return {
+                "dtype": transfer_type_from_pyarrow(schema.value_type),
+                "is_list": True,
+                "is_ragged": True,
+            }
         return {
             "dtype": transfer_type_from_pyarrow(schema.value_type),
             "is_list": True,
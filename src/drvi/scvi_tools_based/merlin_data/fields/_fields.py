@@ -1,14 +1,14 @@
 from scvi.data.fields import CategoricalObsField, LayerField, NumericalJointObsField
 
 from drvi.scvi_tools_based.data.fields import FixedCategoricalJointObsField
-from drvi.scvi_tools_based.merlin_data._data import MerlinData
+from drvi.scvi_tools_based.merlin_data._parquet_data import ParquetData
 
 
 class MerlinLayerField(LayerField):
-    def validate_field(self, adata: MerlinData) -> None:
-        return
+    def validate_field(self, adata: ParquetData) -> None:
+        assert adata.has_col(self.attr_key) or adata.is_sparse_layer(self.attr_key)
 
-    def register_field(self, adata: MerlinData) -> dict:
+    def register_field(self, adata: ParquetData) -> dict:
         return {
             # self.N_OBS_KEY: adata.n_obs, ?
             self.N_VARS_KEY: adata.n_vars,
@@ -21,21 +21,21 @@ class MerlinLayerField(LayerField):
         #     summary_stats[self.N_CELLS_KEY] = state_registry[self.N_OBS_KEY]
         return summary_stats
 
-    def transfer_field(self, state_registry: dict, adata_target: MerlinData, **kwargs) -> dict:
+    def transfer_field(self, state_registry: dict, adata_target: ParquetData, **kwargs) -> dict:
         return super().transfer_field(state_registry, adata_target, **kwargs)
 
 
 class MerlinCategoricalObsField(CategoricalObsField):
-    def _setup_default_attr(self, adata: MerlinData) -> None:
+    def _setup_default_attr(self, adata: ParquetData) -> None:
         return
 
-    def validate_field(self, adata: MerlinData) -> None:
+    def validate_field(self, adata: ParquetData) -> None:
         if self.is_default:
             return
         merlin_data = adata
         assert merlin_data.has_col(self.attr_key)
 
-    def register_field(self, adata: MerlinData) -> dict:
+    def register_field(self, adata: ParquetData) -> dict:
         if self.is_default:
             return {
                 self.CATEGORICAL_MAPPING_KEY: {},
@@ -57,7 +57,7 @@ class MerlinCategoricalObsField(CategoricalObsField):
     def transfer_field(
         self,
         state_registry: dict,
-        adata_target: MerlinData,
+        adata_target: ParquetData,
         extend_categories: bool = False,
         **kwargs,
     ) -> dict:
@@ -78,12 +78,12 @@ class MerlinCategoricalObsField(CategoricalObsField):
 
 
 class MerlinCategoricalJointObsField(FixedCategoricalJointObsField):
-    def validate_field(self, adata: MerlinData) -> None:
+    def validate_field(self, adata: ParquetData) -> None:
         merlin_data = adata
         for key in self.attr_keys:
             assert merlin_data.has_col(key)
 
-    def register_field(self, adata: MerlinData) -> dict:
+    def register_field(self, adata: ParquetData) -> dict:
         merlin_data = adata
         categories = {}
         for key in self.attr_keys:
@@ -105,7 +105,7 @@ class MerlinCategoricalJointObsField(FixedCategoricalJointObsField):
     def transfer_field(
         self,
         state_registry: dict,
-        adata_target: MerlinData,
+        adata_target: ParquetData,
         extend_categories: bool = False,
         **kwargs,
     ) -> dict:
@@ -120,12 +120,12 @@ class MerlinCategoricalJointObsField(FixedCategoricalJointObsField):
 
 
 class MerlinNumericalJointObsField(NumericalJointObsField):
-    def validate_field(self, adata: MerlinData) -> None:
+    def validate_field(self, adata: ParquetData) -> None:
         merlin_data = adata
         for key in self.attr_keys:
             assert merlin_data.has_col(key)
 
-    def register_field(self, adata: MerlinData) -> dict:
+    def register_field(self, adata: ParquetData) -> dict:
         if self.attr_keys:
             raise NotImplementedError()
         return {}
@@ -138,7 +138,7 @@ class MerlinNumericalJointObsField(NumericalJointObsField):
     def transfer_field(
         self,
         state_registry: dict,
-        adata_target: MerlinData,
+        adata_target: ParquetData,
         **kwargs,
     ) -> dict:
         """Transfer the field."""
@@ -1,3 +1,13 @@
 from ._drvi import DRVI
+from ._export import DRVIRuntime, export_model
+from ._quantization import benchmark_quantization, calibrate_quantization, quantization_report, quantize_model
 
-__all__ = ["DRVI"]
+__all__ = [
+    "DRVI",
+    "DRVIRuntime",
+    "export_model",
+    "benchmark_quantization",
+    "calibrate_quantization",
+    "quantization_report",
+    "quantize_model",
+]
@@ -3,6 +3,7 @@ from collections.abc import Sequence
 from typing import Literal
 
 import numpy as np
+import torch
 from anndata import AnnData
 from scvi import REGISTRY_KEYS, settings
 from scvi.data import AnnDataManager
@@ -12,18 +13,29 @@ from scvi.utils import setup_anndata_dsp
 
 import drvi
 from drvi.nn_modules.feature_interface import FeatureInfoList
+from drvi.nn_modules.freezable import set_batch_norm_sync
+from drvi.scvi_tools_based.data import DRVIAnnDataLoader, DRVIDataSplitter
 from drvi.scvi_tools_based.data.fields import FixedCategoricalJointObsField
 from drvi.scvi_tools_based.merlin_data import (
     MerlinData,
     MerlinDataManager,
     MerlinDataSplitter,
     MerlinTransformedDataLoader,
+    ParquetData,
+    ParquetDataLoader,
+    ParquetDataSplitter,
 )
 from drvi.scvi_tools_based.merlin_data import (
     fields as melin_fields,
 )
 from drvi.scvi_tools_based.model.base import DRVIArchesMixin, GenerativeMixin
 from drvi.scvi_tools_based.module import DRVIModule
+from drvi.scvi_tools_based.train import (
+    AsyncValidationCallback,
+    DRVITrainingPlan,
+    StepValidationCallback,
+    ddp_strategy,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -60,9 +72,13 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
     >>> adata.obsm["latent"] = vae.get_latent_representation()
     """
 
+    _data_loader_cls = DRVIAnnDataLoader
+    _data_splitter_cls = DRVIDataSplitter
+    _training_plan_cls = DRVITrainingPlan
+
     def __init__(
         self,
-        adata: AnnData | MerlinData,
+        adata: AnnData | MerlinData | ParquetData,
         n_latent: int = 32,
         encoder_dims: Sequence[int] = (128, 128),
         decoder_dims: Sequence[int] = (128, 128),
@@ -78,11 +94,13 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
             pass
         elif MerlinData is not None and isinstance(adata, MerlinData):
             self._data_splitter_cls = MerlinDataSplitter
+        elif ParquetData is not None and isinstance(adata, ParquetData):
+            self._data_splitter_cls = ParquetDataSplitter
         else:
             raise ValueError(
-                "Only AnnData and MerlinData are supported. "
-                "If you have passed an instalce of MerlinData and still get this error, "
-                "make sure merlin is installed as a dependency."
+                "Only AnnData, MerlinData and ParquetData are supported. "
+                "If you have passed an instalce of MerlinData or ParquetData and still get this error, "
+                "make sure merlin or pyarrow is installed as a dependency."
             )
 
         categorical_covariates_info = FeatureInfoList(categorical_covariates, axis="obs", default_dim=10)
@@ -131,6 +149,85 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
 
         logger.info("The model has been initialized")
 
+    def train(
+        self,
+        *args,
+        val_every_n_steps: int | None = None,
+        async_validation: bool = False,
+        autocast_dtype: torch.dtype | None = None,
+        compile: bool = False,
+        compile_kwargs: dict | None = None,
+        n_processes: int | None = None,
+        sync_batch_norm: bool = False,
+        ddp_kwargs: dict | None = None,
+        **kwargs,
+    ):
+        """
+        Train the model.
+
+        Parameters
+        ----------
+        *args
+            Positional arguments of :meth:`scvi.model.base.UnsupervisedTrainingMixin.train`.
+        val_every_n_steps
+            Validate every `val_every_n_steps` training steps instead of every epoch.
+        async_validation
+            Run validation in a background process on a snapshot of the weights, so that training
+            does not wait for it. Requires `val_every_n_steps`. Metrics are logged with an `async_` prefix.
+            Can not be combined with early stopping or learning rate schedulers on validation metrics.
+            See :class:`~drvi.scvi_tools_based.train.AsyncValidationCallback`.
+        autocast_dtype
+            Train with mixed precision under autocast with this dtype (`torch.bfloat16` or `torch.float16`).
+            Numerically sensitive parts of the model (likelihoods, split aggregation, KL and the variance
+            activation) stay in float32. Equivalent to passing `precision="bf16-mixed"` or `"16-mixed"`.
+        compile
+            Compile the encoder and decoder networks with :func:`torch.compile` before training.
+            The model stays compiled for inference.
+            See :meth:`~drvi.scvi_tools_based.module.DRVIModule.compile_layers`.
+        compile_kwargs
+            Keyword arguments of :func:`torch.compile`.
+        n_processes
+            Train with distributed data parallelism on this many local CPU processes (gloo backend).
+            Every process loads its own shard of the data: AnnData indices and parquet row groups
+            (or merlin partitions) are partitioned by rank, so `batch_size` is the per-process batch size.
+            Processes are forked, so only the trained weights of rank 0 are returned to the model
+            and the training history is not recorded. For multi-node training, pass a DDP strategy
+            (e.g. :func:`~drvi.scvi_tools_based.train.ddp_strategy`) with `num_nodes` instead.
+        sync_batch_norm
+            Normalize with batch statistics of the global batch of all processes during distributed training.
+            If False, each process uses its local batch statistics. See
+            :func:`~drvi.nn_modules.freezable.set_batch_norm_sync`.
+        ddp_kwargs
+            Keyword arguments of :func:`~drvi.scvi_tools_based.train.ddp_strategy`.
+        **kwargs
+            Keyword arguments of :meth:`scvi.model.base.UnsupervisedTrainingMixin.train`.
+            Use `datasplitter_kwargs={"val_sub_sample_frac": ...}` to validate on a fixed subset of
+            MerlinData or ParquetData validation data.
+        """
+        if compile:
+            self.module.compile_layers(**(compile_kwargs or {}))
+        set_batch_norm_sync(self.module, sync_batch_norm)
+        if n_processes is not None and n_processes > 1:
+            kwargs.setdefault("accelerator", "cpu")
+            kwargs["devices"] = n_processes
+            kwargs["strategy"] = ddp_strategy(**(ddp_kwargs or {}))
+            # data loaders shard the data themselves
+            kwargs["use_distributed_sampler"] = False
+        if autocast_dtype is not None:
+            precisions = {torch.bfloat16: "bf16-mixed", torch.float16: "16-mixed"}
+            if autocast_dtype not in precisions:
+                raise ValueError(f"Unsupported autocast dtype {autocast_dtype}. Use torch.bfloat16 or torch.float16.")
+            kwargs["precision"] = precisions[autocast_dtype]
+        if async_validation:
+            if val_every_n_steps is None:
+                raise ValueError("`val_every_n_steps` is required for asynchronous validation.")
+            kwargs["callbacks"] = list(kwargs.get("callbacks") or []) + [AsyncValidationCallback(val_every_n_steps)]
+            kwargs["limit_val_batches"] = 0
+            kwargs.setdefault("num_sanity_val_steps", 0)
+        elif val_every_n_steps is not None:
+            kwargs["callbacks"] = list(kwargs.get("callbacks") or []) + [StepValidationCallback(val_every_n_steps)]
+        return super().train(*args, **kwargs)
+
     @classmethod
     @setup_anndata_dsp.dedent
     def setup_anndata(
@@ -174,7 +271,7 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
     @classmethod
     def setup_merlin_data(
         cls,
-        merlin_data: MerlinData,
+        merlin_data: MerlinData | ParquetData,
         labels_key: str | None = None,
         layer: str = "X",
         is_count_data: bool = True,
@@ -209,7 +306,7 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
         Parameters
         ----------
         adata
-            AnnData or MerlinData object with equivalent structure to initial AnnData.
+            AnnData, MerlinData or ParquetData object with equivalent structure to initial AnnData.
         indices
             Indices of cells in adata to use. If `None`, all cells are used.
         batch_size
@@ -222,10 +319,12 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
             Kwargs to the class-specific data loader class
         """
         if isinstance(adata, AnnData):
+            if data_loader_class is None:
+                data_loader_class = self._data_loader_cls
             return super()._make_data_loader(
                 adata, indices, batch_size, shuffle, data_loader_class, **data_loader_kwargs
             )
-        elif MerlinData is not None and isinstance(adata, MerlinData):
+        elif ParquetData is not None and isinstance(adata, ParquetData):
             adata_manager = self.get_anndata_manager(adata)
             if adata_manager is None:
                 raise AssertionError(
@@ -233,7 +332,12 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
                 )
             if batch_size is None:
                 batch_size = settings.batch_size
-            return MerlinTransformedDataLoader(
+            if data_loader_class is None:
+                if MerlinData is not None and isinstance(adata, MerlinData):
+                    data_loader_class = MerlinTransformedDataLoader
+                else:
+                    data_loader_class = ParquetDataLoader
+            return data_loader_class(
                 self.adata_manager.get_dataset("default"),
                 mapping=self.adata_manager.get_fields_schema_mapping(),
                 batch_size=batch_size,
@@ -243,7 +347,7 @@ class DRVI(VAEMixin, DRVIArchesMixin, UnsupervisedTrainingMixin, BaseModelClass,
             )
         else:
             raise ValueError(
-                "Only AnnData and MerlinData are supported. "
-                "If you have passed an instalce of MerlinData and still get this error, "
-                "make sure merlin is installed as a dependency."
+                "Only AnnData, MerlinData and ParquetData are supported. "
+                "If you have passed an instalce of MerlinData or ParquetData and still get this error, "
+                "make sure merlin or pyarrow is installed as a dependency."
             )
@@ -0,0 +1,631 @@
+import copy
+import importlib.util
+import json
+import logging
+import math
+import os
+from collections.abc import Sequence
+from typing import Literal, Optional
+
+import numpy as np
+import torch
+from scvi import REGISTRY_KEYS
+from torch import nn
+from torch.nn import functional as F
+
+import drvi
+from drvi.nn_modules.layer.linear_layer import StackedLinearLayer
+from drvi.nn_modules.layer.structures import SimpleResidual
+from drvi.nn_modules.noise_model import NormalNoiseModel
+from drvi.scvi_tools_based.nn._base_components import (
+    _LAYER_BATCH_NORM,
+    _LAYER_BATCH_PROJECTION,
+    _LAYER_EMBEDDING,
+    _LAYER_INJECT_CAT,
+    _LAYER_INJECT_LINEAR,
+    _SPLIT_AGGREGATIONS,
+    FCLayers,
+)
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILENAME = "metadata.json"
+
+# library normalizations of the noise models dividing the input by the library size or its log
+_LIBRARY_NORMALIZATIONS = {
+    "none": None,
+    "x_loglib": None,
+    "x_lib": "lib",
+    "div_lib_x_loglib": "lib",
+    "x_loglib_all": "loglib",
+}
+
+
+class FusedBlock(nn.Module):
+    """
+    A block of :class:`~drvi.scvi_tools_based.nn.FCLayers` with batch norm folded into the projection.
+
+    Covariates enter as integer codes. Their contribution to the projection is looked up from a
+    precomputed table, which covers one-hot, embedded and linearly projected covariates.
+
+    Parameters
+    ----------
+    weight
+        Projection weight of shape ``(out, in)`` or ``(n_split, in, out)`` for stacked layers.
+    bias
+        Bias of shape ``(out,)`` or ``(n_split, out)``.
+    covariate_table
+        Contribution of every category of every covariate, stacked along the first dimension.
+    covariate_offsets
+        Row of the first category of each covariate in `covariate_table`.
+    layer_norm_eps
+        Epsilon of the layer norm after the projection. No layer norm is applied if None.
+    activation
+        Activation module. No activation is applied if None.
+    """
+
+    def __init__(
+        self,
+        weight: torch.Tensor,
+        bias: torch.Tensor,
+        covariate_table: torch.Tensor,
+        covariate_offsets: torch.Tensor,
+        layer_norm_eps: float | None = None,
+        activation: nn.Module | None = None,
+    ):
+        super().__init__()
+        self.stacked = weight.dim() == 3
+        self.register_buffer("weight", weight.detach().clone().contiguous())
+        self.register_buffer("bias", bias.detach().clone().contiguous())
+        self.register_buffer("covariate_table", covariate_table.detach().clone().contiguous())
+        self.register_buffer("covariate_offsets", covariate_offsets.detach().clone().long())
+        self.has_covariates = covariate_table.shape[0] > 0
+        self.use_layer_norm = layer_norm_eps is not None
+        self.layer_norm_eps = float(layer_norm_eps or 0.0)
+        self.activation = activation if activation is not None else nn.Identity()
+
+    def forward(self, x: torch.Tensor, cat: torch.Tensor) -> torch.Tensor:
+        if self.stacked:
+            y = torch.einsum("bci,cio->bco", x, self.weight) + self.bias
+        else:
+            y = F.linear(x, self.weight, self.bias)
+        if self.has_covariates:
+            covariate_effect = self.covariate_table[cat + self.covariate_offsets].sum(dim=1)
+            if y.dim() == 3 and covariate_effect.dim() == 2:
+                covariate_effect = covariate_effect.unsqueeze(1)
+            y = y + covariate_effect
+        if self.use_layer_norm:
+            y = F.layer_norm(y, [y.shape[-1]], eps=self.layer_norm_eps)
+        return self.activation(y)
+
+
+class FusedFCLayers(nn.Module):
+    """Inference-only equivalent of :class:`~drvi.scvi_tools_based.nn.FCLayers` made of :class:`FusedBlock`."""
+
+    def __init__(self, blocks: Sequence[FusedBlock]):
+        super().__init__()
+        self.blocks = nn.ModuleList(blocks)
+
+    def forward(self, x: torch.Tensor, cat: torch.Tensor) -> torch.Tensor:
+        for block in self.blocks:
+            x = block(x, cat)
+        return x
+
+
+def _projection_weight(layer: nn.Module) -> tuple[torch.Tensor, torch.Tensor]:
+    """Weight and bias of a projection layer with residual connections folded in."""
+    residual = isinstance(layer, SimpleResidual)
+    if residual:
+        layer = layer.layer
+    if isinstance(layer, nn.Linear):
+        weight = layer.weight.detach().clone()
+        bias = layer.bias.detach().clone() if layer.bias is not None else torch.zeros(weight.shape[0])
+        if residual:
+            weight += torch.eye(weight.shape[0], dtype=weight.dtype)
+    elif isinstance(layer, StackedLinearLayer):
+        weight = layer.weight.detach().clone()
+        bias = (
+            layer.bias.detach().clone()
+            if layer.bias is not None
+            else torch.zeros(weight.shape[0], weight.shape[2], dtype=weight.dtype)
+        )
+        if residual:
+            weight += torch.eye(weight.shape[1], dtype=weight.dtype).unsqueeze(0)
+    else:
+        raise NotImplementedError(f"Exporting {layer.__class__.__name__} layers is not supported.")
+    return weight, bias
+
+
+def _covariate_tables(
+    weight: torch.Tensor, covariate_vectors: Sequence[torch.Tensor], start: int
+) -> list[torch.Tensor]:
+    """Contribution of every category of each covariate given the covariate columns of a projection weight."""
+    tables = []
+    for vectors in covariate_vectors:
+        dim = vectors.shape[1]
+        if weight.dim() == 2:
+            tables.append(vectors @ weight[:, start : start + dim].T)
+        else:
+            tables.append(torch.einsum("nd,cdo->nco", vectors, weight[:, start : start + dim, :]))
+        start += dim
+    return tables
+
+
+def _fold_batch_norm(weight, bias, tables, batch_norm):
+    """Fold an eval mode batch norm following a projection into its weight, bias and covariate tables."""
+    if batch_norm.running_mean is None:
+        raise NotImplementedError("Batch norm layers without running statistics can not be folded.")
+    scale = 1.0 / torch.sqrt(batch_norm.running_var + batch_norm.eps)
+    shift = -batch_norm.running_mean * scale
+    if batch_norm.affine:
+        scale = scale * batch_norm.weight.detach()
+        shift = shift * batch_norm.weight.detach() + batch_norm.bias.detach()
+
+    n_out = bias.shape[-1]
+    n_split = batch_norm.num_features // n_out
+    if n_split > 1 and weight.dim() == 2:
+        # shared weights with split-wise normalization become stacked weights
+        weight = weight.T.unsqueeze(0).expand(n_split, -1, -1).clone()
+        bias = bias.unsqueeze(0).expand(n_split, -1).clone()
+        tables = [table.unsqueeze(1).expand(-1, n_split, -1).clone() for table in tables]
+    if weight.dim() == 3:
+        scale = scale.reshape(weight.shape[0], n_out)
+        shift = shift.reshape(weight.shape[0], n_out)
+        weight = weight * scale.unsqueeze(1)
+    else:
+        weight = weight * scale.unsqueeze(1)
+    bias = bias * scale + shift
+    tables = [table * scale for table in tables]
+    return weight, bias, tables
+
+
+@torch.no_grad()
+def fuse_fc_layers(fc_layers: FCLayers, covariate_vectors: Sequence[torch.Tensor] = ()) -> FusedFCLayers:
+    """
+    Convert eval mode :class:`~drvi.scvi_tools_based.nn.FCLayers` to :class:`FusedFCLayers`.
+
+    Parameters
+    ----------
+    fc_layers
+        The layers to convert.
+    covariate_vectors
+        Vector of every category of each covariate as the layers receive them
+        (identity matrices for one-hot covariates, embeddings for shared embeddings).
+        Ignored for layers with their own covariate embeddings.
+
+    Returns
+    -------
+    FusedFCLayers
+        Layers computing the same function in eval mode.
+    """
+    blocks = []
+    for layers, layer_kinds in zip(fc_layers.fc_layers, fc_layers._layer_kinds, strict=True):
+        block_vectors = list(covariate_vectors)
+        weight = bias = projection = None
+        tables = []
+        layer_norm_eps = None
+        activation = None
+        for layer, layer_kind in zip(layers, layer_kinds, strict=True):
+            if layer_kind == _LAYER_EMBEDDING:
+                if layer.normalization is not None:
+                    raise NotImplementedError("Exporting normalized covariate embeddings is not supported.")
+                block_vectors = [emb(torch.arange(emb.num_embeddings)) for emb in layer.emb_list]
+            elif layer_kind == _LAYER_BATCH_PROJECTION:
+                projection = layer
+            elif layer_kind == _LAYER_BATCH_NORM:
+                weight, bias, tables = _fold_batch_norm(weight, bias, tables, layer)
+            elif weight is None:
+                weight, bias = _projection_weight(layer)
+                if layer_kind == _LAYER_INJECT_CAT:
+                    n_covariate_dims = sum(vectors.shape[1] for vectors in block_vectors)
+                    n_in = weight.shape[1] - n_covariate_dims
+                    tables = _covariate_tables(weight, block_vectors, start=n_in)
+                    weight = weight[:, :n_in] if weight.dim() == 2 else weight[:, :n_in, :]
+                elif layer_kind == _LAYER_INJECT_LINEAR:
+                    projection_weight, _ = _projection_weight(projection)
+                    tables = _covariate_tables(projection_weight, block_vectors, start=0)
+            elif isinstance(layer, nn.LayerNorm):
+                layer_norm_eps = layer.eps
+            elif isinstance(layer, nn.Dropout):
+                continue
+            else:
+                activation = copy.deepcopy(layer)
+
+        if len(tables) > 0:
+            offsets = np.cumsum([0] + [len(table) for table in tables[:-1]])
+            covariate_table = torch.cat(tables, dim=0)
+        else:
+            offsets = np.zeros(0)
+            covariate_table = torch.zeros((0, *bias.shape), dtype=bias.dtype)
+        blocks.append(
+            FusedBlock(
+                weight,
+                bias,
+                covariate_table,
+                torch.as_tensor(offsets, dtype=torch.long),
+                layer_norm_eps=layer_norm_eps,
+                activation=activation,
+            )
+        )
+    return FusedFCLayers(blocks)
+
+
+class ExportedEncoder(nn.Module):
+    """
+    Self-contained DRVI encoder mapping counts to the mean of the latent distribution.
+
+    Parameters
+    ----------
+    encoder
+        Fused hidden layers of the encoder, or None if the encoder has no hidden layers.
+    mean_encoder
+        Fused output layer for the latent mean.
+    library_normalization
+        Library size normalization of the input, see :mod:`drvi.nn_modules.noise_model`.
+    log1p
+        Whether the input is log transformed after normalization.
+    n_continuous_cov
+        Number of continuous covariates the encoder takes.
+    """
+
+    def __init__(
+        self,
+        encoder: FusedFCLayers | None,
+        mean_encoder: FusedFCLayers,
+        library_normalization: str = "none",
+        log1p: bool = True,
+        n_continuous_cov: int = 0,
+    ):
+        super().__init__()
+        self.has_encoder = encoder is not None
+        self.encoder = encoder if encoder is not None else FusedFCLayers([])
+        self.mean_encoder = mean_encoder
+        self.divide_by_library = _LIBRARY_NORMALIZATIONS[library_normalization] == "lib"
+        self.divide_by_log_library = _LIBRARY_NORMALIZATIONS[library_normalization] == "loglib"
+        self.log1p = log1p
+        self.n_continuous_cov = n_continuous_cov
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        cat: torch.Tensor,
+        cont: Optional[torch.Tensor] = None,  # noqa: UP007 (TorchScript does not support `X | None`)
+    ) -> torch.Tensor:
+        if self.divide_by_library:
+            x = x / x.sum(dim=-1, keepdim=True) * 1e4
+        elif self.divide_by_log_library:
+            x = x / torch.log(x.sum(dim=-1, keepdim=True)) * 1e1
+        if self.log1p:
+            x = torch.log1p(x)
+        if self.n_continuous_cov > 0 and cont is not None:
+            x = torch.cat((x, cont), dim=-1)
+        if self.has_encoder:
+            x = self.encoder(x, cat)
+        return self.mean_encoder(x, cat)
+
+
+class ExportedDecoder(nn.Module):
+    """
+    Self-contained DRVI decoder mapping latent samples to the (aggregated) mean parameter of the likelihood.
+
+    This matches :meth:`~drvi.model.DRVI.decode_latent_samples`.
+    """
+
+    def __init__(
+        self,
+        shared_decoder: FusedFCLayers | None,
+        mean_decoder: FusedFCLayers,
+        n_split: int,
+        split_method: str,
+        split_aggregation: str,
+        split_transformation: nn.Module | None = None,
+        split_transformation_weight: torch.Tensor | None = None,
+        n_continuous_cov: int = 0,
+    ):
+        super().__init__()
+        self.has_shared_decoder = shared_decoder is not None
+        self.shared_decoder = shared_decoder if shared_decoder is not None else FusedFCLayers([])
+        self.mean_decoder = mean_decoder
+        self.n_split = n_split
+        self.split_power = split_method == "power"
+        self.split_map = split_method == "split_map"
+        self.split_transformation = split_transformation if split_transformation is not None else nn.Identity()
+        if split_transformation_weight is None:
+            split_transformation_weight = torch.zeros(0)
+        self.register_buffer("split_transformation_weight", split_transformation_weight.detach().clone())
+        if split_aggregation not in _SPLIT_AGGREGATIONS:
+            raise NotImplementedError()
+        self.aggregate_sum = split_aggregation == "sum"
+        self.aggregate_logsumexp = split_aggregation == "logsumexp"
+        self.log_n_split = math.log(max(n_split, 1))
+        self.n_continuous_cov = n_continuous_cov
+
+    def forward(
+        self,
+        z: torch.Tensor,
+        cat: torch.Tensor,
+        cont: Optional[torch.Tensor] = None,  # noqa: UP007 (TorchScript does not support `X | None`)
+    ) -> torch.Tensor:
+        batch_size = z.shape[0]
+        if self.n_split > 1:
+            if self.split_power:
+                z = self.split_transformation(z)
+            z = torch.reshape(z, (batch_size, self.n_split, -1))
+            if self.split_map:
+                z = torch.einsum("bsd,sdn->bsn", z, self.split_transformation_weight)
+        if self.n_continuous_cov > 0 and cont is not None:
+            if self.n_split > 1:
+                cont = cont.unsqueeze(1).expand(-1, self.n_split, -1)
+            z = torch.cat((z, cont), dim=-1)
+        if self.has_shared_decoder:
+            z = self.shared_decoder(z, cat)
+        mean = self.mean_decoder(z, cat)
+        if self.n_split > 1:
+            if self.aggregate_sum:
+                mean = mean.sum(dim=-2) / self.n_split
+            elif self.aggregate_logsumexp:
+                mean = torch.logsumexp(mean, dim=-2) - self.log_n_split
+            else:
+                mean = torch.amax(mean, dim=-2)
+        return mean
+
+
+def _covariate_vectors(module, n_cats_per_cov) -> list[torch.Tensor]:
+    if module.shared_covariate_emb is not None:
+        if module.shared_covariate_emb.normalization is not None:
+            raise NotImplementedError("Exporting normalized covariate embeddings is not supported.")
+        return [emb(torch.arange(emb.num_embeddings)) for emb in module.shared_covariate_emb.emb_list]
+    return [torch.eye(n_cat) for n_cat in n_cats_per_cov]
+
+
+@torch.no_grad()
+def build_exported_modules(module) -> tuple[ExportedEncoder, ExportedDecoder]:
+    """
+    Build the fused, inference-only encoder and decoder of a :class:`~drvi.scvi_tools_based.module.DRVIModule`.
+
+    Parameters
+    ----------
+    module
+        The DRVI module. It is copied to CPU and not changed.
+
+    Returns
+    -------
+    tuple
+        The exported encoder and decoder in eval mode.
+    """
+    module = copy.deepcopy(module).cpu().eval()
+    covariate_vectors = _covariate_vectors(module, module.n_cats_per_cov)
+    noise_model = module.gene_likelihood_module
+
+    z_encoder = module.z_encoder
+    encoder_vectors = covariate_vectors if module.encode_covariates else []
+    encoder = ExportedEncoder(
+        fuse_fc_layers(z_encoder.encoder, encoder_vectors) if z_encoder.encoder is not None else None,
+        fuse_fc_layers(z_encoder.mean_encoder, encoder_vectors),
+        library_normalization=getattr(noise_model, "library_normalization", "none"),
+        log1p=not isinstance(noise_model, NormalNoiseModel),
+        n_continuous_cov=module.n_continuous_cov if module.encode_covariates else 0,
+    )
+
+    decoder_module = module.decoder
+    decoder = ExportedDecoder(
+        fuse_fc_layers(decoder_module.px_shared_decoder, covariate_vectors)
+        if decoder_module.px_shared_decoder is not None
+        else None,
+        fuse_fc_layers(decoder_module.params_nets["mean"], covariate_vectors),
+        n_split=decoder_module.n_split,
+        split_method=decoder_module.split_method,
+        split_aggregation=decoder_module.split_aggregation,
+        split_transformation=copy.deepcopy(getattr(decoder_module, "split_transformation", None)),
+        split_transformation_weight=getattr(decoder_module, "split_transformation_weight", None),
+        n_continuous_cov=module.n_continuous_cov,
+    )
+    return encoder.eval(), decoder.eval()
+
+
+def _export_metadata(model) -> dict:
+    categorical_covariates = {}
+    if REGISTRY_KEYS.CAT_COVS_KEY in model.adata_manager.data_registry:
+        state = model.adata_manager.get_state_registry(REGISTRY_KEYS.CAT_COVS_KEY)
+        categorical_covariates = {key: [str(c) for c in state.mappings[key]] for key in state.field_keys}
+    continuous_covariates = []
+    if REGISTRY_KEYS.CONT_COVS_KEY in model.adata_manager.data_registry:
+        continuous_covariates = list(model.adata_manager.get_state_registry(REGISTRY_KEYS.CONT_COVS_KEY).columns)
+    var_names = getattr(model.adata, "var_names", None)
+    return {
+        "drvi_version": drvi.__version__,
+        "n_vars": int(model.summary_stats["n_vars"]),
+        "n_latent": int(model.module.n_latent),
+        "var_names": [str(v) for v in var_names] if var_names is not None else None,
+        "categorical_covariates": categorical_covariates,
+        "continuous_covariates": continuous_covariates,
+        "encode_covariates": bool(model.module.encode_covariates),
+    }
+
+
+def export_model(
+    model,
+    path: str,
+    format: Literal["torchscript", "onnx"] = "torchscript",
+    include_decoder: bool = True,
+    opset_version: int = 17,
+) -> str:
+    """
+    Export a trained DRVI model as self-contained encoder (and decoder) artifacts for serving.
+
+    Batch norm layers and residual connections are folded into the linear weights, covariate one-hot
+    encodings and embeddings become lookup tables and the input transformation of the noise model is
+    part of the encoder. Layer norms have no running statistics and are kept as operations.
+    The artifacts take dense counts and integer covariate codes and do not depend on scvi-tools,
+    lightning or AnnData; :class:`DRVIRuntime` is a small loader for them.
+
+    Parameters
+    ----------
+    model
+        Trained DRVI model.
+    path
+        Directory to write `encoder.pt` / `encoder.onnx`, the decoder and `metadata.json` to.
+    format
+        'torchscript' or 'onnx'.
+    include_decoder
+        Whether to also export the decoder.
+    opset_version
+        ONNX opset version.
+
+    Returns
+    -------
+    str
+        The output path.
+    """
+    encoder, decoder = build_exported_modules(model.module)
+    metadata = _export_metadata(model)
+    metadata["format"] = format
+    metadata["include_decoder"] = include_decoder
+    os.makedirs(path, exist_ok=True)
+
+    n_cat = len(metadata["categorical_covariates"])
+    n_cont = len(metadata["continuous_covariates"])
+    example_cat = torch.zeros((2, n_cat), dtype=torch.long)
+    example_cont = torch.zeros((2, n_cont)) if n_cont > 0 else None
+    examples = {
+        "encoder": (encoder, torch.ones((2, metadata["n_vars"]))),
+        "decoder": (decoder, torch.zeros((2, metadata["n_latent"]))),
+    }
+    if not include_decoder:
+        del examples["decoder"]
+
+    for name, (exported_module, example_input) in examples.items():
+        if format == "torchscript":
+            scripted = torch.jit.script(exported_module)
+            torch.jit.save(
+                scripted, os.path.join(path, f"{name}.pt"), _extra_files={METADATA_FILENAME: json.dumps(metadata)}
+            )
+        elif format == "onnx":
+            args = (example_input, example_cat) + ((example_cont,) if example_cont is not None else ())
+            input_names = ["input", "cat"] + (["cont"] if example_cont is not None else [])
+            torch.onnx.export(
+                exported_module,
+                args,
+                os.path.join(path, f"{name}.onnx"),
+                input_names=input_names,
+                output_names=["output"],
+                dynamic_axes={key: {0: "batch"} for key in [*input_names, "output"]},
+                opset_version=opset_version,
+            )
+        else:
+            raise ValueError(f"Unknown export format {format}.")
+
+    with open(os.path.join(path, METADATA_FILENAME), "w") as f:
+        json.dump(metadata, f)
+    logger.info(f"Exported DRVI model to {path}")
+    return path
+
+
+class DRVIRuntime:
+    """
+    Minimal runtime for models exported with :func:`export_model`.
+
+    Only numpy and torch (or onnxruntime for ONNX artifacts) are used to run the model.
+
+    Parameters
+    ----------
+    path
+        Directory of the exported model.
+    n_threads
+        Number of intra-op threads. Defaults to the torch or onnxruntime default.
+    """
+
+    def __init__(self, path: str, n_threads: int | None = None):
+        with open(os.path.join(path, METADATA_FILENAME)) as f:
+            self.metadata = json.load(f)
+        self.format = self.metadata["format"]
+        self._category_codes = {
+            key: {category: code for code, category in enumerate(categories)}
+            for key, categories in self.metadata["categorical_covariates"].items()
+        }
+        names = ["encoder", "decoder"] if self.metadata.get("include_decoder", True) else ["encoder"]
+        if self.format == "torchscript":
+            if n_threads is not None:
+                torch.set_num_threads(n_threads)
+            self._modules = {name: torch.jit.load(os.path.join(path, f"{name}.pt")).eval() for name in names}
+        elif self.format == "onnx":
+            if not importlib.util.find_spec("onnxruntime"):
+                raise ImportError("Running ONNX artifacts requires onnxruntime.")
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            if n_threads is not None:
+                options.intra_op_num_threads = n_threads
+            self._modules = {
+                name: onnxruntime.InferenceSession(os.path.join(path, f"{name}.onnx"), options) for name in names
+            }
+        else:
+            raise ValueError(f"Unknown export format {self.format}.")
+
+    def _encode_covariates(self, categorical_covariates, n_obs: int) -> np.ndarray:
+        keys = list(self.metadata["categorical_covariates"])
+        if categorical_covariates is None:
+            if len(keys) > 0:
+                raise ValueError(f"Categorical covariates {keys} are required.")
+            return np.zeros((n_obs, 0), dtype=np.int64)
+        if isinstance(categorical_covariates, dict):
+            return np.stack(
+                [
+                    np.array([self._category_codes[key][str(value)] for value in categorical_covariates[key]])
+                    for key in keys
+                ],
+                axis=1,
+            ).astype(np.int64)
+        return np.asarray(categorical_covariates, dtype=np.int64).reshape(n_obs, len(keys))
+
+    def _run(self, name: str, data: np.ndarray, cat: np.ndarray, cont: np.ndarray | None, batch_size: int):
+        outputs = []
+        for start in range(0, data.shape[0], batch_size):
+            batch = data[start : start + batch_size]
+            batch = np.asarray(batch.toarray() if hasattr(batch, "toarray") else batch, dtype=np.float32)
+            args = [batch, cat[start : start + batch_size]]
+            if cont is not None:
+                args.append(np.asarray(cont[start : start + batch_size], dtype=np.float32))
+            if self.format == "torchscript":
+                with torch.inference_mode():
+                    outputs.append(self._modules[name](*[torch.from_numpy(arg) for arg in args]).numpy())
+            else:
+                session = self._modules[name]
+                feeds = {inp.name: arg for inp, arg in zip(session.get_inputs(), args, strict=False)}
+                outputs.append(session.run(None, feeds)[0])
+        return np.concatenate(outputs, axis=0)
+
+    def get_latent_representation(
+        self,
+        x,
+        categorical_covariates: dict | np.ndarray | None = None,
+        continuous_covariates: np.ndarray | None = None,
+        batch_size: int = 1024,
+    ) -> np.ndarray:
+        """
+        Return the mean of the latent distribution (`qz_m`) of cells.
+
+        Parameters
+        ----------
+        x
+            Count matrix (dense or scipy sparse) with the genes of `metadata["var_names"]` in order.
+        categorical_covariates
+            Dict of covariate labels per covariate key or an array of integer codes (n_cells x n_covariates).
+        continuous_covariates
+            Continuous covariates (n_cells x n_continuous_covariates).
+        batch_size
+            Number of cells per forward pass.
+        """
+        cat = self._encode_covariates(categorical_covariates, x.shape[0])
+        return self._run("encoder", x, cat, continuous_covariates, batch_size)
+
+    def decode_latent_samples(
+        self,
+        z: np.ndarray,
+        categorical_covariates: dict | np.ndarray | None = None,
+        continuous_covariates: np.ndarray | None = None,
+        batch_size: int = 1024,
+    ) -> np.ndarray:
+        """Return the mean parameter of the likelihood for latent samples, as :meth:`DRVI.decode_latent_samples`."""
+        cat = self._encode_covariates(categorical_covariates, z.shape[0])
+        return self._run("decoder", np.asarray(z, dtype=np.float32), cat, continuous_covariates, batch_size)
@@ -0,0 +1,316 @@
+import copy
+import io
+import logging
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+import torch
+from anndata import AnnData
+from scvi import REGISTRY_KEYS
+from torch import nn
+
+from drvi.nn_modules.layer.linear_layer import QuantizedStackedLinearLayer, StackedLinearLayer
+from drvi.scvi_tools_based.train._benchmark import _clone_batch, _time_module
+
+logger = logging.getLogger(__name__)
+
+_QUANTIZABLE_PARTS = {"encoder": "z_encoder", "decoder": "decoder"}
+
+
+def quantizable_layers(module, parts: Sequence[str] = ("encoder", "decoder")) -> list[str]:
+    """
+    Names of the linear and stacked linear layers of the encoder and / or decoder of a DRVI module.
+
+    Parameters
+    ----------
+    module
+        DRVI module.
+    parts
+        Parts of the module to look into: 'encoder' and / or 'decoder'.
+    """
+    names = []
+    for part in parts:
+        prefix = _QUANTIZABLE_PARTS[part]
+        for name, layer in module.get_submodule(prefix).named_modules():
+            if isinstance(layer, nn.Linear | StackedLinearLayer):
+                names.append(f"{prefix}.{name}")
+    return names
+
+
+def quantize_module(module, layers: Sequence[str] | None = None, per_channel: bool = True):
+    """
+    Return an int8 quantized copy of a DRVI module.
+
+    Weights of the selected layers are stored in int8. Linear layers are dynamically quantized
+    (activations are quantized on the fly). Stacked linear layers of the splits keep float activations
+    and compute all splits in one batched multiplication
+    (see :class:`~drvi.nn_modules.layer.linear_layer.QuantizedStackedLinearLayer`).
+    The copy lives on CPU, in eval mode, as quantized kernels are CPU only.
+
+    Parameters
+    ----------
+    module
+        DRVI module. It is not changed.
+    layers
+        Names of the layers to quantize (see :func:`quantizable_layers`).
+        All linear layers of the encoder and the decoder by default.
+    per_channel
+        Whether to quantize weights per output feature instead of per tensor.
+
+    Returns
+    -------
+    The quantized module.
+    """
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+    from torch.ao.quantization import default_dynamic_qconfig, per_channel_dynamic_qconfig
+
+    module = copy.deepcopy(module).cpu().eval()
+    qconfig = per_channel_dynamic_qconfig if per_channel else default_dynamic_qconfig
+    for name in layers if layers is not None else quantizable_layers(module):
+        parent_name, _, child_name = name.rpartition(".")
+        parent = module.get_submodule(parent_name)
+        layer = parent.get_submodule(child_name)
+        if isinstance(layer, StackedLinearLayer):
+            quantized_layer = QuantizedStackedLinearLayer.from_float(layer, per_channel=per_channel)
+        elif isinstance(layer, nn.Linear):
+            layer.qconfig = qconfig
+            quantized_layer = DynamicQuantizedLinear.from_float(layer)
+        else:
+            raise NotImplementedError(f"Quantizing {layer.__class__.__name__} layers is not supported.")
+        setattr(parent, child_name, quantized_layer)
+    return module
+
+
+def quantize_model(model, layers: Sequence[str] | None = None, per_channel: bool = True):
+    """
+    Return a copy of a DRVI model with an int8 dynamically quantized module for CPU inference.
+
+    The copy shares the registered data and the training history with `model`.
+    Inference methods such as :meth:`~drvi.model.DRVI.get_latent_representation` work as usual.
+
+    Parameters
+    ----------
+    model
+        Trained DRVI model. It is not changed.
+    layers
+        Names of the layers to quantize, for example the rows of :func:`calibrate_quantization`
+        marked to quantize. All linear layers of the encoder and the decoder by default.
+    per_channel
+        Whether to quantize weights per output feature instead of per tensor.
+    """
+    quantized_model = copy.copy(model)
+    quantized_model.module = quantize_module(model.module, layers=layers, per_channel=per_channel)
+    return quantized_model
+
+
+def _sample_batches(model, adata, n_cells, batch_size, seed) -> list[dict]:
+    adata = model._validate_anndata(adata)
+    n_cells = min(n_cells, adata.n_obs)
+    indices = np.sort(np.random.default_rng(seed).choice(adata.n_obs, n_cells, replace=False))
+    data_loader = model._make_data_loader(adata=adata, indices=indices, batch_size=batch_size, shuffle=False)
+    return [_clone_batch(batch) for batch in data_loader]
+
+
+@torch.inference_mode()
+def _evaluate(module, batches) -> tuple[np.ndarray, np.ndarray]:
+    """Per cell reconstruction loss with the latent mean as sample, and latent means."""
+    device = next(module.parameters()).device
+    module.eval()
+    fully_deterministic = module.fully_deterministic
+    module.fully_deterministic = True
+    reconstruction_losses, latents = [], []
+    try:
+        for batch in batches:
+            batch = {key: value.to(device) if torch.is_tensor(value) else value for key, value in batch.items()}
+            inference_outputs, generative_outputs = module(batch, compute_loss=False)
+            x = batch[REGISTRY_KEYS.X_KEY]
+            reconstruction_losses.append(-generative_outputs["px"].log_prob(x).sum(dim=-1).float().cpu())
+            latents.append(inference_outputs["qz_m"].float().cpu())
+    finally:
+        module.fully_deterministic = fully_deterministic
+    return torch.cat(reconstruction_losses).numpy(), torch.cat(latents).numpy()
+
+
+def _latent_correlations(latent: np.ndarray, other_latent: np.ndarray) -> np.ndarray:
+    """Pearson correlation of each latent dimension between two representations."""
+    latent = latent - latent.mean(axis=0)
+    other_latent = other_latent - other_latent.mean(axis=0)
+    norm = np.sqrt((latent**2).sum(axis=0) * (other_latent**2).sum(axis=0))
+    return (latent * other_latent).sum(axis=0) / np.maximum(norm, 1e-12)
+
+
+def _serialized_size(module) -> int:
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
+
+
+def _compare(reference, quantized) -> dict:
+    reconstruction_loss, latent = reference
+    quantized_reconstruction_loss, quantized_latent = quantized
+    correlations = _latent_correlations(latent, quantized_latent)
+    delta = float(quantized_reconstruction_loss.mean() - reconstruction_loss.mean())
+    return {
+        "reconstruction_loss": float(reconstruction_loss.mean()),
+        "quantized_reconstruction_loss": float(quantized_reconstruction_loss.mean()),
+        "reconstruction_loss_delta": delta,
+        "relative_reconstruction_loss_delta": delta / abs(float(reconstruction_loss.mean())),
+        "latent_correlation": float(correlations.mean()),
+        "min_latent_correlation": float(correlations.min()),
+    }
+
+
+def calibrate_quantization(
+    model,
+    adata: AnnData | None = None,
+    n_cells: int = 1000,
+    batch_size: int = 256,
+    layers: Sequence[str] | None = None,
+    tolerance: float = 0.01,
+    per_channel: bool = True,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Measure the sensitivity of the model to quantizing each layer on a sample of cells.
+
+    Each layer is quantized on its own and the change in reconstruction loss and latent representation
+    is measured against the float model.
+
+    Parameters
+    ----------
+    model
+        Trained DRVI model.
+    adata
+        Data to sample cells from. Defaults to the data used to initialize the model.
+    n_cells
+        Number of cells to sample.
+    batch_size
+        Mini-batch size.
+    layers
+        Layers to calibrate. All linear layers of the encoder and the decoder by default.
+    tolerance
+        Maximum relative increase of the reconstruction loss of a layer to be marked for quantization.
+    per_channel
+        Whether to quantize weights per output feature instead of per tensor.
+    seed
+        Seed of the cell sampling.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per layer with its number of weights, the metrics of :func:`quantization_report`
+        and a boolean `quantize` column, sorted from the most to the least sensitive layer.
+    """
+    batches = _sample_batches(model, adata, n_cells, batch_size, seed)
+    float_module = copy.deepcopy(model.module).cpu()
+    reference = _evaluate(float_module, batches)
+    results = []
+    for name in layers if layers is not None else quantizable_layers(float_module):
+        quantized_module = quantize_module(float_module, layers=[name], per_channel=per_channel)
+        results.append(
+            {
+                "layer": name,
+                "n_weights": float_module.get_submodule(name).weight.numel(),
+                **_compare(reference, _evaluate(quantized_module, batches)),
+            }
+        )
+    results = pd.DataFrame(results).set_index("layer")
+    results["quantize"] = results["relative_reconstruction_loss_delta"] <= tolerance
+    return results.sort_values("relative_reconstruction_loss_delta", ascending=False)
+
+
+def quantization_report(
+    model,
+    quantized_model,
+    adata: AnnData | None = None,
+    n_cells: int = 1000,
+    batch_size: int = 256,
+    seed: int = 0,
+) -> dict:
+    """
+    Compare a quantized model to the float model on a sample of cells.
+
+    Parameters
+    ----------
+    model
+        Float DRVI model.
+    quantized_model
+        Model returned by :func:`quantize_model`.
+    adata
+        Data to sample cells from. Defaults to the data used to initialize the model.
+    n_cells
+        Number of cells to sample.
+    batch_size
+        Mini-batch size.
+    seed
+        Seed of the cell sampling.
+
+    Returns
+    -------
+    dict
+        Mean reconstruction loss of both models (using the latent mean as sample), its absolute and
+        relative delta, the mean and minimum correlation of latent dimensions and the serialized size
+        of both modules in bytes. The size is the storage of the weights. At runtime, quantized stacked layers
+        only hold float weights of a few channels at a time, and dequantizing them adds compute
+        (see :class:`~drvi.nn_modules.layer.linear_layer.QuantizedStackedLinearLayer`).
+    """
+    batches = _sample_batches(model, adata, n_cells, batch_size, seed)
+    float_module = copy.deepcopy(model.module).cpu()
+    report = _compare(_evaluate(float_module, batches), _evaluate(quantized_model.module, batches))
+    report["size_bytes"] = _serialized_size(float_module)
+    report["quantized_size_bytes"] = _serialized_size(quantized_model.module)
+    logger.info(
+        f"Quantization changes the reconstruction loss by {report['relative_reconstruction_loss_delta']:.2%} "
+        f"with a latent correlation of {report['latent_correlation']:.4f}."
+    )
+    return report
+
+
+def benchmark_quantization(
+    model,
+    quantized_model,
+    adata: AnnData | None = None,
+    batch_size: int = 256,
+    n_batches: int = 20,
+    n_warmup: int = 3,
+) -> pd.DataFrame:
+    """
+    Compare CPU inference step times of the float and the quantized model.
+
+    Parameters
+    ----------
+    model
+        Float DRVI model.
+    quantized_model
+        Model returned by :func:`quantize_model`.
+    adata
+        Data to take the mini-batches from. Defaults to the data used to initialize the model.
+    batch_size
+        Mini-batch size.
+    n_batches
+        Number of mini-batches per measurement.
+    n_warmup
+        Number of steps run after the first step before timing.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per variant ('float' and 'quantized') with seconds per step, cells per second
+        and the speedup over the float model.
+    """
+    adata = model._validate_anndata(adata)
+    batches = []
+    for batch in model._make_data_loader(adata=adata, batch_size=batch_size, shuffle=False):
+        batches.append(_clone_batch(batch))
+        if len(batches) >= n_batches:
+            break
+    n_cells = sum(len(batch[REGISTRY_KEYS.X_KEY]) for batch in batches) / len(batches)
+
+    results = []
+    for variant, module in [("float", copy.deepcopy(model.module).cpu()), ("quantized", quantized_model.module)]:
+        _, step_time = _time_module(module, batches, train=False, n_warmup=n_warmup)
+        results.append({"variant": variant, "sec_per_step": step_time, "cells_per_sec": n_cells / step_time})
+    results = pd.DataFrame(results)
+    results["speedup"] = results["sec_per_step"].iloc[0] / results["sec_per_step"]
+    return results
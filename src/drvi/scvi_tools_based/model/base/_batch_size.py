@@ -0,0 +1,155 @@
+import logging
+import os
+
+import torch
+from torch import nn
+
+from drvi.nn_modules.layer.linear_layer import StackedLinearLayer
+
+logger = logging.getLogger(__name__)
+
+# Fraction of the available memory used for inference when no budget is given
+DEFAULT_MEMORY_FRACTION = 0.5
+# Inference keeps a few temporaries alive next to the tensors we count (e.g. distribution params, effects)
+_TEMPORARY_OVERHEAD = 2.0
+
+
+def _layer_output_features(module: nn.Module) -> list[int]:
+    """Number of output features of each projection layer in a module (per split for stacked layers)."""
+    output = []
+    for layer in module.modules():
+        if isinstance(layer, nn.Linear | StackedLinearLayer):
+            output.append(layer.out_features)
+    return output
+
+
+def estimate_memory_per_cell(module: nn.Module, include_encoder: bool = True, include_decoder: bool = True) -> int:
+    """Estimate the peak memory needed per cell when running a DRVIModule in inference mode.
+
+    Parameters
+    ----------
+    module
+        DRVIModule instance.
+    include_encoder
+        Whether the encoder is run.
+    include_decoder
+        Whether the decoder and the likelihood are run.
+
+    Returns
+    -------
+    int
+        Estimated number of bytes per cell.
+    """
+    n_genes = module.decoder.n_output
+    n_split = max(module.decoder.n_split, 1)
+    element_size = next(module.parameters()).element_size()
+
+    # input, transformed input and reconstruction target
+    n_floats = 3 * n_genes
+    if include_encoder:
+        n_floats += sum(_layer_output_features(module.z_encoder))
+    if include_decoder:
+        if module.decoder.px_shared_decoder is not None:
+            n_floats += n_split * sum(_layer_output_features(module.decoder.px_shared_decoder))
+        n_params = len(module.gene_likelihood_module.parameters)
+        # per-split params, aggregated params and distribution params
+        n_floats += n_params * (n_split + 2) * n_genes
+    return int(n_floats * element_size * _TEMPORARY_OVERHEAD)
+
+
+def available_memory(device: torch.device) -> int:
+    """Available memory on the given device in bytes."""
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def _probe_memory_per_cell(module: nn.Module, device: torch.device, probe_sizes: tuple[int, int]) -> int | None:
+    """Measure memory per cell of the decoder by running it on two batch sizes. Only supported on CUDA."""
+    if device.type != "cuda":
+        return None
+    peaks = []
+    for size in probe_sizes:
+        z = torch.zeros(size, module.n_latent, device=device)
+        library = torch.full((size,), 1e4, device=device)
+        cat_covs = None
+        if len(module.n_cats_per_cov) > 0:
+            cat_covs = torch.zeros(size, len(module.n_cats_per_cov), device=device)
+        cont_covs = None
+        if module.n_continuous_cov > 0:
+            cont_covs = torch.zeros(size, module.n_continuous_cov, device=device)
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        baseline = torch.cuda.memory_allocated(device)
+        with torch.inference_mode():
+            module.generative(z, library, {}, cont_covs=cont_covs, cat_covs=cat_covs)
+        torch.cuda.synchronize(device)
+        peaks.append(torch.cuda.max_memory_allocated(device) - baseline)
+    return max(int((peaks[1] - peaks[0]) / (probe_sizes[1] - probe_sizes[0])), 1)
+
+
+def autotune_batch_size(
+    module: nn.Module,
+    memory_budget: int | float | None = None,
+    include_encoder: bool = True,
+    include_decoder: bool = True,
+    min_batch_size: int = 16,
+    max_batch_size: int = 2**16,
+    probe_sizes: tuple[int, int] = (16, 64),
+) -> int:
+    """Pick the largest inference batch size that fits the memory budget.
+
+    Memory per cell is estimated from the number of splits, the layer dims and the number of genes.
+    On CUDA the estimate of the decoder is replaced by a measurement on two probe batch sizes.
+
+    Parameters
+    ----------
+    module
+        DRVIModule instance.
+    memory_budget
+        Memory budget. Values in (0, 1] are interpreted as a fraction of the available memory,
+        larger values as a number of bytes. Defaults to half of the available memory.
+    include_encoder
+        Whether the encoder is run.
+    include_decoder
+        Whether the decoder and the likelihood are run.
+    min_batch_size
+        Lower bound of the returned batch size.
+    max_batch_size
+        Upper bound of the returned batch size.
+    probe_sizes
+        Batch sizes used to measure memory on CUDA.
+
+    Returns
+    -------
+    int
+        Batch size.
+    """
+    device = next(module.parameters()).device
+    if memory_budget is None:
+        memory_budget = DEFAULT_MEMORY_FRACTION
+    if memory_budget <= 1:
+        memory_budget = memory_budget * available_memory(device)
+
+    memory_per_cell = estimate_memory_per_cell(module, include_encoder=include_encoder, include_decoder=False)
+    if include_decoder:
+        probed = _probe_memory_per_cell(module, device, probe_sizes)
+        if probed is None:
+            memory_per_cell = estimate_memory_per_cell(
+                module, include_encoder=include_encoder, include_decoder=include_decoder
+            )
+        else:
+            memory_per_cell += probed
+
+    batch_size = int(memory_budget // memory_per_cell)
+    batch_size = min(max(batch_size, min_batch_size), max_batch_size)
+    logger.info(f"Using batch size {batch_size} ({memory_per_cell} bytes per cell, budget {int(memory_budget)} bytes)")
+    return batch_size
@@ -1,11 +1,16 @@
 import logging
 from collections.abc import Callable, Sequence
+from typing import Literal
 
 import numpy as np
 import scvi
 import torch
 from anndata import AnnData
-from torch.nn import functional as F
+
+from drvi.nn_modules.precision import autocast_context
+from drvi.scvi_tools_based.model.base._batch_size import autotune_batch_size
+from drvi.scvi_tools_based.model.base._parallel import iterate_in_worker_processes
+from drvi.scvi_tools_based.model.base._reducers import make_reducer, split_effect_share
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +27,9 @@ class GenerativeMixin:
         lib: np.ndarray | None = None,
         cat_key: np.ndarray | None = None,
         cont_key: np.ndarray | None = None,
-        batch_size=scvi.settings.batch_size,
+        batch_size: int | Literal["auto"] = scvi.settings.batch_size,
+        memory_budget: int | float | None = None,
+        autocast_dtype: torch.dtype | None = None,
     ) -> np.ndarray:
         r"""Iterate over decoder outputs and aggregate the results.
 
@@ -43,11 +50,21 @@ class GenerativeMixin:
             Continuous covariates.
         batch_size
             Minibatch size for data loading into model. Defaults to `scvi.settings.batch_size`.
+            If "auto", the largest batch size fitting `memory_budget` is used.
+        memory_budget
+            Memory budget used when `batch_size` is "auto".
+            Values in (0, 1] are a fraction of the available memory, larger values are bytes.
+        autocast_dtype
+            Run the model under autocast with this dtype (e.g. `torch.bfloat16`).
+            Numerically sensitive parts of the model stay in float32. No autocast is used if None.
         """
+        if batch_size == "auto":
+            batch_size = autotune_batch_size(self.module, memory_budget=memory_budget, include_encoder=False)
+
         store = []
         self.module.eval()
 
-        with torch.no_grad():
+        with torch.no_grad(), autocast_context(autocast_dtype, torch.device(self.device).type):
             for i in np.arange(0, z.shape[0], batch_size):
                 slice = np.arange(i, min(i + batch_size, z.shape[0]))
                 z_tensor = torch.tensor(z[slice])
@@ -85,7 +102,9 @@ class GenerativeMixin:
         lib: np.ndarray | None = None,
         cat_key: np.ndarray | None = None,
         cont_key: np.ndarray | None = None,
-        batch_size=scvi.settings.batch_size,
+        batch_size: int | Literal["auto"] = scvi.settings.batch_size,
+        memory_budget: int | float | None = None,
+        autocast_dtype: torch.dtype | None = None,
     ) -> np.ndarray:
         r"""Return the distribution produces by the decoder for the given latent samples.
 
@@ -103,10 +122,16 @@ class GenerativeMixin:
             Continuous covariates.
         batch_size
             Minibatch size for data loading into model. Defaults to `scvi.settings.batch_size`.
+            If "auto", the largest batch size fitting `memory_budget` is used.
+        memory_budget
+            Memory budget used when `batch_size` is "auto".
+        autocast_dtype
+            Run the model under autocast with this dtype (e.g. `torch.bfloat16`).
+            Numerically sensitive parts of the model stay in float32. No autocast is used if None.
         return_mean
             Return the mean of the distribution or the full distribution.
         """
-        step_func = lambda gen_output, store: store.append(gen_output["params"]["mean"].detach().cpu())
+        step_func = lambda gen_output, store: store.append(gen_output["params"]["mean"].detach().float().cpu())
         aggregation_func = lambda store: torch.cat(store, dim=0).numpy(force=True)
 
         return self.iterate_on_decoded_latent_samples(
@@ -117,6 +142,8 @@ class GenerativeMixin:
             cat_key=cat_key,
             cont_key=cont_key,
             batch_size=batch_size,
+            memory_budget=memory_budget,
+            autocast_dtype=autocast_dtype,
         )
 
     @torch.inference_mode()
@@ -126,8 +153,12 @@ class GenerativeMixin:
         step_func: Callable,
         aggregation_func: Callable,
         indices: Sequence[int] | None = None,
-        batch_size: int | None = None,
+        batch_size: int | Literal["auto"] | None = None,
         deterministic: bool = False,
+        inference_only: bool = False,
+        memory_budget: int | float | None = None,
+        n_workers: int = 1,
+        autocast_dtype: torch.dtype | None = None,
     ) -> np.ndarray:
         r"""Iterate over autoencoder outputs and aggregate the results.
 
@@ -138,27 +169,66 @@ class GenerativeMixin:
             If `None`, defaults to the AnnData object used to initialize the model.
         step_func
             Function to apply to the autoencoder output at each step.
-            inference_outputs, generative_outputs, losses, and a store variable are given to the function
+            inference_outputs, generative_outputs, losses, and a store variable are given to the function.
+            When `inference_only` is set, generative_outputs and losses are `None`.
         aggregation_func
             Function to aggregate the step results.
+            With `n_workers > 1` it receives the concatenation of the stores of all workers in index order.
         indices
             Indices of cells in adata to use. If `None`, all cells are used.
         batch_size
             Minibatch size for data loading into model. Defaults to `scvi.settings.batch_size`.
+            If "auto", the largest batch size fitting `memory_budget` is used.
+            With `n_workers > 1`, the batch size (given or picked from `memory_budget`) is split between the workers.
         deterministic
             Makes model fully deterministic (e.g. no sampling in the bottleneck).
+        inference_only
+            Only run the encoder (inference) part of the model.
+            Use this when `step_func` only needs inference_outputs to skip decoder and likelihood computations.
+        memory_budget
+            Memory budget used when `batch_size` is "auto".
+            Values in (0, 1] are a fraction of the available memory, larger values are bytes.
+            With `n_workers > 1` the budget is shared by all workers.
+        n_workers
+            Number of processes to shard the cells over (CPU and AnnData only).
+            Each worker gets a contiguous range of the indices and an equal share of the intra-op threads.
+            Workers are forked, so the model weights and `step_func` are not copied.
+        autocast_dtype
+            Run the model under autocast with this dtype (e.g. `torch.bfloat16`).
+            Numerically sensitive parts of the model stay in float32. No autocast is used if None.
         """
+        if batch_size == "auto":
+            batch_size = autotune_batch_size(
+                self.module, memory_budget=memory_budget, include_decoder=not inference_only
+            )
+        if batch_size is not None and n_workers > 1:
+            # forked workers share the memory of the machine
+            batch_size = max(batch_size // n_workers, 1)
         adata = self._validate_anndata(adata)
-        data_loader = self._make_data_loader(adata=adata, indices=indices, batch_size=batch_size)
 
-        store = []
         try:
             if deterministic:
                 self.module.fully_deterministic = True
-            for tensors in data_loader:
-                loss_kwargs = {"kl_weight": 1}
-                inference_outputs, generative_outputs, losses = self.module(tensors, loss_kwargs=loss_kwargs)
-                step_func(inference_outputs, generative_outputs, losses, store)
+            if n_workers > 1:
+                store = iterate_in_worker_processes(
+                    self,
+                    adata,
+                    step_func,
+                    n_workers=n_workers,
+                    indices=indices,
+                    batch_size=batch_size,
+                    inference_only=inference_only,
+                    autocast_dtype=autocast_dtype,
+                )
+            else:
+                store = self._collect_ae_output_steps(
+                    adata,
+                    step_func,
+                    indices=indices,
+                    batch_size=batch_size,
+                    inference_only=inference_only,
+                    autocast_dtype=autocast_dtype,
+                )
         except Exception as e:
             self.module.fully_deterministic = False
             raise e
@@ -167,6 +237,185 @@ class GenerativeMixin:
 
         return aggregation_func(store)
 
+    @torch.inference_mode()
+    def _collect_ae_output_steps(
+        self,
+        adata: AnnData,
+        step_func: Callable,
+        indices: Sequence[int] | None = None,
+        batch_size: int | None = None,
+        inference_only: bool = False,
+        autocast_dtype: torch.dtype | None = None,
+    ) -> list:
+        """Run the autoencoder over (a subset of) adata and return the store filled by `step_func`."""
+        data_loader = self._make_data_loader(adata=adata, indices=indices, batch_size=batch_size)
+
+        store = []
+        for tensors in data_loader:
+            with autocast_context(autocast_dtype, torch.device(self.device).type):
+                if inference_only:
+                    inference_outputs = self.module.inference(**self.module._get_inference_input(tensors))
+                    generative_outputs, losses = None, None
+                else:
+                    loss_kwargs = {"kl_weight": 1}
+                    inference_outputs, generative_outputs, losses = self.module(tensors, loss_kwargs=loss_kwargs)
+            step_func(inference_outputs, generative_outputs, losses, store)
+        return store
+
+    def _latent_step_funcs(self) -> tuple[Callable, Callable]:
+        """Step and aggregation functions collecting the mean of the latent distribution."""
+
+        def collect_latent(inference_outputs, generative_outputs, losses, store):
+            store.append(inference_outputs["qz_m"].detach().cpu())
+
+        def aggregate_latent(store):
+            return torch.cat(store, dim=0).numpy(force=True)
+
+        return collect_latent, aggregate_latent
+
+    def _reconstruction_effect_step_funcs(self, add_to_counts: float = 1.0) -> tuple[Callable, Callable]:
+        """Step and aggregation functions for the per-cell effect of each split on the reconstruction."""
+
+        def calculate_effect(inference_outputs, generative_outputs, losses, store):
+            effect_share = split_effect_share(
+                generative_outputs["original_params"]["mean"].float(), self.module.split_aggregation, add_to_counts
+            ).sum(dim=-1)  # n_samples x n_splits
+            return store.append(effect_share.detach().cpu())
+
+        def aggregate_effects(store):
+            return torch.cat(store, dim=0).numpy(force=True)
+
+        return calculate_effect, aggregate_effects
+
+    def _split_effect_step_funcs(
+        self,
+        add_to_counts: float = 1.0,
+        reduction: Literal["max", "sum", "mean", "quantile"] = "max",
+        **reducer_kwargs,
+    ) -> tuple[Callable, Callable]:
+        """Step and aggregation functions reducing the effect of each split on each gene over cells."""
+
+        def calculate_effect(inference_outputs, generative_outputs, losses, store):
+            effect_share = split_effect_share(
+                generative_outputs["original_params"]["mean"].float(), self.module.split_aggregation, add_to_counts
+            )  # n_samples x n_splits x n_genes
+            if len(store) == 0:
+                store.append(make_reducer(reduction, **reducer_kwargs))
+            store[0].update(effect_share)
+
+        def aggregate_effects(store):
+            # Stores may be concatenated from several passes, so merge all reducers
+            reducer = store[0]
+            for other in store[1:]:
+                reducer.merge(other)
+            return reducer.result()
+
+        return calculate_effect, aggregate_effects
+
+    @staticmethod
+    def _combine_step_funcs(step_funcs: dict[str, tuple[Callable, Callable]]) -> tuple[Callable, Callable]:
+        """Combine named (step_func, aggregation_func) pairs so that they share a single pass over the data.
+
+        Each pair keeps its own store. The combined aggregation function returns a dict with the same keys.
+        If the combined store is a concatenation of several stores (e.g. from different workers),
+        the stores of each pair are concatenated in order before aggregation.
+        """
+
+        def step_func(inference_outputs, generative_outputs, losses, store):
+            if len(store) == 0:
+                store.append({name: [] for name in step_funcs})
+            for name, (func, _) in step_funcs.items():
+                func(inference_outputs, generative_outputs, losses, store[0][name])
+
+        def aggregation_func(store):
+            return {
+                name: func([item for sub_store in store for item in sub_store[name]])
+                for name, (_, func) in step_funcs.items()
+            }
+
+        return step_func, aggregation_func
+
+    @torch.inference_mode()
+    def compute_post_training_summary(
+        self,
+        adata: AnnData | None = None,
+        add_to_counts: float = 1.0,
+        reconstruction_effect: bool = True,
+        max_effect: bool = True,
+        extra_step_funcs: dict[str, tuple[Callable, Callable]] | None = None,
+        **kwargs,
+    ) -> dict:
+        r"""Compute latent representation, split effects and latent statistics in a single pass over the data.
+
+        This is equivalent to calling :meth:`get_latent_representation`,
+        :meth:`get_reconstruction_effect_of_each_split` and
+        :meth:`get_max_effect_of_splits_within_distribution` separately, but the encoder and decoder
+        are only run once for each cell. The model is fully deterministic during the pass.
+
+        Parameters
+        ----------
+        adata
+            AnnData object with equivalent structure to initial AnnData.
+            If `None`, defaults to the AnnData object used to initialize the model.
+        add_to_counts
+            Value to add to the counts before computing the logarithm.
+        reconstruction_effect
+            Whether to compute the effect of each split on the reconstruction.
+        max_effect
+            Whether to compute the max effect of each split on each gene.
+        extra_step_funcs
+            Additional named ``(step_func, aggregation_func)`` pairs to evaluate in the same pass.
+            See :meth:`iterate_on_ae_output` for the signature of these functions.
+        kwargs
+            Additional keyword arguments for the `iterate_on_ae_output` method.
+
+        Returns
+        -------
+        dict
+            A dictionary with the following keys (and the keys of ``extra_step_funcs``):
+
+            - ``latent``: mean of the latent distribution (n_cells x n_latent).
+            - ``latent_stats``: dict of per-dimension ``max_value``, ``mean``, ``min``, ``max`` and ``std``
+              as used by :func:`drvi.utils.tl.set_latent_dimension_stats`.
+            - ``reconstruction_effect_per_cell``: effect of each split per cell (n_cells x n_splits).
+            - ``reconstruction_effect``: effect of each split aggregated over cells (n_splits).
+            - ``max_effect``: max effect of each split on each gene (n_splits x n_genes).
+        """
+        step_funcs = {"latent": self._latent_step_funcs()}
+        if reconstruction_effect:
+            step_funcs["reconstruction_effect_per_cell"] = self._reconstruction_effect_step_funcs(add_to_counts)
+        if max_effect:
+            step_funcs["max_effect"] = self._split_effect_step_funcs(add_to_counts, reduction="max")
+        for name, funcs in (extra_step_funcs or {}).items():
+            if name in step_funcs:
+                raise ValueError(f"Step function name '{name}' is reserved.")
+            step_funcs[name] = funcs
+
+        if not extra_step_funcs and not (reconstruction_effect or max_effect):
+            # Only the latent is requested. No need to run the decoder.
+            kwargs.setdefault("inference_only", True)
+
+        step_func, aggregation_func = self._combine_step_funcs(step_funcs)
+        summary = self.iterate_on_ae_output(
+            adata=adata,
+            step_func=step_func,
+            aggregation_func=aggregation_func,
+            deterministic=True,
+            **kwargs,
+        )
+
+        latent = summary["latent"]
+        summary["latent_stats"] = {
+            "max_value": np.abs(latent).max(axis=0),
+            "mean": latent.mean(axis=0),
+            "min": latent.min(axis=0),
+            "max": latent.max(axis=0),
+            "std": np.abs(latent).std(axis=0),
+        }
+        if reconstruction_effect:
+            summary["reconstruction_effect"] = summary["reconstruction_effect_per_cell"].sum(axis=0)
+        return summary
+
     @torch.inference_mode()
     def get_reconstruction_effect_of_each_split(
         self,
@@ -192,26 +441,7 @@ class GenerativeMixin:
         kwargs
             Additional keyword arguments for the `iterate_on_ae_output` method.
         """
-
-        def calculate_effect(inference_outputs, generative_outputs, losses, store):
-            if self.module.split_aggregation == "logsumexp":
-                log_mean_params = generative_outputs["original_params"]["mean"]  # n_samples x n_splits x n_genes
-                log_mean_params = F.pad(
-                    log_mean_params, (0, 0, 0, 1), value=np.log(add_to_counts)
-                )  # n_samples x (n_splits + 1) x n_genes
-                effect_share = -torch.log(1 - F.softmax(log_mean_params, dim=-2)[:, :-1, :]).sum(
-                    dim=-1
-                )  # n_samples x n_splits
-            elif self.module.split_aggregation == "sum":
-                effect_share = torch.abs(generative_outputs["original_params"]["mean"]).sum(
-                    dim=-1
-                )  # n_samples x n_splits
-            else:
-                raise NotImplementedError("Only logsumexp and sum aggregations are supported for now.")
-            return store.append(effect_share.detach().cpu())
-
-        def aggregate_effects(store):
-            return torch.cat(store, dim=0).numpy(force=True)
+        calculate_effect, aggregate_effects = self._reconstruction_effect_step_funcs(add_to_counts)
 
         output = self.iterate_on_ae_output(
             adata=adata,
@@ -275,26 +505,7 @@ class GenerativeMixin:
         >>> utils.plotting._interpretability._bar_plot_top_differential_vars(plot_info)
         >>> utils.plotting._interpretability._umap_of_relevant_genes(adata, embed, plot_info, dim_subset=["DR 1"])
         """
-
-        def calculate_effect(inference_outputs, generative_outputs, losses, store):
-            if self.module.split_aggregation == "logsumexp":
-                log_mean_params = generative_outputs["original_params"]["mean"]  # n_samples x n_splits x n_genes
-                log_mean_params = F.pad(
-                    log_mean_params, (0, 0, 0, 1), value=np.log(add_to_counts)
-                )  # n_samples x (n_splits + 1) x n_genes
-                effect_share = -torch.log(1 - F.softmax(log_mean_params, dim=-2)[:, :-1, :])
-            elif self.module.split_aggregation == "sum":
-                effect_share = torch.abs(generative_outputs["original_params"]["mean"])
-            else:
-                raise NotImplementedError("Only logsumexp and sum aggregations are supported for now.")
-            effect_share = effect_share.amax(dim=0).detach().cpu().numpy(force=True)
-            if len(store) == 0:
-                store.append(effect_share)
-            else:
-                store[0] = np.maximum(store[0], effect_share)
-
-        def aggregate_effects(store):
-            return store[0]
+        calculate_effect, aggregate_effects = self._split_effect_step_funcs(add_to_counts, reduction="max")
 
         output = self.iterate_on_ae_output(
             adata=adata,
@@ -305,3 +516,54 @@ class GenerativeMixin:
         )
 
         return output
+
+    @torch.inference_mode()
+    def get_effect_of_splits_within_distribution(
+        self,
+        adata: AnnData | None = None,
+        add_to_counts: float = 1.0,
+        reduction: Literal["max", "sum", "mean", "quantile"] = "max",
+        deterministic: bool = True,
+        reducer_kwargs: dict | None = None,
+        **kwargs,
+    ) -> np.ndarray:
+        r"""
+        Return the effect of each split on the reconstructed expression params for all genes reduced over cells.
+
+        Effects are reduced on the fly, so memory usage does not grow with the number of cells.
+
+        Parameters
+        ----------
+        adata
+            AnnData object with equivalent structure to initial AnnData.
+            If `None`, defaults to the AnnData object used to initialize the model.
+        add_to_counts
+            Value to add to the counts before computing the logarithm.
+        reduction
+            How to reduce effects over cells.
+            "quantile" uses a streaming histogram. Quantiles, number of bins and their range can be set in
+            `reducer_kwargs` (see :class:`~drvi.scvi_tools_based.model.base._reducers.QuantileReducer`).
+        deterministic
+            Makes model fully deterministic (e.g. no sampling in the bottleneck).
+        reducer_kwargs
+            Keyword arguments for the reducer.
+        kwargs
+            Additional keyword arguments for the `iterate_on_ae_output` method.
+
+        Returns
+        -------
+        np.ndarray
+            Reduced effect of each split on each gene (n_splits x n_genes).
+            For "quantile" reduction the output has shape n_quantiles x n_splits x n_genes.
+        """
+        calculate_effect, aggregate_effects = self._split_effect_step_funcs(
+            add_to_counts, reduction=reduction, **(reducer_kwargs or {})
+        )
+
+        return self.iterate_on_ae_output(
+            adata=adata,
+            step_func=calculate_effect,
+            aggregation_func=aggregate_effects,
+            deterministic=deterministic,
+            **kwargs,
+        )
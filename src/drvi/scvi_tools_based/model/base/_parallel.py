@@ -0,0 +1,118 @@
+import logging
+import pickle
+import queue as queue_module
+import traceback
+from collections.abc import Callable, Sequence
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from anndata import AnnData
+
+logger = logging.getLogger(__name__)
+
+# Work shared with forked workers. Set right before forking so closures (e.g. step functions) need no pickling.
+_WORKER_TASK = None
+# Seconds between checks that the workers are still alive while waiting for results
+_POLL_INTERVAL = 1.0
+
+
+def _worker_main(worker_id: int, indices: np.ndarray, n_threads: int, queue) -> None:
+    model, adata, step_func, kwargs = _WORKER_TASK
+    torch.set_num_threads(n_threads)
+    try:
+        store = model._collect_ae_output_steps(adata, step_func, indices=indices, **kwargs)
+        # Plain pickling: tensors created in inference mode can not be moved to shared memory by the queue
+        queue.put(pickle.dumps((worker_id, store, None)))
+    except Exception:  # noqa: BLE001
+        queue.put(pickle.dumps((worker_id, None, traceback.format_exc())))
+
+
+def iterate_in_worker_processes(
+    model,
+    adata: AnnData,
+    step_func: Callable,
+    n_workers: int,
+    indices: Sequence[int] | None = None,
+    **kwargs,
+) -> list:
+    """Shard cells over forked worker processes and collect the step stores in index order.
+
+    Workers are forked, so they read the weights of the model copy-on-write without copying them.
+
+    Parameters
+    ----------
+    model
+        DRVI model on CPU.
+    adata
+        Validated AnnData object.
+    step_func
+        Step function as given to :meth:`~drvi.model.DRVI.iterate_on_ae_output`.
+    n_workers
+        Number of worker processes.
+    indices
+        Indices of cells in adata to use. If `None`, all cells are used.
+    kwargs
+        Keyword arguments for `model._collect_ae_output_steps`.
+
+    Returns
+    -------
+    list
+        Concatenation of the stores of all workers.
+
+    Raises
+    ------
+    RuntimeError
+        If a worker fails or dies (e.g. killed for running out of memory) before sending its results.
+    """
+    global _WORKER_TASK
+
+    if not isinstance(adata, AnnData):
+        raise ValueError("Multi-process inference is only supported for AnnData.")
+    if model.device.type != "cpu":
+        raise ValueError("Multi-process inference is only supported on CPU.")
+    if "fork" not in mp.get_all_start_methods():
+        raise RuntimeError("Multi-process inference requires the 'fork' start method.")
+
+    if indices is None:
+        indices = np.arange(adata.n_obs)
+    shards = [shard for shard in np.array_split(np.asarray(indices), n_workers) if len(shard) > 0]
+    n_threads = max(torch.get_num_threads() // len(shards), 1)
+    logger.info(f"Running inference in {len(shards)} processes with {n_threads} threads each")
+
+    ctx = mp.get_context("fork")
+    queue = ctx.Queue()
+    _WORKER_TASK = (model, adata, step_func, kwargs)
+    processes = []
+    try:
+        processes = [
+            ctx.Process(target=_worker_main, args=(worker_id, shard, n_threads, queue), daemon=True)
+            for worker_id, shard in enumerate(shards)
+        ]
+        for process in processes:
+            process.start()
+        # Results must be received before joining, otherwise workers may block on a full pipe
+        results = {}
+        while len(results) < len(processes):
+            try:
+                worker_id, store, error = pickle.loads(queue.get(timeout=_POLL_INTERVAL))
+            except queue_module.Empty:
+                for worker_id, process in enumerate(processes):
+                    # a worker exiting normally has flushed its result to the queue before
+                    if worker_id not in results and not process.is_alive() and process.exitcode != 0:
+                        raise RuntimeError(
+                            f"Inference worker {worker_id} died with exit code {process.exitcode}."
+                        ) from None
+                continue
+            if error is not None:
+                raise RuntimeError(f"Inference worker {worker_id} failed:\n{error}")
+            results[worker_id] = store
+        for process in processes:
+            process.join()
+    finally:
+        _WORKER_TASK = None
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    return [item for worker_id in range(len(shards)) for item in results[worker_id]]
@@ -0,0 +1,190 @@
+import math
+from collections.abc import Sequence
+from typing import Literal
+
+import numpy as np
+import torch
+
+
+def log1mexp(x: torch.Tensor) -> torch.Tensor:
+    r"""Numerically stable :math:`\log(1 - \exp(x))` for :math:`x \le 0`.
+
+    See "Accurately Computing log(1 - exp(-|a|))" by Martin Mächler.
+    """
+    return torch.where(
+        x > -math.log(2.0),
+        torch.log(-torch.expm1(x)),
+        torch.log1p(-torch.exp(x)),
+    )
+
+
+def split_effect_share(
+    original_mean: torch.Tensor,
+    split_aggregation: Literal["logsumexp", "sum"],
+    add_to_counts: float = 1.0,
+) -> torch.Tensor:
+    r"""Effect of each split on each gene given the per-split mean params of the decoder.
+
+    For logsumexp aggregation this is :math:`-\log(1 - \mathrm{softmax}_i)` where the softmax runs over
+    the splits plus a constant term :math:`\log(\text{add\_to\_counts})`. It is computed as
+    :math:`-\log(1 - \exp(x_i - \mathrm{LSE}))` without padding the input or materializing the softmax.
+
+    Parameters
+    ----------
+    original_mean
+        Per-split mean params of shape n_samples x n_splits x n_genes.
+    split_aggregation
+        How splits are aggregated in the decoder.
+    add_to_counts
+        Value to add to the counts before computing the logarithm.
+
+    Returns
+    -------
+    torch.Tensor
+        Effect share with the same shape as `original_mean`.
+    """
+    if split_aggregation == "logsumexp":
+        log_total = torch.logsumexp(original_mean, dim=-2, keepdim=True)  # n_samples x 1 x n_genes
+        # log(0) = -inf leaves the total unchanged when no pseudo-count is added
+        log_add_to_counts = torch.tensor(add_to_counts, dtype=log_total.dtype, device=log_total.device).log()
+        log_total = torch.logaddexp(log_total, log_add_to_counts)
+        return -log1mexp((original_mean - log_total).clamp(max=0.0))
+    elif split_aggregation == "sum":
+        return torch.abs(original_mean)
+    else:
+        raise NotImplementedError("Only logsumexp and sum aggregations are supported for now.")
+
+
+class OnlineReducer:
+    """Reduce a stream of tensors of shape n_samples x ... over the sample axis in bounded memory.
+
+    Reducers of the same type can be merged, so partial results (e.g. from different workers) can be combined.
+    """
+
+    def update(self, values: torch.Tensor) -> None:
+        raise NotImplementedError()
+
+    def merge(self, other: "OnlineReducer") -> "OnlineReducer":
+        raise NotImplementedError()
+
+    def result(self) -> np.ndarray:
+        raise NotImplementedError()
+
+
+class MaxReducer(OnlineReducer):
+    def __init__(self):
+        self.value = None
+
+    def update(self, values):
+        batch_max = values.amax(dim=0).detach().cpu()
+        self.value = batch_max if self.value is None else torch.maximum(self.value, batch_max)
+
+    def merge(self, other):
+        if other.value is not None:
+            self.value = other.value if self.value is None else torch.maximum(self.value, other.value)
+        return self
+
+    def result(self):
+        return self.value.numpy(force=True)
+
+
+class SumReducer(OnlineReducer):
+    def __init__(self):
+        self.value = None
+        self.count = 0
+
+    def update(self, values):
+        batch_sum = values.sum(dim=0, dtype=torch.float64).detach().cpu()
+        self.value = batch_sum if self.value is None else self.value + batch_sum
+        self.count += values.shape[0]
+
+    def merge(self, other):
+        if other.value is not None:
+            self.value = other.value if self.value is None else self.value + other.value
+            self.count += other.count
+        return self
+
+    def result(self):
+        return self.value.numpy(force=True)
+
+
+class MeanReducer(SumReducer):
+    def result(self):
+        return (self.value / self.count).numpy(force=True)
+
+
+class QuantileReducer(OnlineReducer):
+    """Approximate quantiles from a streaming histogram with log-spaced bins.
+
+    Memory is ``n_bins`` counters per output element, independent of the number of samples.
+    Values outside ``[min_value, max_value]`` are clipped to the first or last bin.
+
+    Parameters
+    ----------
+    quantiles
+        Quantiles to report, between 0 and 1.
+    n_bins
+        Number of histogram bins.
+    min_value
+        Lower edge of the first bin. Must be positive.
+    max_value
+        Upper edge of the last bin.
+    """
+
+    def __init__(
+        self,
+        quantiles: Sequence[float] = (0.5, 0.9),
+        n_bins: int = 64,
+        min_value: float = 1e-4,
+        max_value: float = 1e2,
+    ):
+        assert 0 < min_value < max_value
+        self.quantiles = tuple(quantiles)
+        self.n_bins = n_bins
+        self.log_edges = torch.linspace(math.log(min_value), math.log(max_value), n_bins + 1)
+        self.counts = None
+        self.shape = None
+
+    def update(self, values):
+        values = values.detach().float().cpu()
+        bins = torch.bucketize(torch.log(values.clamp(min=1e-30)), self.log_edges[1:-1])  # n_samples x ...
+        if self.counts is None:
+            self.counts = torch.zeros(values.shape[1:].numel() * self.n_bins, dtype=torch.int64)
+        flat_index = bins.reshape(values.shape[0], -1) + torch.arange(bins[0].numel()) * self.n_bins
+        self.counts.index_add_(0, flat_index.reshape(-1), torch.ones(flat_index.numel(), dtype=torch.int64))
+        self.shape = values.shape[1:]
+
+    def merge(self, other):
+        if other.counts is not None:
+            self.counts = other.counts.clone() if self.counts is None else self.counts + other.counts
+            self.shape = other.shape
+        return self
+
+    def result(self):
+        counts = self.counts.reshape(-1, self.n_bins).double()
+        cdf = counts.cumsum(dim=-1) / counts.sum(dim=-1, keepdim=True)
+        output = []
+        for q in self.quantiles:
+            bin_index = torch.searchsorted(cdf, torch.full((cdf.shape[0], 1), q, dtype=cdf.dtype)).clamp(
+                max=self.n_bins - 1
+            )
+            cdf_before = torch.where(bin_index > 0, cdf.gather(1, (bin_index - 1).clamp(min=0)), 0.0)
+            bin_mass = counts.gather(1, bin_index) / counts.sum(dim=-1, keepdim=True)
+            fraction = ((q - cdf_before) / bin_mass.clamp(min=1e-12)).clamp(0.0, 1.0)
+            log_value = self.log_edges[bin_index] + fraction * (self.log_edges[1] - self.log_edges[0])
+            output.append(torch.exp(log_value).reshape(self.shape))
+        return torch.stack(output, dim=0).numpy(force=True)
+
+
+def make_reducer(reduction: Literal["max", "sum", "mean", "quantile"], **reducer_kwargs) -> OnlineReducer:
+    """Create an online reducer by name."""
+    if reduction == "max":
+        return MaxReducer(**reducer_kwargs)
+    elif reduction == "sum":
+        return SumReducer(**reducer_kwargs)
+    elif reduction == "mean":
+        return MeanReducer(**reducer_kwargs)
+    elif reduction == "quantile":
+        return QuantileReducer(**reducer_kwargs)
+    else:
+        raise NotImplementedError(f"Reduction {reduction} is not supported.")
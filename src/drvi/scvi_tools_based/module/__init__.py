@@ -1,3 +1,4 @@
 from ._drvi import DRVIModule
+from ._metrics import MetricInputs, available_metrics, register_metric
 
-__all__ = ["DRVIModule"]
+__all__ = ["DRVIModule", "MetricInputs", "available_metrics", "register_metric"]
@@ -5,6 +5,7 @@ import numpy as np
 import torch
 from scvi import REGISTRY_KEYS
 from scvi.module.base import BaseModuleClass, LossOutput, auto_move_data
+from torch import nn
 from torch.distributions import Normal
 from torch.utils.data import DataLoader
 
@@ -15,8 +16,13 @@ from drvi.nn_modules.noise_model import (
     NegativeBinomialNoiseModel,
     NormalNoiseModel,
     PoissonNoiseModel,
+    gather_features,
+    select_cells,
 )
+from drvi.nn_modules.precision import fp32_region, to_fp32
 from drvi.nn_modules.prior import GaussianMixtureModelPrior, StandardPrior, VampPrior
+from drvi.nn_modules.profiling import record_stage
+from drvi.scvi_tools_based.module._metrics import MetricInputs, compute_metrics, normalize_metrics
 from drvi.scvi_tools_based.nn import DecoderDRVI, Encoder
 
 TensorDict = dict[str, torch.Tensor]
@@ -70,12 +76,36 @@ class DRVIModule(BaseModuleClass):
         Whether to use affine batch norm in layers.
     use_layer_norm
         Whether to use layer norm in layers.
+    fill_in_the_blanks_ratio
+        Fraction of genes to mask in the encoder input during training. The reconstruction loss is computed
+        on the masked genes only.
+    reconstruction_feature_subset
+        Number (int) or fraction (float) of features to compute the reconstruction loss on per training
+        minibatch. The decoder only computes these output features and the loss is rescaled to an unbiased
+        estimate of the loss over all features. All features are used if None.
+        Not supported with softmax-normalized gene likelihoods (e.g. the default 'pnb_softmax').
+    reconstruction_subset_importance
+        Weight of the fraction of non-zero counts of each feature in the minibatch in its sampling probability
+        (0 for uniform sampling, 1 for sampling proportional to non-zero counts).
+    metrics
+        Extra metrics to log, as a list of names or a dict of names to keyword arguments
+        (see :func:`~drvi.scvi_tools_based.module.register_metric`). Available metrics are 'mse',
+        'kl_per_split' and 'reconstruction_by_gene_group' (with `gene_groups`). No extra metrics if None.
+    metrics_interval
+        Compute the metrics every `metrics_interval` training steps (of the trainer's `global_step`).
+        Validation steps always compute them. Metrics are not computed outside of training and validation steps.
+    metrics_n_cells
+        Compute the metrics on a random subset of this many cells of each minibatch. All cells if None.
     input_dropout_rate
         Dropout rate to apply to the input
     encoder_dropout_rate
         Dropout rate to apply to each of the encoder hidden layers
     decoder_dropout_rate
         Dropout rate to apply to each of the decoder hidden layers
+    gradient_checkpointing
+        Whether to recompute the decoder activations in backward instead of keeping them in memory during training.
+        Trades compute for memory, which is dominated by the per-split activations of the decoder
+        (batch x n_split_latent x hidden and batch x n_split_latent x n_input) with many splits.
     gene_likelihood
         gene likelihood model
     prior
@@ -121,9 +151,15 @@ class DRVIModule(BaseModuleClass):
         affine_batch_norm: Literal["encoder", "decoder", "none", "both"] = "both",
         use_layer_norm: Literal["encoder", "decoder", "none", "both"] = "both",
         fill_in_the_blanks_ratio: float = 0.0,
+        reconstruction_feature_subset: int | float | None = None,
+        reconstruction_subset_importance: float = 0.0,
+        metrics: Sequence[str] | dict[str, dict] | None = None,
+        metrics_interval: int = 1,
+        metrics_n_cells: int | None = None,
         input_dropout_rate: float = 0.0,
         encoder_dropout_rate: float = 0.1,
         decoder_dropout_rate: float = 0.0,
+        gradient_checkpointing: bool = False,
         gene_likelihood: Literal[
             "normal",
             "normal_v",
@@ -160,11 +196,28 @@ class DRVIModule(BaseModuleClass):
         self.latent_distribution = "normal"
         self.gene_likelihood = gene_likelihood
 
+        self.n_cats_per_cov = list(n_cats_per_cov or [])
+        self.n_continuous_cov = n_continuous_cov
         self.encode_covariates = encode_covariates
         self.deeply_inject_covariates = deeply_inject_covariates
 
         self.gene_likelihood_module = self._construct_gene_likelihood_module(gene_likelihood)
         self.fill_in_the_blanks_ratio = fill_in_the_blanks_ratio
+        if reconstruction_feature_subset is not None and fill_in_the_blanks_ratio > 0.0:
+            raise ValueError("`reconstruction_feature_subset` can not be combined with `fill_in_the_blanks_ratio`.")
+        if reconstruction_feature_subset is not None and not self.gene_likelihood_module.supports_feature_subset:
+            raise ValueError(
+                f"`reconstruction_feature_subset` is not supported with gene_likelihood='{gene_likelihood}', "
+                "as softmax-normalized means require all features. "
+                "Use a per-feature likelihood such as 'pnb', 'nb', 'poisson' or 'normal'."
+            )
+        if not 0.0 <= reconstruction_subset_importance <= 1.0:
+            raise ValueError("`reconstruction_subset_importance` should be between 0 and 1.")
+        self.reconstruction_feature_subset = reconstruction_feature_subset
+        self.reconstruction_subset_importance = reconstruction_subset_importance
+        self.metrics = normalize_metrics(metrics)
+        self.metrics_interval = metrics_interval
+        self.metrics_n_cells = metrics_n_cells
 
         use_batch_norm_encoder = use_batch_norm == "encoder" or use_batch_norm == "both"
         use_batch_norm_decoder = use_batch_norm == "decoder" or use_batch_norm == "both"
@@ -225,6 +278,7 @@ class DRVIModule(BaseModuleClass):
             layer_factory=decoder_layer_factory,
             covariate_modeling_strategy=covariate_modeling_strategy,
             categorical_covariate_dims=categorical_covariate_dims,
+            gradient_checkpointing=gradient_checkpointing,
             **(extra_decoder_kwargs or {}),
         )
 
@@ -305,6 +359,30 @@ class DRVIModule(BaseModuleClass):
         else:
             raise NotImplementedError()
 
+    def compile_layers(self, **compile_kwargs):
+        """
+        Compile the encoder and the decoder networks with :func:`torch.compile` in place.
+
+        Only the dense parts of the model are compiled: the encoder, the shared decoder layers and the
+        networks of the likelihood parameters. Building distributions, likelihoods and losses stays eager.
+        Parameter names do not change, so saving and loading work as usual.
+
+        Parameters
+        ----------
+        **compile_kwargs
+            Keyword arguments of :func:`torch.compile` (e.g. `mode`, `backend`, `dynamic` or `fullgraph`).
+        """
+        layers = [self.z_encoder, self.decoder.px_shared_decoder]
+        layers += [net for net in self.decoder.params_nets.values() if isinstance(net, nn.Module)]
+        for layer in layers:
+            if layer is None:
+                continue
+            if hasattr(layer, "compile"):
+                layer.compile(**compile_kwargs)
+            else:
+                # torch < 2.2 has no nn.Module.compile
+                layer.forward = torch.compile(layer.forward, **compile_kwargs)
+
     def _get_inference_input(self, tensors):
         """Parse the dictionary to get appropriate args"""
         x = tensors[REGISTRY_KEYS.X_KEY]
@@ -332,6 +410,7 @@ class DRVIModule(BaseModuleClass):
             "gene_likelihood_additional_info": gene_likelihood_additional_info,
         }
 
+    @record_stage("inference")
     @auto_move_data
     def inference(self, x, cont_covs=None, cat_covs=None):
         """
@@ -345,12 +424,13 @@ class DRVIModule(BaseModuleClass):
         # Mask if needed
         if self.fill_in_the_blanks_ratio > 0.0 and self.training:
             assert cont_covs is None  # We do not consider cont_cov here
-            x_mask = torch.where(torch.rand_like(x_) >= self.fill_in_the_blanks_ratio, 1.0, 0.0)
-            x_ = x_ * x_mask
-            # TODO: check this:
-            # x_ = x_ * x_mask / x_mask.mean(dim=1, keepdim=True)
+            # Exactly n_masked distinct genes are masked per cell (the `fill_in_the_blanks_ratio` fraction of genes).
+            # The reconstruction loss is computed on the masked genes only.
+            n_masked = max(1, round(x_.shape[1] * self.fill_in_the_blanks_ratio))
+            masked_genes = self._sample_masked_genes(x_.shape[0], x_.shape[1], n_masked, x_.device)
+            x_ = x_.scatter(1, masked_genes, 0.0)
         else:
-            x_mask = None
+            masked_genes = None
 
         # Prepare shared emb
         if self.shared_covariate_emb is not None and self.encode_covariates:
@@ -370,11 +450,49 @@ class DRVIModule(BaseModuleClass):
             "qz_m": qz_m,
             "qz_v": qz_v,
             "library": pre_processed_input["library"],
-            "x_mask": x_mask,
+            "masked_genes": masked_genes,
             "gene_likelihood_additional_info": pre_processed_input["gene_likelihood_additional_info"],
         }
         return outputs
 
+    @staticmethod
+    def _sample_masked_genes(n_cells, n_genes, n_masked, device):
+        """Sample `n_masked` distinct genes per cell uniformly, with O(n_cells * n_masked) random numbers."""
+        if 10 * n_masked > n_genes:
+            # collisions are frequent, while random keys for all genes cost at most ten per masked gene
+            return torch.rand(n_cells, n_genes, device=device).topk(n_masked, dim=1).indices
+        genes = torch.randint(n_genes, (n_cells, n_masked), device=device)
+        while True:
+            # redraw all but one of the genes drawn more than once in a cell until all genes are distinct
+            genes = genes.sort(dim=1).values
+            duplicates = genes[:, 1:] == genes[:, :-1]
+            n_duplicates = int(duplicates.sum())
+            if n_duplicates == 0:
+                return genes
+            genes[:, 1:][duplicates] = torch.randint(n_genes, (n_duplicates,), device=device)
+
+    def _sample_feature_subset(self, x):
+        """Sample the features of the reconstruction loss and the weights making the loss unbiased."""
+        n_features = x.shape[1]
+        if isinstance(self.reconstruction_feature_subset, float):
+            n_subset = max(1, round(n_features * self.reconstruction_feature_subset))
+        else:
+            n_subset = min(self.reconstruction_feature_subset, n_features)
+        if self.reconstruction_subset_importance == 0.0:
+            # uniform sampling without replacement: each feature is included with probability n_subset / n_features
+            feature_subset = torch.randperm(n_features, device=x.device)[:n_subset]
+            feature_weights = torch.full((n_subset,), n_features / n_subset, device=x.device)
+            return feature_subset, feature_weights
+        # importance sampling with replacement (Hansen-Hurwitz estimator)
+        importance = (x > 0).sum(dim=0).float()
+        importance = importance / importance.sum().clip(min=1.0)
+        probs = (1.0 - self.reconstruction_subset_importance) / n_features
+        probs = probs + self.reconstruction_subset_importance * importance
+        probs = probs / probs.sum()
+        feature_subset = torch.multinomial(probs, n_subset, replacement=True)
+        feature_weights = 1.0 / (n_subset * probs[feature_subset])
+        return feature_subset, feature_weights
+
     def _get_generative_input(self, tensors, inference_outputs):
         z = inference_outputs["z"]
         if self.fully_deterministic:
@@ -385,17 +503,34 @@ class DRVIModule(BaseModuleClass):
         cont_covs = tensors.get(REGISTRY_KEYS.CONT_COVS_KEY)
         cat_covs = tensors.get(REGISTRY_KEYS.CAT_COVS_KEY)
 
+        if self.reconstruction_feature_subset is not None and self.training:
+            feature_subset, feature_weights = self._sample_feature_subset(tensors[REGISTRY_KEYS.X_KEY])
+        else:
+            feature_subset, feature_weights = None, None
+
         input_dict = {
             "z": z,
             "library": library,
             "gene_likelihood_additional_info": gene_likelihood_additional_info,
             "cont_covs": cont_covs,
             "cat_covs": cat_covs,
+            "feature_subset": feature_subset,
+            "feature_weights": feature_weights,
         }
         return input_dict
 
+    @record_stage("generative")
     @auto_move_data
-    def generative(self, z, library, gene_likelihood_additional_info, cont_covs=None, cat_covs=None):
+    def generative(
+        self,
+        z,
+        library,
+        gene_likelihood_additional_info,
+        cont_covs=None,
+        cat_covs=None,
+        feature_subset=None,
+        feature_weights=None,
+    ):
         """Runs the generative model."""
         if self.shared_covariate_emb is not None:
             cat_covs = self.shared_covariate_emb(cat_covs.int())
@@ -406,33 +541,51 @@ class DRVIModule(BaseModuleClass):
             cont_full_tensor=cont_covs,
             library=library,
             gene_likelihood_additional_info=gene_likelihood_additional_info,
+            feature_subset=feature_subset,
         )
 
         return {
             "px": px,
             "params": params,
             "original_params": original_params,
+            "feature_subset": feature_subset,
+            "feature_weights": feature_weights,
         }
 
+    @record_stage("loss")
     def loss(
         self,
         tensors,
         inference_outputs,
         generative_outputs,
         kl_weight: float = 1.0,
+        metrics_step: int | None = None,
     ):
-        """Loss function."""
+        """Loss function.
+
+        Extra metrics are computed in validation steps and every `metrics_interval` training steps,
+        given the trainer step as `metrics_step` (see :class:`~drvi.scvi_tools_based.train.DRVITrainingPlan`).
+        No metrics are computed if `metrics_step` is None (e.g. in inference).
+        """
         x = tensors[REGISTRY_KEYS.X_KEY]
-        x_mask = inference_outputs["x_mask"]
+        masked_genes = inference_outputs["masked_genes"]
         qz_m = inference_outputs["qz_m"]
         qz_v = inference_outputs["qz_v"]
         px = generative_outputs["px"]
 
-        kl_divergence_z = self.prior.kl(Normal(qz_m, torch.sqrt(qz_v))).sum(dim=1)
-        if self.fill_in_the_blanks_ratio > 0.0 and self.training:
-            reconst_loss = -(px.log_prob(x) * (1 - x_mask)).sum(dim=-1)
-        else:
-            reconst_loss = -px.log_prob(x).sum(dim=-1)
+        with record_stage("prior_kl"), fp32_region(qz_m.device.type):
+            qz_m, qz_v = to_fp32(qz_m, qz_v)
+            kl_divergence_z = self.prior.kl(Normal(qz_m, torch.sqrt(qz_v))).sum(dim=1)
+        feature_subset = generative_outputs.get("feature_subset")
+        with record_stage("reconstruction_loss"):
+            if masked_genes is not None:
+                reconst_loss = -gather_features(px, masked_genes).log_prob(torch.gather(x, 1, masked_genes))
+                reconst_loss = reconst_loss.sum(dim=-1)
+            elif feature_subset is not None:
+                # px is over the subset of features; reweight to estimate the loss over all features
+                reconst_loss = -(px.log_prob(x[:, feature_subset]) * generative_outputs["feature_weights"]).sum(dim=-1)
+            else:
+                reconst_loss = -px.log_prob(x).sum(dim=-1)
         # For MSE this should be equivalent (in terms of backward gradients) to:
         # reconst_loss = torch.nn.GaussianNLLLoss(reduction='none')(x, px.loc, px.scale ** 2).sum(dim=-1)
         assert kl_divergence_z.shape == reconst_loss.shape
@@ -444,15 +597,36 @@ class DRVIModule(BaseModuleClass):
 
         loss = torch.mean(reconst_loss + weighted_kl_local)
 
+        extra_metrics = {}
+        if (
+            len(self.metrics) > 0
+            and metrics_step is not None
+            and (not self.training or metrics_step % self.metrics_interval == 0)
+        ):
+            extra_metrics = self._compute_metrics(x, px, qz_m, qz_v, generative_outputs)
+
         kl_local = {"kl_divergence_z": kl_divergence_z.sum()}
         return LossOutput(
             loss=loss,
             reconstruction_loss=reconst_loss,
             kl_local=kl_local,
-            extra_metrics={
-                "mse": torch.nn.functional.mse_loss(x, px.mean, reduction="none").sum(dim=1).mean(dim=0),
-            },
+            extra_metrics=extra_metrics,
+        )
+
+    def _compute_metrics(self, x, px, qz_m, qz_v, generative_outputs):
+        if self.metrics_n_cells is not None and x.shape[0] > self.metrics_n_cells:
+            cells = torch.randperm(x.shape[0], device=x.device)[: self.metrics_n_cells]
+            x, px, qz_m, qz_v = x[cells], select_cells(px, cells), qz_m[cells], qz_v[cells]
+        inputs = MetricInputs(
+            module=self,
+            x=x,
+            px=px,
+            qz_m=qz_m,
+            qz_v=qz_v,
+            feature_subset=generative_outputs.get("feature_subset"),
+            feature_weights=generative_outputs.get("feature_weights"),
         )
+        return compute_metrics(self.metrics, inputs)
 
     @torch.no_grad()
     def sample(
@@ -0,0 +1,124 @@
+from collections.abc import Callable, Mapping, Sequence
+from typing import NamedTuple
+
+import torch
+from torch.distributions import Distribution, Normal, kl_divergence
+
+from drvi.nn_modules.prior import StandardPrior
+
+
+class MetricInputs(NamedTuple):
+    """Tensors of the (sub-sampled) cells of a minibatch passed to metric functions."""
+
+    module: torch.nn.Module
+    x: torch.Tensor
+    px: Distribution
+    qz_m: torch.Tensor
+    qz_v: torch.Tensor
+    feature_subset: torch.Tensor | None = None
+    feature_weights: torch.Tensor | None = None
+
+
+MetricFunction = Callable[..., dict[str, torch.Tensor]]
+_METRICS: dict[str, MetricFunction] = {}
+
+
+def register_metric(name: str):
+    """
+    Register a function as a training metric of :class:`~drvi.scvi_tools_based.module.DRVIModule`.
+
+    The function receives :class:`MetricInputs` and the keyword arguments given in the `metrics`
+    argument of the module and returns a dict of scalar tensors, logged as `{key}_train` and
+    `{key}_validation`.
+
+    Parameters
+    ----------
+    name
+        Name to refer to the metric in `metrics`.
+    """
+
+    def decorator(metric_function: MetricFunction) -> MetricFunction:
+        _METRICS[name] = metric_function
+        return metric_function
+
+    return decorator
+
+
+def available_metrics() -> list[str]:
+    """Names of the registered metrics."""
+    return list(_METRICS)
+
+
+def normalize_metrics(metrics: Sequence[str] | Mapping[str, dict] | None) -> dict[str, dict]:
+    """Convert the `metrics` argument of the module to a dict of metric names to keyword arguments."""
+    if metrics is None:
+        return {}
+    if not isinstance(metrics, Mapping):
+        metrics = {name: {} for name in metrics}
+    for name in metrics:
+        if name not in _METRICS:
+            raise ValueError(f"Unknown metric {name}. Available metrics are {available_metrics()}.")
+    return {name: dict(kwargs or {}) for name, kwargs in metrics.items()}
+
+
+def compute_metrics(metrics: dict[str, dict], inputs: MetricInputs) -> dict[str, torch.Tensor]:
+    """Compute the given metrics without tracking gradients."""
+    results = {}
+    with torch.no_grad():
+        for name, kwargs in metrics.items():
+            results.update(_METRICS[name](inputs, **kwargs))
+    return results
+
+
+def _feature_columns(inputs: MetricInputs) -> tuple[torch.Tensor, torch.Tensor | float]:
+    """Counts matching the features of `px` and the weights to estimate sums over all features."""
+    if inputs.feature_subset is None:
+        return inputs.x, 1.0
+    return inputs.x[:, inputs.feature_subset], inputs.feature_weights
+
+
+@register_metric("mse")
+def mse(inputs: MetricInputs) -> dict[str, torch.Tensor]:
+    """Squared error of the mean of the likelihood summed over features and averaged over cells."""
+    mean = inputs.px.mean
+    x, weights = _feature_columns(inputs)
+    return {"mse": ((x - mean) ** 2 * weights).sum(dim=1).mean(dim=0)}
+
+
+@register_metric("kl_per_split")
+def kl_per_split(inputs: MetricInputs) -> dict[str, torch.Tensor]:
+    """KL divergence of each latent split from the standard normal prior, averaged over cells."""
+    module = inputs.module
+    if not isinstance(module.prior, StandardPrior) or module.decoder.split_method == "power":
+        raise NotImplementedError("Per split KL requires a standard normal prior and splits of latent dimensions.")
+    qz = Normal(inputs.qz_m.float(), inputs.qz_v.float().sqrt())
+    kl = kl_divergence(qz, Normal(torch.zeros_like(qz.loc), torch.ones_like(qz.scale)))
+    kl = kl.reshape(kl.shape[0], module.n_split_latent, -1).sum(dim=-1).mean(dim=0)
+    return {f"kl_split_{i}": kl[i] for i in range(kl.shape[0])}
+
+
+@register_metric("reconstruction_by_gene_group")
+def reconstruction_by_gene_group(
+    inputs: MetricInputs, gene_groups: Mapping[str, Sequence[int]]
+) -> dict[str, torch.Tensor]:
+    """
+    Reconstruction loss of groups of genes, summed over the genes of each group and averaged over cells.
+
+    Parameters
+    ----------
+    inputs
+        Metric inputs.
+    gene_groups
+        Indices of the genes (features) of each group by group name.
+    """
+    log_prob = inputs.px.log_prob(_feature_columns(inputs)[0])
+    results = {}
+    for group, genes in gene_groups.items():
+        genes = torch.as_tensor(genes, dtype=torch.long, device=log_prob.device)
+        if inputs.feature_subset is None:
+            group_log_prob = log_prob[:, genes].sum(dim=1)
+        else:
+            in_group = torch.isin(inputs.feature_subset, genes)
+            group_log_prob = (log_prob * inputs.feature_weights * in_group).sum(dim=1)
+        results[f"reconstruction_loss_{group}"] = -group_log_prob.mean(dim=0)
+    return results
@@ -1,4 +1,6 @@
 import collections
+import contextlib
+import functools
 import math
 from collections.abc import Callable, Iterable, Sequence
 from typing import Literal
@@ -7,18 +9,70 @@ import torch
 from scvi.nn._utils import one_hot
 from torch import nn
 from torch.distributions import Normal
+from torch.utils.checkpoint import checkpoint
 
 from drvi.nn_modules.embedding import MultiEmbedding
 from drvi.nn_modules.freezable import FreezableBatchNorm1d, FreezableLayerNorm
 from drvi.nn_modules.layer.factory import FCLayerFactory, LayerFactory
 from drvi.nn_modules.layer.linear_layer import StackedLinearLayer
 from drvi.nn_modules.noise_model import NoiseModel
+from drvi.nn_modules.precision import fp32_region, to_fp32
+from drvi.nn_modules.profiling import record_stage
 
 
 def _identity(x):
     return x
 
 
+def _subset_projection(layer: nn.Module, x: torch.Tensor, output_subset: torch.Tensor) -> torch.Tensor:
+    """Apply a linear or stacked linear layer computing only the output features in `output_subset`."""
+    bias = layer.bias[..., output_subset] if layer.bias is not None else None
+    if isinstance(layer, nn.Linear):
+        return nn.functional.linear(x, layer.weight[output_subset], bias)
+    if isinstance(layer, StackedLinearLayer):
+        mm = torch.einsum("bci,cio->bco", x, layer.weight[..., output_subset])
+        return mm + bias if bias is not None else mm
+    raise NotImplementedError()
+
+
+@contextlib.contextmanager
+def _restore_batch_norm_statistics(module: nn.Module):
+    """Restore the running statistics of the batch norm layers of `module` on exit."""
+    batch_norms = [
+        layer for layer in module.modules() if isinstance(layer, nn.BatchNorm1d) and layer.track_running_stats
+    ]
+    saved = [(bn.running_mean.clone(), bn.running_var.clone(), bn.num_batches_tracked.clone()) for bn in batch_norms]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for bn, (running_mean, running_var, num_batches_tracked) in zip(batch_norms, saved, strict=True):
+                bn.running_mean.copy_(running_mean)
+                bn.running_var.copy_(running_var)
+                bn.num_batches_tracked.copy_(num_batches_tracked)
+
+
+def _batch_norm_preserving_context(module: nn.Module):
+    """Checkpoint contexts under which recomputing `module` in backward does not update batch norm statistics twice."""
+    return contextlib.nullcontext(), _restore_batch_norm_statistics(module)
+
+
+# Kinds of layers within an FCLayers block, precomputed so that forward does not need
+# isinstance checks or list membership tests (which break torch.compile graphs)
+_LAYER_PLAIN = 0
+_LAYER_BATCH_NORM = 1
+_LAYER_EMBEDDING = 2
+_LAYER_BATCH_PROJECTION = 3
+_LAYER_INJECT_CAT = 4
+_LAYER_INJECT_LINEAR = 5
+
+# Kinds of decoder parameters and split aggregations, see DecoderDRVI
+_PARAM_FIXED = 0
+_PARAM_NETWORK = 1
+_PARAM_PER_FEATURE = 2
+_SPLIT_AGGREGATIONS = {"sum": 0, "logsumexp": 1, "max": 2}
+
+
 class FCLayers(nn.Module):
     """A helper class to build fully-connected layers for a neural network.
 
@@ -57,6 +111,9 @@ class FCLayers(nn.Module):
         An indicator to tell the class where in the architecture these layers reside.
     covariate_modeling_strategy
         The strategy model to consider covariates
+    gradient_checkpointing
+        Whether to recompute the activations of each block in backward instead of keeping them in memory
+        during training.
     """
 
     def __init__(
@@ -84,9 +141,11 @@ class FCLayers(nn.Module):
             "emb_shared_linear",
         ] = "one_hot",
         covariate_embs_dim: Iterable[int] = (),
+        gradient_checkpointing: bool = False,
     ):
         super().__init__()
         self.inject_covariates = inject_covariates
+        self.gradient_checkpointing = gradient_checkpointing
         if covariate_modeling_strategy.endswith("_linear"):
             self.covariate_projection_modeling = "linear"
             self.covariate_vector_modeling = covariate_modeling_strategy[: -len("_linear")]
@@ -203,6 +262,40 @@ class FCLayers(nn.Module):
                 ]
             )
         )
+        self._one_hot_covariates = self.covariate_vector_modeling == "one_hot"
+        self._shared_covariates = self.covariate_vector_modeling == "emb_shared"
+        self._layer_kinds = tuple(tuple(self._get_layer_kind(layer) for layer in layers) for layers in self.fc_layers)
+        # position of the output projection in the last block, used to compute a subset of output features
+        last_layers = list(self.fc_layers[-1])
+        self._output_layer_position = next(
+            (
+                position
+                for position, (layer, layer_kind) in enumerate(zip(last_layers, self._layer_kinds[-1], strict=True))
+                if layer_kind in (_LAYER_PLAIN, _LAYER_INJECT_CAT, _LAYER_INJECT_LINEAR)
+                and isinstance(layer, nn.Linear | StackedLinearLayer)
+            ),
+            None,
+        )
+        self.supports_output_subset = self._output_layer_position is not None and not any(
+            isinstance(layer, nn.BatchNorm1d | nn.LayerNorm) for layer in last_layers
+        )
+
+    def _get_layer_kind(self, layer: nn.Module) -> int:
+        if isinstance(layer, nn.BatchNorm1d):
+            return _LAYER_BATCH_NORM
+        if isinstance(layer, MultiEmbedding):
+            assert self.covariate_vector_modeling in ["emb"]
+            return _LAYER_EMBEDDING
+        if any(layer is projection for projection in self.linear_batch_projections):
+            assert self.covariate_projection_modeling == "linear"
+            return _LAYER_BATCH_PROJECTION
+        if any(layer is injectable for injectable in self.injectable_layers):
+            if self.covariate_projection_modeling == "cat":
+                return _LAYER_INJECT_CAT
+            if self.covariate_projection_modeling == "linear":
+                return _LAYER_INJECT_LINEAR
+            raise NotImplementedError()
+        return _LAYER_PLAIN
 
     def set_online_update_hooks(self, previous_n_cats_per_cov, n_cats_per_cov):
         """Set online update hooks."""
@@ -280,7 +373,7 @@ class FCLayers(nn.Module):
                 else:
                     raise NotImplementedError()
 
-    def forward(self, x: torch.Tensor, cat_full_tensor: torch.Tensor):
+    def forward(self, x: torch.Tensor, cat_full_tensor: torch.Tensor, output_subset: torch.Tensor | None = None):
         """Forward computation on ``x``.
 
         Parameters
@@ -289,13 +382,16 @@ class FCLayers(nn.Module):
             tensor of values with shape ``(n_in,)``
         cat_full_tensor
             Tensor of category membership(s) for this sample
+        output_subset
+            Indices of the output features to compute. All features are computed if None.
+            Requires a last block without normalization (see `supports_output_subset`).
 
         Returns
         -------
         :class:`torch.Tensor`
             tensor of shape ``(n_out,)``
         """
-        if self.covariate_vector_modeling == "one_hot":
+        if self._one_hot_covariates:
             concat_list = []
             if cat_full_tensor is not None:
                 cat_list = torch.split(cat_full_tensor, 1, dim=1)
@@ -308,11 +404,41 @@ class FCLayers(nn.Module):
                 if n_cat and cat is None:
                     raise ValueError("cat not provided while n_cat != 0 in init. params.")
                 concat_list += [one_hot(cat, n_cat)]
-        elif self.covariate_vector_modeling == "emb_shared":
+        elif self._shared_covariates:
             concat_list = [cat_full_tensor]
         else:
             concat_list = []
 
+        if output_subset is not None and not self.supports_output_subset:
+            raise NotImplementedError("Computing a subset of outputs requires a last block without normalization.")
+
+        use_checkpointing = self.gradient_checkpointing and self.training and torch.is_grad_enabled()
+        n_blocks = len(self._layer_kinds)
+        for block_index in range(n_blocks):
+            subset = output_subset if block_index == n_blocks - 1 else None
+            if use_checkpointing:
+                x = checkpoint(
+                    self._block_forward,
+                    block_index,
+                    x,
+                    concat_list,
+                    cat_full_tensor,
+                    subset,
+                    use_reentrant=False,
+                    context_fn=functools.partial(_batch_norm_preserving_context, self.fc_layers[block_index]),
+                )
+            else:
+                x = self._block_forward(block_index, x, concat_list, cat_full_tensor, subset)
+        return x
+
+    def _block_forward(
+        self,
+        block_index: int,
+        x: torch.Tensor,
+        concat_list: list[torch.Tensor],
+        cat_full_tensor: torch.Tensor,
+        subset: torch.Tensor | None,
+    ) -> torch.Tensor:
         def dimension_transformation(t):
             if x.dim() == t.dim():
                 return t
@@ -320,35 +446,37 @@ class FCLayers(nn.Module):
                 return t.unsqueeze(dim=1).expand(-1, x.shape[1], -1)
             raise NotImplementedError()
 
-        for layers in self.fc_layers:
-            concat_list_layer = concat_list
-            projected_batch_layer = None
-            for layer in layers:
-                if layer is not None:
-                    if isinstance(layer, nn.BatchNorm1d):
-                        if x.dim() == 3:
-                            x = layer(x.reshape(x.shape[0], -1)).reshape(x.shape)
-                        else:
-                            x = layer(x)
-                    elif isinstance(layer, MultiEmbedding):
-                        assert self.covariate_vector_modeling in ["emb"]
-                        assert len(concat_list) == 0
-                        concat_list_layer = [layer(cat_full_tensor.int())]
-                    elif layer in self.linear_batch_projections:
-                        assert self.covariate_projection_modeling == "linear"
-                        projected_batch_layer = layer(torch.cat(concat_list_layer, dim=-1))
-                    else:
-                        if layer in self.injectable_layers:
-                            if self.covariate_projection_modeling == "cat":
-                                current_cat_tensor = dimension_transformation(torch.cat(concat_list_layer, dim=-1))
-                                x = torch.cat((x, current_cat_tensor), dim=-1)
-                                x = layer(x)
-                            elif self.covariate_projection_modeling in ["linear"]:
-                                x = layer(x) + dimension_transformation(projected_batch_layer)
-                            else:
-                                raise NotImplementedError()
-                        else:
-                            x = layer(x)
+        layers = self.fc_layers[block_index]
+        layer_kinds = self._layer_kinds[block_index]
+        concat_list_layer = concat_list
+        projected_batch_layer = None
+        for position, (layer, layer_kind) in enumerate(zip(layers, layer_kinds, strict=True)):
+            if subset is not None and position == self._output_layer_position:
+                if layer_kind == _LAYER_INJECT_CAT:
+                    current_cat_tensor = dimension_transformation(torch.cat(concat_list_layer, dim=-1))
+                    x = _subset_projection(layer, torch.cat((x, current_cat_tensor), dim=-1), subset)
+                elif layer_kind == _LAYER_INJECT_LINEAR:
+                    x = _subset_projection(layer, x, subset)
+                    x = x + dimension_transformation(projected_batch_layer)[..., subset]
+                else:
+                    x = _subset_projection(layer, x, subset)
+                continue
+            if layer_kind == _LAYER_BATCH_NORM:
+                if x.dim() == 3:
+                    x = layer(x.reshape(x.shape[0], -1)).reshape(x.shape)
+                else:
+                    x = layer(x)
+            elif layer_kind == _LAYER_EMBEDDING:
+                concat_list_layer = [layer(cat_full_tensor.int())]
+            elif layer_kind == _LAYER_BATCH_PROJECTION:
+                projected_batch_layer = layer(torch.cat(concat_list_layer, dim=-1))
+            elif layer_kind == _LAYER_INJECT_CAT:
+                current_cat_tensor = dimension_transformation(torch.cat(concat_list_layer, dim=-1))
+                x = layer(torch.cat((x, current_cat_tensor), dim=-1))
+            elif layer_kind == _LAYER_INJECT_LINEAR:
+                x = layer(x) + dimension_transformation(projected_batch_layer)
+            else:
+                x = layer(x)
         return x
 
 
@@ -524,12 +652,14 @@ class Encoder(nn.Module):
             x = torch.cat((x, cont_full_tensor), dim=-1)
         # Parameters for latent distribution
         q = self.encoder(self.input_dropout(x), cat_full_tensor) if self.encoder is not None else x
-        q_m = self.mean_encoder(q, cat_full_tensor)
-        q_v = self.var_activation(self.var_encoder(q, cat_full_tensor)) + self.var_eps
-        dist = Normal(q_m, q_v.sqrt())
-        latent = self.z_transformation(dist.rsample())
+        q_m, q_v = to_fp32(self.mean_encoder(q, cat_full_tensor), self.var_encoder(q, cat_full_tensor))
+        with fp32_region(q_v.device.type):
+            q_v = self.var_activation(q_v) + self.var_eps
         if self.return_dist:
-            return dist, latent
+            dist = Normal(q_m, q_v.sqrt())
+            return dist, self.z_transformation(dist.rsample())
+        # reparameterized sample without constructing (and validating) a distribution
+        latent = self.z_transformation(q_m + q_v.sqrt() * torch.randn_like(q_m))
         return q_m, q_v, latent
 
 
@@ -576,6 +706,10 @@ class DecoderDRVI(nn.Module):
         A layer Factory instance for building layers
     covariate_modeling_strategy
         The strategy model takes to model covariates
+    gradient_checkpointing
+        Whether to recompute activations in backward instead of keeping them in memory during training.
+        The shared decoder layers are checkpointed block by block, and the networks of the likelihood
+        parameters together with the aggregation of splits as one block.
     **kwargs
         Keyword args for :class:`~scvi.nn.FCLayers`.
     """
@@ -607,11 +741,13 @@ class DecoderDRVI(nn.Module):
             "emb_shared_linear",
         ] = "one_hot",
         categorical_covariate_dims: Sequence[int] = (),
+        gradient_checkpointing: bool = False,
         **kwargs,
     ):
         super().__init__()
         self.n_output = n_output
         self.gene_likelihood_module = gene_likelihood_module
+        self.gradient_checkpointing = gradient_checkpointing
 
         self.split_method = split_method
         self.n_split = n_split
@@ -657,6 +793,7 @@ class DecoderDRVI(nn.Module):
                 layers_location="intermediate",
                 covariate_modeling_strategy=covariate_modeling_strategy,
                 covariate_embs_dim=categorical_covariate_dims,
+                gradient_checkpointing=gradient_checkpointing,
                 **kwargs,
             )
         else:
@@ -692,7 +829,33 @@ class DecoderDRVI(nn.Module):
             else:
                 raise NotImplementedError()
         self.params_nets = nn.ParameterDict(params_nets)
-
+        self._param_kinds = tuple(
+            (
+                param_name,
+                _PARAM_FIXED
+                if param_info.startswith("fixed=")
+                else (_PARAM_NETWORK if param_info == "no_transformation" else _PARAM_PER_FEATURE),
+            )
+            for param_name, param_info in params_for_likelihood.items()
+        )
+        if split_aggregation not in _SPLIT_AGGREGATIONS:
+            raise NotImplementedError()
+        self._split_aggregation_kind = _SPLIT_AGGREGATIONS[split_aggregation]
+        self._split_method_power = self.split_method == "power"
+        self._split_method_map = self.split_method == "split_map"
+
+    def aggregate_splits(self, param_value: torch.Tensor) -> torch.Tensor:
+        """Aggregate a parameter of shape ``(batch, n_split, n_output)`` over splits."""
+        if self._split_aggregation_kind == _SPLIT_AGGREGATIONS["sum"]:
+            # to get average
+            return param_value.sum(dim=-2) / self.n_split
+        if self._split_aggregation_kind == _SPLIT_AGGREGATIONS["logsumexp"]:
+            # to cancel the effect of n_splits
+            with fp32_region(param_value.device.type):
+                return torch.logsumexp(param_value.float(), dim=-2) - math.log(self.n_split)
+        return torch.amax(param_value, dim=-2)
+
+    @record_stage("decoder")
     def forward(
         self,
         z: torch.Tensor,
@@ -700,6 +863,7 @@ class DecoderDRVI(nn.Module):
         cont_full_tensor: torch.Tensor,
         library: torch.Tensor,
         gene_likelihood_additional_info: dict,
+        feature_subset: torch.Tensor | None = None,
     ):
         """The forward computation for a single sample.
 
@@ -717,6 +881,9 @@ class DecoderDRVI(nn.Module):
             library size
         gene_likelihood_additional_info
             additional info returned by gene likelihood module
+        feature_subset
+            Indices of the output features to compute. The distribution is over these features only.
+            Requires a gene likelihood module with `supports_feature_subset`.
 
         Returns
         -------
@@ -724,10 +891,10 @@ class DecoderDRVI(nn.Module):
         """
         batch_size = z.shape[0]
         if self.n_split > 1:
-            if self.split_method == "power":
+            if self._split_method_power:
                 z = self.split_transformation(z)
             z = torch.reshape(z, (batch_size, self.n_split, -1))
-            if self.split_method == "split_map":
+            if self._split_method_map:
                 z = torch.einsum("bsd,sdn->bsn", z, self.split_transformation_weight)
 
         if cont_full_tensor is not None:
@@ -735,38 +902,51 @@ class DecoderDRVI(nn.Module):
                 cont_full_tensor = cont_full_tensor.unsqueeze(1).expand(-1, self.n_split, -1)
             z = torch.cat((z, cont_full_tensor), dim=-1)
 
-        last_tensor = self.px_shared_decoder(z, cat_full_tensor) if self.px_shared_decoder is not None else z
+        with record_stage("decoder_shared_layers"):
+            last_tensor = self.px_shared_decoder(z, cat_full_tensor) if self.px_shared_decoder is not None else z
+        if feature_subset is not None and not self.gene_likelihood_module.supports_feature_subset:
+            raise NotImplementedError("The gene likelihood module does not support computing a subset of features.")
+        with record_stage("decoder_split_parameters"):
+            if self.gradient_checkpointing and self.training and torch.is_grad_enabled():
+                # the per-split outputs (batch x n_split x n_output) are recomputed in backward
+                params, original_params = checkpoint(
+                    self._compute_params, last_tensor, cat_full_tensor, feature_subset, use_reentrant=False
+                )
+            else:
+                params, original_params = self._compute_params(last_tensor, cat_full_tensor, feature_subset)
+
+        # Note this logic:
+        # distribution parameters (exp, softmax, library size correction) are computed in float32 under autocast
+        with fp32_region(z.device.type):
+            params = dict(zip(params.keys(), to_fp32(*params.values()), strict=True))
+            px_dist = self.gene_likelihood_module.dist(
+                aux_info=gene_likelihood_additional_info, parameters=params, lib_y=library
+            )
+        return px_dist, params, original_params
+
+    def _compute_params(
+        self,
+        last_tensor: torch.Tensor,
+        cat_full_tensor: torch.Tensor,
+        feature_subset: torch.Tensor | None,
+    ) -> tuple[dict, dict]:
+        """Compute the likelihood parameters aggregated over splits and per split."""
+        batch_size = last_tensor.shape[0]
+        n_output = self.n_output if feature_subset is None else feature_subset.shape[0]
         original_params = {}
         params = {}
-        for param_name, param_info in self.gene_likelihood_module.parameters.items():
+        for param_name, param_kind in self._param_kinds:
             param_net = self.params_nets[param_name]
-            if param_info.startswith("fixed="):
+            if param_kind == _PARAM_FIXED:
                 original_params[param_name] = param_net
-                params[param_name] = param_net.reshape(1, 1).expand(batch_size, self.n_output)
-            elif param_info == "no_transformation":
-                param_value = param_net(last_tensor, cat_full_tensor)
+                params[param_name] = param_net.reshape(1, 1).expand(batch_size, n_output)
+            elif param_kind == _PARAM_NETWORK:
+                param_value = param_net(last_tensor, cat_full_tensor, output_subset=feature_subset)
                 original_params[param_name] = param_value
-                if self.n_split > 1:
-                    if self.split_aggregation == "sum":
-                        # to get average
-                        params[param_name] = param_value.sum(dim=-2) / self.n_split
-                    elif self.split_aggregation == "logsumexp":
-                        # to cancel the effect of n_splits
-                        params[param_name] = torch.logsumexp(param_value, dim=-2) - math.log(self.n_split)
-                    elif self.split_aggregation == "max":
-                        params[param_name] = torch.amax(param_value, dim=-2)
-                    else:
-                        raise NotImplementedError()
-                else:
-                    params[param_name] = param_value
-            elif param_info == "per_feature":
+                params[param_name] = self.aggregate_splits(param_value) if self.n_split > 1 else param_value
+            else:
+                if feature_subset is not None:
+                    param_net = param_net[feature_subset]
                 original_params[param_name] = param_net
                 params[param_name] = param_net.unsqueeze(0).expand(batch_size, -1)
-            else:
-                raise NotImplementedError()
-
-        # Note this logic:
-        px_dist = self.gene_likelihood_module.dist(
-            aux_info=gene_likelihood_additional_info, parameters=params, lib_y=library
-        )
-        return px_dist, params, original_params
+        return params, original_params
@@ -0,0 +1,16 @@
+from ._benchmark import benchmark_compile
+from ._callbacks import AsyncValidationCallback, StepValidationCallback
+from ._distributed import benchmark_ddp_scaling, ddp_strategy, get_rank_and_world_size
+from ._profiling import ThroughputProfilerCallback
+from ._training_plan import DRVITrainingPlan
+
+__all__ = [
+    "AsyncValidationCallback",
+    "DRVITrainingPlan",
+    "StepValidationCallback",
+    "ThroughputProfilerCallback",
+    "benchmark_compile",
+    "benchmark_ddp_scaling",
+    "ddp_strategy",
+    "get_rank_and_world_size",
+]
@@ -0,0 +1,102 @@
+import copy
+import time
+
+import pandas as pd
+import torch
+from scvi import REGISTRY_KEYS
+
+
+def _clone_batch(batch: dict) -> dict:
+    """Copy the tensors of a batch, as data loaders may recycle their buffers."""
+    return {key: value.clone() if isinstance(value, torch.Tensor) else value for key, value in batch.items()}
+
+
+def _time_module(module, batches, train: bool, n_warmup: int) -> tuple[float, float]:
+    """Seconds of the first step and mean seconds per step after warm-up."""
+    module.train(train)
+    optimizer = torch.optim.SGD(module.parameters(), lr=0.0) if train else None
+
+    def step(batch):
+        if train:
+            _, _, losses = module(batch, loss_kwargs={"kl_weight": 1.0})
+            optimizer.zero_grad()
+            losses.loss.backward()
+            optimizer.step()
+        else:
+            with torch.inference_mode():
+                module(batch, loss_kwargs={"kl_weight": 1.0})
+
+    start_time = time.perf_counter()
+    step(batches[0])
+    first_step_time = time.perf_counter() - start_time
+    for batch in batches[1 : n_warmup + 1]:
+        step(batch)
+    timed_batches = batches[n_warmup + 1 :] or batches
+    start_time = time.perf_counter()
+    for batch in timed_batches:
+        step(batch)
+    return first_step_time, (time.perf_counter() - start_time) / len(timed_batches)
+
+
+def benchmark_compile(
+    model,
+    adata=None,
+    batch_size: int = 128,
+    n_batches: int = 20,
+    n_warmup: int = 3,
+    compile_kwargs: dict | None = None,
+) -> pd.DataFrame:
+    """
+    Compare training and inference step times of the eager and the compiled model.
+
+    Both variants run on copies of the module, so the model itself is not changed.
+
+    Parameters
+    ----------
+    model
+        DRVI model.
+    adata
+        Data to take the mini-batches from. Defaults to the data used to initialize the model.
+    batch_size
+        Mini-batch size.
+    n_batches
+        Number of mini-batches per measurement.
+    n_warmup
+        Number of steps run after the first (compiling) step before timing.
+    compile_kwargs
+        Keyword arguments of :func:`torch.compile`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per stage ('train' and 'inference') and variant ('eager' and 'compiled') with the time of the
+        first step (including compilation), seconds per step, cells per second and the speedup over eager.
+    """
+    adata = model._validate_anndata(adata)
+    batches = []
+    for batch in model._make_data_loader(adata=adata, batch_size=batch_size, shuffle=False):
+        batches.append(_clone_batch(batch))
+        if len(batches) >= n_batches:
+            break
+    n_cells = sum(len(batch[REGISTRY_KEYS.X_KEY]) for batch in batches) / len(batches)
+
+    results = []
+    for variant in ["eager", "compiled"]:
+        module = copy.deepcopy(model.module)
+        if variant == "compiled":
+            module.compile_layers(**(compile_kwargs or {}))
+        for stage in ["train", "inference"]:
+            first_step_time, step_time = _time_module(module, batches, train=stage == "train", n_warmup=n_warmup)
+            results.append(
+                {
+                    "stage": stage,
+                    "variant": variant,
+                    "first_step_sec": first_step_time,
+                    "sec_per_step": step_time,
+                    "cells_per_sec": n_cells / step_time,
+                }
+            )
+    results = pd.DataFrame(results)
+    eager_time = results[results["variant"] == "eager"].set_index("stage")["sec_per_step"]
+    results["speedup"] = results["stage"].map(eager_time) / results["sec_per_step"]
+    return results
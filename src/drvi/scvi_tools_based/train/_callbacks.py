@@ -0,0 +1,163 @@
+import copy
+import logging
+import multiprocessing
+import queue
+
+import lightning.pytorch as pl
+import torch
+from lightning.pytorch.callbacks import EarlyStopping, ModelCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+def _run_validation(module, data_module, kl_weight, max_batches, n_threads, result_queue, step):
+    """Compute validation metrics of a module snapshot. Runs in a forked process."""
+    torch.set_num_threads(n_threads)
+    module.eval()
+    totals = {"loss": 0.0, "reconstruction_loss": 0.0, "kl_local": 0.0, "kl_global": 0.0}
+    n_obs = 0
+    with torch.inference_mode():
+        for i, batch in enumerate(data_module.val_dataloader()):
+            if max_batches is not None and i >= max_batches:
+                break
+            _, _, loss_output = module(batch, loss_kwargs={"kl_weight": kl_weight})
+            n_obs_batch = loss_output.n_obs_minibatch
+            totals["loss"] += loss_output.loss.item() * n_obs_batch
+            totals["reconstruction_loss"] += loss_output.reconstruction_loss_sum.item()
+            totals["kl_local"] += loss_output.kl_local_sum.item()
+            totals["kl_global"] = loss_output.kl_global_sum.item()
+            n_obs += n_obs_batch
+    n_obs = max(n_obs, 1)
+    metrics = {
+        "validation_loss": totals["loss"] / n_obs,
+        "reconstruction_loss_validation": totals["reconstruction_loss"] / n_obs,
+        "kl_local_validation": totals["kl_local"] / n_obs,
+        "elbo_validation": (totals["reconstruction_loss"] + totals["kl_local"]) / n_obs + totals["kl_global"],
+    }
+    result_queue.put((step, metrics))
+
+
+class StepValidationCallback(pl.Callback):
+    """
+    Validate every `every_n_steps` training steps, counted across epochs.
+
+    The scvi trainer never validates when `check_val_every_n_epoch` is None, which Lightning requires
+    for validation intervals longer than an epoch, so the interval is set when the trainer is set up.
+
+    Parameters
+    ----------
+    every_n_steps
+        Number of training steps between validations.
+    """
+
+    def __init__(self, every_n_steps: int):
+        super().__init__()
+        self.every_n_steps = every_n_steps
+
+    def setup(self, trainer, pl_module, stage):
+        trainer.val_check_interval = self.every_n_steps
+        trainer.check_val_every_n_epoch = None
+
+
+class AsyncValidationCallback(pl.Callback):
+    """
+    Run validation in a background process on a snapshot of the weights.
+
+    Every `every_n_steps` training steps, a process is forked that evaluates the current weights
+    on the validation loader of the datamodule while training continues. On CPU the fork itself is
+    the snapshot (copy-on-write), on accelerators the module is first copied to CPU.
+    A new validation is skipped while the previous one is still running.
+    Metrics are logged with an `async_` prefix at the step the snapshot was taken and stored in `history`.
+
+    Since results arrive late, these metrics are not available to early stopping, checkpointing or learning rate
+    schedulers. Training raises a ValueError if any of them monitors a validation metric.
+    Requires the `fork` start method (Linux).
+
+    Parameters
+    ----------
+    every_n_steps
+        Number of training steps between validations.
+    n_threads
+        Number of torch threads of the validation process.
+    max_batches
+        Maximum number of validation batches. All batches are used if None.
+    """
+
+    def __init__(self, every_n_steps: int, n_threads: int = 1, max_batches: int | None = None):
+        super().__init__()
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Asynchronous validation requires the 'fork' start method, which is not available.")
+        self.every_n_steps = every_n_steps
+        self.n_threads = n_threads
+        self.max_batches = max_batches
+        self.history = []
+        self._context = multiprocessing.get_context("fork")
+        self._queue = None
+        self._process = None
+        self._last_step = None
+
+    def setup(self, trainer, pl_module, stage):
+        monitors = [
+            callback.monitor
+            for callback in trainer.callbacks
+            if isinstance(callback, EarlyStopping | ModelCheckpoint) and callback.monitor is not None
+        ]
+        if getattr(pl_module, "reduce_lr_on_plateau", False):
+            monitors.append(pl_module.lr_scheduler_metric)
+        monitors = [monitor for monitor in monitors if "validation" in monitor]
+        if len(monitors) > 0:
+            raise ValueError(
+                f"Asynchronous validation can not provide the monitored metrics {monitors} to early stopping, "
+                "checkpointing or learning rate schedulers. Monitor a training metric or validate synchronously."
+            )
+
+    def on_train_start(self, trainer, pl_module):
+        self._queue = self._context.Queue()
+
+    def _collect(self, trainer):
+        while True:
+            try:
+                step, metrics = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            metrics = {f"async_{key}": value for key, value in metrics.items()}
+            self.history.append({"step": step, **metrics})
+            if trainer.logger is not None:
+                trainer.logger.log_metrics(metrics, step=step)
+
+    def _launch(self, trainer, pl_module):
+        module = pl_module.module
+        if next(module.parameters()).device.type != "cpu":
+            module = copy.deepcopy(module).cpu()
+        self._process = self._context.Process(
+            target=_run_validation,
+            args=(
+                module,
+                trainer.datamodule,
+                float(pl_module.kl_weight),
+                self.max_batches,
+                self.n_threads,
+                self._queue,
+                trainer.global_step,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        self._collect(trainer)
+        if self._process is not None and not self._process.is_alive():
+            self._process.join()
+            self._process = None
+        step = trainer.global_step
+        if step % self.every_n_steps == 0 and step != self._last_step and self._process is None:
+            if trainer.is_global_zero:
+                self._launch(trainer, pl_module)
+            self._last_step = step
+
+    def on_train_end(self, trainer, pl_module):
+        if self._process is not None:
+            # the result is flushed to the queue before the process exits
+            self._process.join()
+            self._process = None
+        self._collect(trainer)
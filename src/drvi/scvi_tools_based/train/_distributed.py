@@ -0,0 +1,110 @@
+import copy
+import os
+import time
+from collections.abc import Sequence
+
+import pandas as pd
+import torch
+
+
+def get_rank_and_world_size() -> tuple[int, int]:
+    """Rank of this process and number of processes of the initialized process group, `(0, 1)` otherwise."""
+    if torch.distributed.is_available() and torch.distributed.is_initialized():
+        return torch.distributed.get_rank(), torch.distributed.get_world_size()
+    return 0, 1
+
+
+def ddp_strategy(**kwargs):
+    """
+    Lightning DDP strategy for CPU training with the gloo backend.
+
+    Processes are forked, so the data registered in the model is shared with the workers
+    and the trained weights of rank 0 are available in the main process after training.
+
+    Parameters
+    ----------
+    **kwargs
+        Keyword arguments of :class:`lightning.pytorch.strategies.DDPStrategy`.
+        Unused parameters are not searched for, as every trainable parameter of a DRVI module gets a gradient
+        in every step (e.g. features outside of a `reconstruction_feature_subset` get zero gradients).
+        Pass `find_unused_parameters=True` for custom modules with parameters skipped in some steps.
+    """
+    from lightning.pytorch.strategies import DDPStrategy
+
+    kwargs.setdefault("process_group_backend", "gloo")
+    kwargs.setdefault("start_method", "fork")
+    return DDPStrategy(**kwargs)
+
+
+def benchmark_ddp_scaling(
+    model,
+    n_processes: Sequence[int] = (1, 2, 4),
+    max_epochs: int = 2,
+    batch_size: int = 128,
+    threads_per_process: int | None = None,
+    sync_batch_norm: bool = False,
+    **train_kwargs,
+) -> pd.DataFrame:
+    """
+    Measure the training throughput of the model with a growing number of local DDP processes.
+
+    Every run trains a fresh copy of the untrained module, so the model itself is not changed.
+
+    Parameters
+    ----------
+    model
+        DRVI model.
+    n_processes
+        Numbers of processes to train with. 1 trains in the main process without DDP.
+    max_epochs
+        Number of epochs of every run.
+    batch_size
+        Mini-batch size of every process. The effective batch size grows with the number of processes.
+    threads_per_process
+        Number of torch threads of every process. Defaults to the available threads divided by the number
+        of processes, so that runs do not oversubscribe the machine.
+    sync_batch_norm
+        Whether to synchronize batch normalization statistics between processes.
+    **train_kwargs
+        Keyword arguments of :meth:`~drvi.model.DRVI.train`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per number of processes with the training time in seconds, cells per second,
+        the speedup over the first row and the parallel efficiency (speedup per process relative to the first row).
+    """
+    n_cells = model.adata.n_obs if hasattr(model.adata, "n_obs") else None
+    n_threads = torch.get_num_threads()
+    total_threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    train_kwargs = {"accelerator": "cpu", "train_size": 1.0, **train_kwargs}
+
+    results = []
+    try:
+        for n in n_processes:
+            run_model = copy.copy(model)
+            run_model.module = copy.deepcopy(model.module)
+            run_model.is_trained_ = False
+            torch.set_num_threads(threads_per_process or max(total_threads // n, 1))
+            start_time = time.perf_counter()
+            run_model.train(
+                max_epochs=max_epochs,
+                batch_size=batch_size,
+                n_processes=n if n > 1 else None,
+                sync_batch_norm=sync_batch_norm,
+                **train_kwargs,
+            )
+            seconds = time.perf_counter() - start_time
+            results.append(
+                {
+                    "n_processes": n,
+                    "seconds": seconds,
+                    "cells_per_sec": n_cells * max_epochs / seconds if n_cells is not None else float("nan"),
+                }
+            )
+    finally:
+        torch.set_num_threads(n_threads)
+    results = pd.DataFrame(results)
+    results["speedup"] = results["seconds"].iloc[0] / results["seconds"]
+    results["efficiency"] = results["speedup"] * results["n_processes"].iloc[0] / results["n_processes"]
+    return results
@@ -0,0 +1,178 @@
+import lightning.pytorch as pl
+import torch
+from scvi import REGISTRY_KEYS
+
+from drvi.nn_modules.profiling import StageTimer, set_stage_timer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def _peak_memory_mb(device: torch.device) -> float:
+    """Peak allocated memory of the device, or the peak resident memory of the process on CPU."""
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    if resource is None:
+        return float("nan")
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class ThroughputProfilerCallback(pl.Callback):
+    """
+    Log where training time goes: wall time per stage, cells per second and peak memory.
+
+    Stages annotated in the model (`inference`, `generative`, `decoder`, `decoder_shared_layers`,
+    `decoder_split_parameters`, `loss`, `reconstruction_loss` and `prior_kl`, see
+    :func:`~drvi.nn_modules.profiling.record_stage`) are timed together with `data_loading`
+    (waiting for the next batch), `backward`, `optimizer_step` and the whole training `step`.
+    Nested stages are included in the time of their parents. Validation is not timed.
+    With gradient checkpointing (see :class:`~drvi.scvi_tools_based.module.DRVIModule`), the decoder is partly
+    recomputed in backward, so its work is counted in both the decoder stages and `backward`.
+
+    Every `log_every_n_steps` training steps, the mean milliseconds per step of every stage are logged
+    as `profile_<stage>_ms`, together with `profile_cells_per_sec` and `profile_peak_memory_mb`
+    (peak allocated memory on CUDA, peak resident memory of the process on CPU) to the trainer logger
+    and appended to `history`.
+
+    Optionally, a :mod:`torch.profiler` chrome trace of a few training steps is written, in which the stages
+    and the data loaders appear as `drvi::<name>` ranges.
+
+    Parameters
+    ----------
+    log_every_n_steps
+        Number of training steps to average over.
+    trace_path
+        Path of the chrome trace (`.json`) to export. No trace is recorded if None.
+        Only the process of global rank zero is traced.
+    trace_wait
+        Number of training steps to skip before tracing (one more step is used for the profiler warm-up).
+    trace_active
+        Number of training steps to trace.
+
+    Examples
+    --------
+    >>> profiler = ThroughputProfilerCallback(log_every_n_steps=20, trace_path="trace.json")
+    >>> model.train(callbacks=[profiler])
+    >>> pd.DataFrame(profiler.history)
+    """
+
+    def __init__(
+        self,
+        log_every_n_steps: int = 50,
+        trace_path: str | None = None,
+        trace_wait: int = 5,
+        trace_active: int = 5,
+    ):
+        super().__init__()
+        self.log_every_n_steps = log_every_n_steps
+        self.trace_path = trace_path
+        self.trace_wait = trace_wait
+        self.trace_active = trace_active
+        self.history = []
+        self._timer = None
+        self._previous_timer = None
+        self._profiler = None
+        self._backward_start_time = None
+        self._optimizer_step_start_time = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self._n_steps = 0
+        self._n_cells = 0
+        self._window_seconds = 0.0
+        self._times = {}
+        self._batch_ready_time = None
+        self._last_batch_end_time = None
+
+    def _now(self) -> float:
+        return self._timer.now()
+
+    def _add(self, stage: str, seconds: float):
+        self._times[stage] = self._times.get(stage, 0.0) + seconds
+
+    def on_train_start(self, trainer, pl_module):
+        self._timer = StageTimer(synchronize=pl_module.device.type == "cuda")
+        self._previous_timer = set_stage_timer(self._timer)
+        self._reset_window()
+        if pl_module.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(pl_module.device)
+        if self.trace_path is not None and trainer.is_global_zero:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if pl_module.device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            trace_path = self.trace_path
+            self._profiler = torch.profiler.profile(
+                activities=activities,
+                schedule=torch.profiler.schedule(wait=self.trace_wait, warmup=1, active=self.trace_active, repeat=1),
+                on_trace_ready=lambda profiler: profiler.export_chrome_trace(trace_path),
+            )
+            self._profiler.start()
+
+    def on_train_epoch_start(self, trainer, pl_module):
+        self._last_batch_end_time = self._now()
+
+    def on_train_batch_start(self, trainer, pl_module, batch, batch_idx):
+        self._batch_ready_time = self._now()
+        if self._last_batch_end_time is not None:
+            self._add("data_loading", self._batch_ready_time - self._last_batch_end_time)
+        # stages recorded outside of training steps (e.g. prior initialization) are not counted
+        self._timer.pop()
+
+    def on_before_backward(self, trainer, pl_module, loss):
+        self._backward_start_time = self._now()
+
+    def on_after_backward(self, trainer, pl_module):
+        self._add("backward", self._now() - self._backward_start_time)
+
+    def on_before_optimizer_step(self, trainer, pl_module, optimizer):
+        self._optimizer_step_start_time = self._now()
+
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        end_time = self._now()
+        if self._optimizer_step_start_time is not None:
+            self._add("optimizer_step", end_time - self._optimizer_step_start_time)
+            self._optimizer_step_start_time = None
+        for stage, seconds in self._timer.pop().items():
+            self._add(stage, seconds)
+        self._add("step", end_time - self._batch_ready_time)
+        self._window_seconds += end_time - (self._last_batch_end_time or self._batch_ready_time)
+        self._last_batch_end_time = end_time
+        self._n_steps += 1
+        self._n_cells += batch[REGISTRY_KEYS.X_KEY].shape[0]
+        if self._profiler is not None:
+            self._profiler.step()
+        if self._n_steps >= self.log_every_n_steps:
+            self._log(trainer, pl_module)
+
+    def _log(self, trainer, pl_module):
+        metrics = {f"profile_{stage}_ms": seconds / self._n_steps * 1000 for stage, seconds in self._times.items()}
+        metrics["profile_cells_per_sec"] = self._n_cells / max(self._window_seconds, 1e-9)
+        metrics["profile_peak_memory_mb"] = _peak_memory_mb(pl_module.device)
+        step = trainer.global_step
+        self.history.append({"step": step, **metrics})
+        if trainer.logger is not None:
+            trainer.logger.log_metrics(metrics, step=step)
+        self._reset_window()
+        self._last_batch_end_time = self._now()
+
+    def on_validation_start(self, trainer, pl_module):
+        if self._timer is not None:
+            set_stage_timer(None)
+
+    def on_validation_end(self, trainer, pl_module):
+        if self._timer is not None:
+            set_stage_timer(self._timer)
+        # waiting for validation is not data loading
+        self._last_batch_end_time = None
+
+    def on_train_end(self, trainer, pl_module):
+        if self._n_steps > 0:
+            self._log(trainer, pl_module)
+        set_stage_timer(self._previous_timer)
+        self._timer = None
+        if self._profiler is not None:
+            self._profiler.stop()
+            self._profiler = None
@@ -0,0 +1,39 @@
+import dataclasses
+
+from scvi.train import TrainingPlan
+
+
+class DRVITrainingPlan(TrainingPlan):
+    """
+    Training plan of DRVI models.
+
+    Same as :class:`scvi.train.TrainingPlan`, with the trainer's `global_step` passed to the loss of the module
+    as `metrics_step` in training and validation steps, so that extra metrics are computed on a schedule
+    of optimizer steps and never outside of training (e.g. in :meth:`~drvi.model.DRVI.get_latent_representation`).
+    """
+
+    def training_step(self, batch, batch_idx):
+        """Training step for the model."""
+        self.loss_kwargs["metrics_step"] = self.global_step
+        return super().training_step(batch, batch_idx)
+
+    def validation_step(self, batch, batch_idx):
+        """Validation step for the model."""
+        self.loss_kwargs["metrics_step"] = self.global_step
+        return super().validation_step(batch, batch_idx)
+
+    def compute_and_log_metrics(self, loss_output, metrics, mode):
+        """Log the losses and the extra metrics of a step."""
+        # scvi logs in inference mode, and inference tensors can not be reduced in place across DDP processes
+        super().compute_and_log_metrics(dataclasses.replace(loss_output, extra_metrics={}), metrics, mode)
+        for key, value in loss_output.extra_metrics.items():
+            if value.shape != ():
+                raise ValueError("Extra tracked metrics should be 0-d tensors.")
+            self.log(
+                f"{key}_{mode}",
+                value.detach(),
+                on_step=False,
+                on_epoch=True,
+                batch_size=loss_output.n_obs_minibatch,
+                sync_dist=self.use_sync_dist,
+            )
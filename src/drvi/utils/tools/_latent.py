@@ -9,6 +9,7 @@ def set_latent_dimension_stats(
     embed: AnnData,
     inplace: bool = True,
     vanished_threshold=0.1,
+    summary: dict | None = None,
 ):
     """
     Set the latent dimension statistics of a DRVI model into var of an embedding anndata.
@@ -21,24 +22,39 @@ def set_latent_dimension_stats(
         latent representation of the model.
     inplace
         Whether to modify the input AnnData object or return a new one.
+    vanished_threshold
+        Dimensions with max absolute value below this threshold are marked as vanished.
+    summary
+        Output of :meth:`~drvi.model.DRVI.compute_post_training_summary`.
+        If given, the reconstruction effects and latent statistics are taken from it instead of being recomputed.
+        Reconstruction effects are computed with the model if the summary does not contain them.
     """
     if not inplace:
         embed = embed.copy()
 
     if "original_dim_id" not in embed.var:
         embed.var["original_dim_id"] = np.arange(embed.var.shape[0])
-
-    embed.var["reconstruction_effect"] = 0
-    embed.var["reconstruction_effect"].loc[embed.var.sort_values("original_dim_id").index] = (
-        model.get_reconstruction_effect_of_each_split()
-    )
+    # values computed by the model are in the original order of the dimensions
+    original_order_index = embed.var.sort_values("original_dim_id").index
+
+    embed.var["reconstruction_effect"] = 0.0
+    if summary is not None and "reconstruction_effect" in summary:
+        reconstruction_effect = summary["reconstruction_effect"]
+    else:
+        reconstruction_effect = model.get_reconstruction_effect_of_each_split()
+    embed.var.loc[original_order_index, "reconstruction_effect"] = reconstruction_effect
     embed.var["order"] = (-embed.var["reconstruction_effect"]).argsort().argsort()
 
-    embed.var["max_value"] = np.abs(embed.X).max(axis=0)
-    embed.var["mean"] = embed.X.mean(axis=0)
-    embed.var["min"] = embed.X.min(axis=0)
-    embed.var["max"] = embed.X.max(axis=0)
-    embed.var["std"] = np.abs(embed.X).std(axis=0)
+    if summary is not None:
+        for stat in ["max_value", "mean", "min", "max", "std"]:
+            embed.var[stat] = 0.0
+            embed.var.loc[original_order_index, stat] = summary["latent_stats"][stat]
+    else:
+        embed.var["max_value"] = np.abs(embed.X).max(axis=0)
+        embed.var["mean"] = embed.X.mean(axis=0)
+        embed.var["min"] = embed.X.min(axis=0)
+        embed.var["max"] = embed.X.max(axis=0)
+        embed.var["std"] = np.abs(embed.X).std(axis=0)
 
     embed.var["title"] = "DR " + (1 + embed.var["order"]).astype(str)
     embed.var["vanished"] = embed.var["max_value"] < vanished_threshold
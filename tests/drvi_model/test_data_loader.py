@@ -0,0 +1,78 @@
+import anndata as ad
+import numpy as np
+from scipy import sparse
+
+from drvi.model import DRVI
+from drvi.scvi_tools_based.data import ChunkAlignedBatchSampler, DRVIAnnDataLoader
+
+
+class TestChunkAlignedLoading:
+    def make_backed_adata(self, path, n=1_000, g=50, b=3):
+        exp_matrix = np.random.poisson(1.0, [n, g]).astype(np.float32)
+        adata = ad.AnnData(X=sparse.csr_matrix(exp_matrix))
+        adata.obs["batch"] = [f"batch_{i}" for i in np.random.choice(range(b), n)]
+        adata.obs_names = [f"cell_{i}" for i in range(n)]
+        adata.write_h5ad(path)
+        return ad.read_h5ad(path, backed="r"), exp_matrix
+
+    def test_chunk_aligned_batch_sampler(self):
+        indices = np.random.permutation(1_000)[:700]
+        sampler = ChunkAlignedBatchSampler(indices, batch_size=64, shuffle=True, chunks_per_batch=4, seed=0)
+        batches = list(sampler)
+        assert len(batches) == len(sampler)
+
+        positions = np.concatenate(batches)
+        assert sorted(positions) == list(range(len(indices)))
+        for batch in batches:
+            rows = indices[batch]
+            assert np.all(np.diff(rows) > 0)
+            # each block is a run of consecutive positions in the sorted order of rows
+            sorted_rank = np.searchsorted(np.sort(indices), rows)
+            assert np.sum(np.diff(sorted_rank) > 1) < sampler.chunks_per_batch
+        assert list(ChunkAlignedBatchSampler(indices, 64, shuffle=True, seed=0)) == batches
+
+    def test_distributed_chunk_aligned_batch_sampler(self):
+        indices = np.random.permutation(1_000)[:700]
+        samplers = [
+            ChunkAlignedBatchSampler(indices, 64, shuffle=True, seed=0, num_replicas=3, rank=rank) for rank in range(3)
+        ]
+        batches = [list(sampler) for sampler in samplers]
+        assert all(len(rank_batches) == len(samplers[0]) == 4 for rank_batches in batches)
+        positions = np.concatenate([np.concatenate(rank_batches) for rank_batches in batches])
+        assert set(positions.tolist()) == set(range(len(indices)))
+        # a single padding batch is repeated from the start of the epoch
+        assert len(positions) - len(indices) == 64
+
+    def test_backed_anndata_training(self, tmp_path):
+        adata, exp_matrix = self.make_backed_adata(tmp_path / "adata.h5ad")
+        DRVI.setup_anndata(adata, categorical_covariate_keys=["batch"])
+        model = DRVI(adata, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+
+        data_loader = model._make_data_loader(adata, batch_size=64, shuffle=True)
+        assert isinstance(data_loader, DRVIAnnDataLoader)
+        assert isinstance(data_loader.sampler, ChunkAlignedBatchSampler)
+
+        model.train(accelerator="cpu", max_epochs=2)
+        latent = model.get_latent_representation(adata)
+        assert latent.shape == (exp_matrix.shape[0], 8)
+
+    def test_csr_collate(self):
+        n, g = 300, 40
+        exp_matrix = np.random.poisson(0.5, [n, g]).astype(np.float32)
+        adata = ad.AnnData(X=sparse.csr_matrix(exp_matrix))
+        adata.obs["batch"] = [f"batch_{i}" for i in np.random.choice(range(3), n)]
+        DRVI.setup_anndata(adata, categorical_covariate_keys=["batch"])
+        model = DRVI(adata, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+
+        indices = np.random.permutation(n)[:200]
+        data_loader = model._make_data_loader(adata, indices=indices, batch_size=64, n_buffers=2)
+        if not data_loader.use_csr_collate:
+            return
+        X = np.concatenate([batch["X"].numpy().copy() for batch in data_loader])
+        np.testing.assert_array_equal(X, exp_matrix[indices])
+
+        dense_loader = model._make_data_loader(adata, indices=indices, batch_size=64, csr_collate=False)
+        X_dense = np.concatenate([batch["X"].numpy() for batch in dense_loader])
+        np.testing.assert_array_equal(X, X_dense)
+
+        model.train(accelerator="cpu", max_epochs=1, datasplitter_kwargs={"num_workers": 2})
@@ -1,9 +1,31 @@
+import os
+
 import anndata as ad
 import numpy as np
 import pandas as pd
+import pytest
+import torch
 from scipy import sparse
 
-from drvi.model import DRVI
+from drvi.model import (
+    DRVI,
+    DRVIRuntime,
+    benchmark_quantization,
+    calibrate_quantization,
+    export_model,
+    quantization_report,
+    quantize_model,
+)
+from drvi.nn_modules.layer.linear_layer import QuantizedStackedLinearLayer, StackedLinearLayer
+from drvi.nn_modules.precision import to_fp32
+from drvi.scvi_tools_based.model.base._batch_size import estimate_memory_per_cell
+from drvi.scvi_tools_based.train import (
+    AsyncValidationCallback,
+    ThroughputProfilerCallback,
+    benchmark_compile,
+    benchmark_ddp_scaling,
+    ddp_strategy,
+)
 
 
 class TestDRVIModel:
@@ -78,6 +100,16 @@ class TestDRVIModel:
         model.train(accelerator="cpu", max_epochs=10)
         latent = model.get_latent_representation(adata)
         assert latent.shape[0] == adata.n_obs
+        return model
+
+    def _setup_small_test_adata(self, layer="counts"):
+        adata = self.make_test_adata()
+        DRVI.setup_anndata(adata, categorical_covariate_keys=["batch"], layer=layer, is_count_data=layer == "counts")
+        return adata
+
+    def _small_model(self, adata, **kwargs):
+        default_args = {"n_latent": 8, "encoder_dims": [32], "decoder_dims": [32], "categorical_covariates": ["batch"]}
+        return DRVI(adata, **{**default_args, **kwargs})
 
     def test_dimension_reduction_with_no_batch(self):
         adata = self.make_test_adata()
@@ -93,7 +125,25 @@ class TestDRVIModel:
 
     def test_simple_integration_with_masking(self):
         adata = self.make_test_adata()
-        self._general_integration_test(adata, fill_in_the_blanks_ratio=0.5)
+        model = self._general_integration_test(adata, fill_in_the_blanks_ratio=0.5)
+
+        module = model.module.train()
+        tensors = next(iter(model._make_data_loader(adata=adata, batch_size=64)))
+        inference_outputs, generative_outputs, losses = module(tensors)
+        masked_genes = inference_outputs["masked_genes"]
+        # exactly half of the genes, without duplicates, are masked in every cell
+        assert masked_genes.shape == (64, self.g // 2)
+        assert all(len(torch.unique(genes)) == self.g // 2 for genes in masked_genes)
+        # the reconstruction loss is the loss over the masked genes only
+        mask = torch.zeros_like(tensors["X"]).scatter(1, masked_genes, 1.0)
+        expected_loss = -(generative_outputs["px"].log_prob(tensors["X"]) * mask).sum(dim=-1)
+        torch.testing.assert_close(losses.reconstruction_loss["reconstruction_loss"], expected_loss)
+
+        # small ratios draw gene indices directly instead of a random key per gene
+        masked_genes = module._sample_masked_genes(1_000, 100, 5, "cpu")
+        assert masked_genes.shape == (1_000, 5)
+        assert (masked_genes[:, 1:] > masked_genes[:, :-1]).all()
+        assert (torch.bincount(masked_genes.flatten(), minlength=100) > 0).all()
 
     def test_simple_integration_latent_splitting(self):
         adata = self.make_test_adata()
@@ -306,3 +356,446 @@ class TestDRVIModel:
                 print(inference_inputs)
                 transfer_model.module.inference(**inference_inputs)
                 break
+
+    def test_post_training_summary(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=2)
+
+        summary = model.compute_post_training_summary(adata)
+
+        np.testing.assert_allclose(summary["latent"], model.get_latent_representation(adata), rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(
+            summary["reconstruction_effect"],
+            model.get_reconstruction_effect_of_each_split(adata),
+            rtol=1e-4,
+        )
+        np.testing.assert_allclose(
+            summary["max_effect"],
+            model.get_max_effect_of_splits_within_distribution(adata),
+            rtol=1e-4,
+        )
+        assert summary["latent_stats"]["max"].shape == (8,)
+
+        from drvi.utils.tools import set_latent_dimension_stats
+
+        # statistics from the summary are aligned to dimensions of a reordered embedding
+        embed = ad.AnnData(summary["latent"], obs=adata.obs)
+        embed.var["original_dim_id"] = np.arange(8)
+        embed = embed[:, ::-1].copy()
+        expected = set_latent_dimension_stats(model, embed, inplace=False).var
+        stats = ["reconstruction_effect", "order", "max_value", "mean", "min", "max", "std"]
+        for summary_kwargs in [{}, {"reconstruction_effect": False, "extra_step_funcs": {}}]:
+            partial_summary = model.compute_post_training_summary(adata, max_effect=False, **summary_kwargs)
+            result = set_latent_dimension_stats(model, embed, inplace=False, summary=partial_summary).var
+            pd.testing.assert_frame_equal(result[stats], expected[stats], rtol=1e-4, check_dtype=False)
+
+    def test_encoder_only_iteration(self):
+        adata = self._setup_small_test_adata(layer="lognorm")
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=2)
+
+        def step_func(inference_outputs, generative_outputs, losses, store):
+            assert generative_outputs is None and losses is None
+            store.append(inference_outputs["qz_m"].cpu())
+
+        latent = model.iterate_on_ae_output(
+            adata, step_func, lambda store: np.concatenate(store), deterministic=True, inference_only=True
+        )
+        summary = model.compute_post_training_summary(adata, reconstruction_effect=False, max_effect=False)
+        np.testing.assert_allclose(latent, model.get_latent_representation(adata), rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(summary["latent"], latent, rtol=1e-5, atol=1e-5)
+
+    def test_online_split_effect_reductions(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=2)
+
+        max_effect = model.get_max_effect_of_splits_within_distribution(adata)
+        assert max_effect.shape == (8, adata.n_vars)
+        mean_effect = model.get_effect_of_splits_within_distribution(adata, reduction="mean")
+        assert np.all(mean_effect <= max_effect + 1e-6)
+        quantiles = model.get_effect_of_splits_within_distribution(
+            adata, reduction="quantile", reducer_kwargs={"quantiles": (0.5, 0.9)}
+        )
+        assert quantiles.shape == (2, 8, adata.n_vars)
+
+    def test_inference_batch_size_autotuning(self):
+        from drvi.scvi_tools_based.model.base._batch_size import autotune_batch_size
+
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=1)
+
+        per_cell = estimate_memory_per_cell(model.module)
+        assert per_cell > estimate_memory_per_cell(model.module, include_decoder=False)
+        assert autotune_batch_size(model.module, memory_budget=per_cell * 100) == 100
+        assert autotune_batch_size(model.module, memory_budget=1e3) == 16
+
+        effects = model.get_reconstruction_effect_of_each_split(adata, batch_size="auto", memory_budget=per_cell * 100)
+        np.testing.assert_allclose(effects, model.get_reconstruction_effect_of_each_split(adata), rtol=1e-4)
+        decoded = model.decode_latent_samples(
+            np.zeros((10, 8), dtype=np.float32), cat_key=np.zeros((10, 1), dtype=np.int64), batch_size="auto"
+        )
+        assert decoded.shape == (10, adata.n_vars)
+
+    def test_multi_process_inference(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=2)
+
+        summary = model.compute_post_training_summary(adata)
+        parallel_summary = model.compute_post_training_summary(adata, n_workers=3)
+        for key in ["latent", "reconstruction_effect", "max_effect"]:
+            np.testing.assert_allclose(parallel_summary[key], summary[key], rtol=1e-4, atol=1e-5)
+        assert not any(parameter.is_shared() for parameter in model.module.parameters())
+
+        def store_batch_size(inference_outputs, generative_outputs, losses, store):
+            store.append(inference_outputs["qz_m"].shape[0])
+
+        # the automatic batch size is split between the workers
+        per_cell = estimate_memory_per_cell(model.module, include_decoder=False)
+        batch_sizes = model.iterate_on_ae_output(
+            adata,
+            store_batch_size,
+            list,
+            batch_size="auto",
+            memory_budget=per_cell * 100,
+            inference_only=True,
+            n_workers=2,
+        )
+        assert max(batch_sizes) == 50
+
+        parent_pid = os.getpid()
+
+        def crash_in_worker(inference_outputs, generative_outputs, losses, store):
+            if os.getpid() != parent_pid:
+                os._exit(1)
+
+        with pytest.raises(RuntimeError, match="died with exit code 1"):
+            model.iterate_on_ae_output(adata, crash_in_worker, list, inference_only=True, n_workers=2)
+
+    def test_step_based_and_async_validation(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=2, batch_size=128, val_every_n_steps=3)
+        assert "validation_loss" in model.history
+
+        model.train(accelerator="cpu", max_epochs=2, batch_size=128, val_every_n_steps=3, async_validation=True)
+        # scvi only extends the history of a trained model with known keys, so read the logger of this run
+        history = model.trainer.logger.history
+        assert "validation_loss" not in history
+        assert len(history["async_validation_loss"]) > 0
+        assert np.isfinite(history["async_elbo_validation"].values.astype(float)).all()
+        # validation metrics of background processes can not be monitored
+        for train_kwargs in [{"early_stopping": True}, {"plan_kwargs": {"reduce_lr_on_plateau": True}}]:
+            with pytest.raises(ValueError, match="Asynchronous validation"):
+                model.train(accelerator="cpu", max_epochs=1, val_every_n_steps=3, async_validation=True, **train_kwargs)
+
+        callback = AsyncValidationCallback(every_n_steps=3)
+        model.train(accelerator="cpu", max_epochs=2, batch_size=128, callbacks=[callback], limit_val_batches=0)
+        assert len(callback.history) > 0
+        assert all(entry["step"] % 3 == 0 for entry in callback.history)
+        assert np.isfinite(callback.history[-1]["async_validation_loss"])
+
+    def test_bf16_autocast(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata, gene_likelihood="pnb")
+        model.train(accelerator="cpu", max_epochs=3)
+
+        def collect_loss(inference_outputs, generative_outputs, losses, store):
+            store.append(losses.loss.item())
+
+        elbo = {}
+        latent = {}
+        for name, dtype in [("fp32", None), ("bf16", torch.bfloat16)]:
+            elbo[name] = model.iterate_on_ae_output(
+                adata, collect_loss, np.mean, deterministic=True, autocast_dtype=dtype
+            )
+            latent[name] = model.compute_post_training_summary(
+                adata, reconstruction_effect=False, max_effect=False, autocast_dtype=dtype
+            )["latent"]
+        assert latent["bf16"].dtype == np.float32
+        np.testing.assert_allclose(elbo["bf16"], elbo["fp32"], rtol=1e-2)
+        correlation = np.corrcoef(latent["bf16"].ravel(), latent["fp32"].ravel())[0, 1]
+        assert correlation > 0.99
+
+        decoded = model.decode_latent_samples(
+            latent["fp32"][:10], cat_key=np.zeros((10, 1), dtype=np.int64), autocast_dtype=torch.bfloat16
+        )
+        assert decoded.dtype == np.float32
+
+        model.train(accelerator="cpu", max_epochs=2, autocast_dtype=torch.bfloat16)
+        assert np.isfinite(model.history["elbo_train"].values.astype(float)).all()
+
+        # float64 tensors are only cast under autocast, lower precision tensors always
+        x64, x16 = torch.randn(4, dtype=torch.float64), torch.randn(4, dtype=torch.bfloat16)
+        assert [t.dtype for t in to_fp32(x64, x16)] == [torch.float64, torch.float32]
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            assert [t.dtype for t in to_fp32(x64, x16)] == [torch.float32, torch.float32]
+
+    def test_compile_layers(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata, gene_likelihood="nb", decoder_reuse_weights="nowhere")
+        model.train(accelerator="cpu", max_epochs=1)
+        latent = model.get_latent_representation(adata)
+
+        results = benchmark_compile(model, batch_size=128, n_batches=4, n_warmup=1, compile_kwargs={"backend": "eager"})
+        assert len(results) == 4
+        assert (results["sec_per_step"] > 0).all()
+
+        # the eager backend with fullgraph fails on any graph break
+        model.module.compile_layers(backend="eager", fullgraph=True)
+        np.testing.assert_allclose(model.get_latent_representation(adata), latent, rtol=1e-5, atol=1e-6)
+        model.train(accelerator="cpu", max_epochs=1)
+        assert not any("_orig_mod" in key for key in model.module.state_dict())
+
+    def test_export_model(self, tmp_path):
+        adata = self._setup_small_test_adata()
+        for covariate_modeling_strategy in ["one_hot", "emb_shared_linear"]:
+            model = self._small_model(
+                adata,
+                gene_likelihood="nb_libnorm",
+                use_batch_norm="both",
+                covariate_modeling_strategy=covariate_modeling_strategy,
+            )
+            model.train(accelerator="cpu", max_epochs=2)
+            path = export_model(model, str(tmp_path / covariate_modeling_strategy))
+
+            runtime = DRVIRuntime(path)
+            latent = runtime.get_latent_representation(
+                adata.layers["counts"], {"batch": adata.obs["batch"].values}, batch_size=300
+            )
+            np.testing.assert_allclose(latent, model.get_latent_representation(adata), rtol=1e-4, atol=1e-4)
+
+            z = np.random.randn(10, 8).astype(np.float32)
+            cat = np.random.randint(0, self.b, (10, 1))
+            np.testing.assert_allclose(
+                runtime.decode_latent_samples(z, cat),
+                model.decode_latent_samples(z, cat_key=cat),
+                rtol=1e-4,
+                atol=1e-4,
+            )
+
+    def test_quantization(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata, gene_likelihood="nb", decoder_reuse_weights="nowhere")
+        model.train(accelerator="cpu", max_epochs=5)
+        latent = model.get_latent_representation(adata)
+
+        calibration = calibrate_quantization(model, n_cells=200, tolerance=0.05)
+        assert any(layer.startswith("decoder.params_nets.mean") for layer in calibration.index)
+        assert calibration["quantize"].dtype == bool
+
+        quantized_model = quantize_model(model)
+        assert quantized_model.module is not model.module
+        np.testing.assert_allclose(model.get_latent_representation(adata), latent)
+        quantized_latent = quantized_model.get_latent_representation(adata)
+        assert np.linalg.norm(quantized_latent - latent) < 0.1 * np.linalg.norm(latent)
+
+        report = quantization_report(model, quantized_model, n_cells=200)
+        assert report["quantized_size_bytes"] < report["size_bytes"]
+        assert -1.0 <= report["min_latent_correlation"] <= report["latent_correlation"] <= 1.0
+        assert abs(report["relative_reconstruction_loss_delta"]) < 0.05
+
+        # all splits of a stacked layer are computed at once from int8 weights
+        stacked_layers = [
+            layer for layer in quantized_model.module.modules() if isinstance(layer, QuantizedStackedLinearLayer)
+        ]
+        assert len(stacked_layers) > 0
+        assert all(layer.weight_int8.dtype == torch.int8 for layer in stacked_layers)
+        float_layer = StackedLinearLayer(4, 16, 8)
+        x = torch.randn(32, 4, 16)
+        for per_channel in [True, False]:
+            quantized_layer = QuantizedStackedLinearLayer.from_float(float_layer, per_channel=per_channel)
+            torch.testing.assert_close(quantized_layer(x), float_layer(x), rtol=0.0, atol=0.05)
+            # weights are dequantized a few channels at a time
+            chunked_layer = QuantizedStackedLinearLayer.from_float(
+                float_layer, per_channel=per_channel, channels_per_chunk=3
+            )
+            torch.testing.assert_close(chunked_layer(x), quantized_layer(x))
+
+        benchmark = benchmark_quantization(model, quantized_model, n_batches=4, n_warmup=1)
+        assert benchmark["variant"].tolist() == ["float", "quantized"]
+        assert (benchmark["cells_per_sec"] > 0).all()
+        assert benchmark["speedup"].iloc[0] == 1.0
+
+    def test_gene_subsampled_reconstruction_loss(self):
+        adata = self._setup_small_test_adata()
+        for importance in [0.0, 0.5]:
+            model = self._small_model(
+                adata,
+                gene_likelihood="nb",
+                decoder_reuse_weights="nowhere",
+                reconstruction_feature_subset=0.25,
+                reconstruction_subset_importance=importance,
+            )
+            model.train(accelerator="cpu", max_epochs=2)
+            assert np.isfinite(model.history["elbo_train"].values.astype(float)).all()
+
+        module = model.module.eval()
+        z = torch.randn(10, 8)
+        library = torch.full((10,), 1000.0)
+        cat = torch.randint(0, self.b, (10, 1))
+        subset = torch.tensor([3, 0, 7, 7])
+        params = module.generative(z, library, {}, cat_covs=cat)["params"]
+        subset_params = module.generative(z, library, {}, cat_covs=cat, feature_subset=subset)["params"]
+        for key in ["mean", "r"]:
+            torch.testing.assert_close(subset_params[key], params[key][:, subset])
+
+        # the rescaled loss over sampled features is an unbiased estimate of the full loss
+        x = torch.from_numpy(adata.layers["counts"][:10].toarray())
+        log_prob = module.generative(z, x.sum(dim=-1), {}, cat_covs=cat)["px"].log_prob(x)
+        estimates = []
+        for _ in range(2000):
+            feature_subset, feature_weights = module._sample_feature_subset(x)
+            estimates.append((log_prob[:, feature_subset] * feature_weights).sum(dim=-1))
+        torch.testing.assert_close(torch.stack(estimates).mean(dim=0), log_prob.sum(dim=-1), rtol=0.05, atol=1.0)
+
+        # the default softmax-normalized likelihood needs all features and fails at construction
+        with pytest.raises(ValueError, match="pnb_softmax"):
+            DRVI(adata, categorical_covariates=["batch"], reconstruction_feature_subset=0.25)
+
+    def test_training_metrics(self):
+        adata = self._setup_small_test_adata()
+        # no extra metrics are computed by default
+        model = self._small_model(adata)
+        model.train(accelerator="cpu", max_epochs=1, check_val_every_n_epoch=1)
+        assert not any(key.startswith("mse_") for key in model.history)
+
+        model = self._small_model(adata, metrics=["mse"], metrics_interval=3)
+        metric_calls = []
+        compute_metrics = model.module._compute_metrics
+
+        def record_metric_call(*args):
+            metric_calls.append(model.module.training)
+            return compute_metrics(*args)
+
+        model.module._compute_metrics = record_metric_call
+        model.train(accelerator="cpu", max_epochs=1, check_val_every_n_epoch=1)
+        # metrics are logged every `metrics_interval` optimizer steps in training and in every validation step
+        assert "mse_train" in model.history
+        assert "mse_validation" in model.history
+        assert metric_calls.count(True) == -(-model.trainer.global_step // 3)
+        assert metric_calls.count(False) > 0
+
+        # metrics are not computed outside of training and validation steps
+        metric_calls.clear()
+        model.iterate_on_ae_output(adata, lambda *args: None, lambda *args: None, deterministic=True)
+        assert metric_calls == []
+
+        for reconstruction_feature_subset in [None, 50]:
+            model = self._small_model(
+                adata,
+                gene_likelihood="nb",
+                reconstruction_feature_subset=reconstruction_feature_subset,
+                metrics={
+                    "mse": {},
+                    "kl_per_split": {},
+                    "reconstruction_by_gene_group": {"gene_groups": {"first": list(range(10))}},
+                },
+                metrics_interval=2,
+                metrics_n_cells=32,
+            )
+            model.train(accelerator="cpu", max_epochs=2, check_val_every_n_epoch=1)
+            keys = ["mse_train", "mse_validation", "kl_split_0_train", "kl_split_7_train"]
+            for key in [*keys, "reconstruction_loss_first_train"]:
+                assert key in model.history
+                assert np.isfinite(model.history[key].values.astype(float)).all()
+
+    def test_distributed_training(self):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata, use_batch_norm="both")
+        weights = {key: value.clone() for key, value in model.module.state_dict().items()}
+        model.train(max_epochs=2, batch_size=128, n_processes=2, sync_batch_norm=True)
+        state_dict = model.module.state_dict()
+        running_means = [key for key in state_dict if key.endswith("running_mean")]
+        assert len(running_means) > 0
+        for key in running_means:
+            assert not torch.equal(state_dict[key], weights[key])
+        assert len(model.train_indices) > 0
+        assert np.isfinite(model.get_latent_representation(adata)).all()
+
+        # every parameter gets a gradient in every step, also with feature subsets, so DDP does not search for
+        # unused parameters (which would fail the step otherwise)
+        assert not ddp_strategy()._ddp_kwargs.get("find_unused_parameters", False)
+        subset_model = self._small_model(adata, gene_likelihood="nb", reconstruction_feature_subset=0.25)
+        subset_model.train(max_epochs=1, batch_size=128, n_processes=2)
+        assert np.isfinite(subset_model.get_latent_representation(adata)).all()
+
+        results = benchmark_ddp_scaling(model, n_processes=(1, 2), max_epochs=1, batch_size=128)
+        assert results["n_processes"].tolist() == [1, 2]
+        assert (results["cells_per_sec"] > 0).all()
+        assert results["speedup"].iloc[0] == 1.0
+
+    def test_gradient_checkpointing(self):
+        adata = self._setup_small_test_adata()
+        models = [
+            self._small_model(
+                adata,
+                n_latent=16,
+                decoder_dims=[32, 32],
+                gene_likelihood="nb",
+                decoder_reuse_weights="nowhere",
+                use_batch_norm="both",
+                decoder_dropout_rate=0.1,
+                gradient_checkpointing=gradient_checkpointing,
+            )
+            for gradient_checkpointing in [False, True]
+        ]
+        models[1].module.load_state_dict(models[0].module.state_dict())
+        tensors = next(iter(models[0]._make_data_loader(adata=adata, batch_size=128)))
+
+        def count_saved_bytes(tensor):
+            saved_bytes[-1] += tensor.numel() * tensor.element_size()
+            return tensor
+
+        losses = []
+        saved_bytes = []
+        for model in models:
+            module = model.module.train()
+            torch.manual_seed(0)
+            saved_bytes.append(0)
+            # checkpointed blocks keep their inputs only, their activations are not saved for backward
+            with torch.autograd.graph.saved_tensors_hooks(count_saved_bytes, lambda tensor: tensor):
+                loss = module(tensors)[2].loss
+            loss.backward()
+            losses.append(loss.detach())
+        torch.testing.assert_close(losses[1], losses[0])
+        assert saved_bytes[1] < saved_bytes[0]
+        parameters = dict(models[1].module.named_parameters())
+        for name, parameter in models[0].module.named_parameters():
+            if parameter.grad is not None:
+                torch.testing.assert_close(parameters[name].grad, parameter.grad, msg=name)
+        # batch norm statistics are not updated again when recomputing activations
+        buffers = dict(models[1].module.named_buffers())
+        for name, buffer in models[0].module.named_buffers():
+            torch.testing.assert_close(buffers[name], buffer, msg=name)
+
+        models[1].train(accelerator="cpu", max_epochs=2)
+        assert np.isfinite(models[1].history["elbo_train"].values.astype(float)).all()
+        assert np.isfinite(models[1].get_latent_representation(adata)).all()
+
+    def test_throughput_profiler(self, tmp_path, monkeypatch):
+        adata = self._setup_small_test_adata()
+        model = self._small_model(adata)
+        trace_path = tmp_path / "trace.json"
+        profiler = ThroughputProfilerCallback(log_every_n_steps=4, trace_path=str(trace_path), trace_wait=1)
+        model.train(accelerator="cpu", max_epochs=2, batch_size=128, callbacks=[profiler], check_val_every_n_epoch=1)
+
+        # 2 epochs of 8 steps (900 training cells)
+        assert [row["step"] for row in profiler.history] == [4, 8, 12, 16]
+        stages = ["data_loading", "inference", "generative", "decoder", "loss", "prior_kl", "backward", "step"]
+        for key in [*[f"profile_{stage}_ms" for stage in stages], "profile_cells_per_sec", "profile_peak_memory_mb"]:
+            assert key in model.history
+            assert (model.history[key].values.astype(float) > 0).all()
+        for row in profiler.history:
+            assert row["profile_decoder_ms"] <= row["profile_generative_ms"] <= row["profile_step_ms"]
+        assert "drvi::decoder_split_parameters" in trace_path.read_text()
+
+        # without a timer or a running profiler, stages do not enter profiler ranges
+        ranges = []
+        with monkeypatch.context() as patch:
+            patch.setattr(torch.profiler, "record_function", lambda name: ranges.append(name))
+            model.get_latent_representation(adata)
+        assert ranges == []
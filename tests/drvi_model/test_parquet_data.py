@@ -0,0 +1,303 @@
+import os
+
+import anndata as ad
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from scipy import sparse
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+from drvi.model import DRVI  # noqa: E402
+from drvi.scvi_tools_based.merlin_data import (  # noqa: E402
+    ParquetData,
+    ParquetDataLoader,
+    ParquetDataset,
+    SparseColumnPair,
+    _parquet_data,
+    anndata_to_parquet,
+    batch_covariate_entropy,
+    benchmark_shuffle_settings,
+    clear_metadata_cache,
+)
+from drvi.scvi_tools_based.merlin_data._sparse import decode_sparse_batch  # noqa: E402
+
+
+def write_test_parquet_data(path, n=1_000, g=50, b=3, n_parts=3, row_group_size=100):
+    """Write random counts in the merlin layout."""
+    batches = np.random.choice(range(b), n)
+    exp_matrix = np.random.poisson(1.0, [n, g]).astype(np.float32)
+    for split in ["train", "val", "test"]:
+        os.makedirs(os.path.join(path, split))
+        for part, rows in enumerate(np.array_split(np.arange(n), n_parts)):
+            table = pa.table(
+                {
+                    "X": pa.array(list(exp_matrix[rows]), type=pa.list_(pa.float32())),
+                    "batch": pa.array(batches[rows], type=pa.int64()),
+                    "cell_id": pa.array(rows, type=pa.int64()),
+                }
+            )
+            pq.write_table(table, os.path.join(path, split, f"part.{part}.parquet"), row_group_size=row_group_size)
+    pd.DataFrame({"gene": [f"gene_{i}" for i in range(g)]}).to_parquet(os.path.join(path, "var.parquet"))
+    os.makedirs(os.path.join(path, "categorical_lookup"))
+    pd.DataFrame({"batch": [f"batch_{i}" for i in range(b)]}).to_parquet(
+        os.path.join(path, "categorical_lookup", "batch.parquet")
+    )
+    return exp_matrix
+
+
+class TestParquetData:
+    def test_parquet_data_loader_covers_all_rows(self, tmp_path):
+        exp_matrix = write_test_parquet_data(tmp_path)
+        data = ParquetData(str(tmp_path))
+        assert data.n_vars == exp_matrix.shape[1]
+        assert data.has_col("batch")
+
+        dataset = data.get_dataset("train", ["X", "cell_id"])
+        loader = ParquetDataLoader(dataset, batch_size=64, shuffle=True, parts_per_chunk=2, seed=0)
+        batches = list(loader)
+        assert len(batches) == len(loader)
+        assert all(len(batch["cell_id"]) == 64 for batch in batches[:-1])
+
+        cell_ids = np.concatenate([batch["cell_id"].numpy() for batch in batches])
+        assert sorted(cell_ids) == list(range(exp_matrix.shape[0]))
+        assert not np.array_equal(cell_ids, np.arange(exp_matrix.shape[0]))
+        X = np.concatenate([batch["X"].numpy() for batch in batches])
+        np.testing.assert_array_equal(X, exp_matrix[cell_ids])
+
+    def test_distributed_parquet_data_loader(self, tmp_path):
+        write_test_parquet_data(tmp_path)
+        dataset = ParquetData(str(tmp_path)).get_dataset("train", ["X", "cell_id"])
+        loaders = [
+            ParquetDataLoader(dataset, batch_size=64, shuffle=True, parts_per_chunk=2, num_replicas=2, rank=rank)
+            for rank in range(2)
+        ]
+        for _ in range(2):
+            n_batches = len(loaders[0])
+            batches = [list(loader) for loader in loaders]
+            assert len(batches[0]) == len(batches[1]) == n_batches
+            cell_ids = [
+                np.concatenate([batch["cell_id"].numpy() for batch in rank_batches]) for rank_batches in batches
+            ]
+            assert len(np.intersect1d(cell_ids[0], cell_ids[1])) == 0
+            assert len(cell_ids[0]) + len(cell_ids[1]) > dataset.num_rows - 2 * 64 * 2
+
+    def test_drvi_on_parquet_data_with_ddp(self, tmp_path):
+        exp_matrix = write_test_parquet_data(tmp_path)
+        data = ParquetData(str(tmp_path))
+        DRVI.setup_merlin_data(data, layer="X", categorical_covariate_keys=["batch"])
+        model = DRVI(data, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+        model.train(max_epochs=2, batch_size=128, n_processes=2)
+        latent = model.get_latent_representation(data)
+        assert latent.shape == (exp_matrix.shape[0], 8)
+        assert np.isfinite(latent).all()
+
+    def test_parquet_dataset_row_groups(self, tmp_path):
+        write_test_parquet_data(tmp_path, n=300, n_parts=2, row_group_size=50)
+        dataset = ParquetDataset(ParquetData._list_data_files(str(tmp_path), "train"), columns=["X"])
+        assert len(dataset.row_groups) == 6
+        assert dataset.num_rows == 300
+
+    def test_drvi_on_parquet_data(self, tmp_path):
+        exp_matrix = write_test_parquet_data(tmp_path)
+        data = ParquetData(str(tmp_path))
+        DRVI.setup_merlin_data(data, layer="X", categorical_covariate_keys=["batch"])
+        model = DRVI(data, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+        model.train(accelerator="cpu", max_epochs=2, batch_size=128)
+        latent = model.get_latent_representation(data)
+        assert latent.shape == (exp_matrix.shape[0], 8)
+
+    def test_shuffle_settings(self, tmp_path):
+        write_test_parquet_data(tmp_path, n=1_000, n_parts=5, row_group_size=50)
+        data = ParquetData(str(tmp_path))
+        DRVI.setup_merlin_data(data, layer="X", categorical_covariate_keys=["batch"])
+        model = DRVI(data, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+
+        data_splitter = model._data_splitter_cls(model.adata_manager, batch_size=64, shuffle_buffer_size=200, seed=0)
+        assert data_splitter.train_dataloader().parts_per_chunk == 4
+        assert data_splitter.val_dataloader().parts_per_chunk == 1
+
+        first = [batch["X"].numpy() for batch in data_splitter.train_dataloader()]
+        second = [batch["X"].numpy() for batch in data_splitter.train_dataloader()]
+        np.testing.assert_array_equal(np.concatenate(first), np.concatenate(second))
+
+        results = benchmark_shuffle_settings(model, [{"parts_per_chunk": 1}, {"parts_per_chunk": 20}], batch_size=64)
+        assert len(results) == 2
+        assert (results["cells_per_sec"] > 0).all()
+        assert (results["mean_stall_ms"] >= 0).all()
+
+    def test_batch_covariate_entropy(self):
+        labels = np.repeat(np.arange(4), 100)
+        assert batch_covariate_entropy(np.split(labels, 8)) == 0.0
+        assert batch_covariate_entropy(np.split(np.random.permutation(labels), 8)) > 0.9
+
+    def test_sub_sampling_modes(self, tmp_path):
+        write_test_parquet_data(tmp_path, n=1_000, n_parts=5, row_group_size=50)
+
+        data = ParquetData(str(tmp_path), sub_sample_frac=0.25, sub_sample_mode="row_groups")
+        dataset = data.get_dataset("train", ["X", "cell_id"])
+        assert dataset.npartitions == 5
+        assert dataset.num_rows == 250
+
+        assert ParquetData(str(tmp_path), sub_sample_frac=0.25).get_dataset("train", ["X"]).num_rows == 250
+
+        # files are kept at random, not in the order they were written
+        kept_files = [
+            ParquetData(str(tmp_path), sub_sample_frac=0.4, sub_sample_mode="files", sub_sample_seed=seed)
+            .get_dataset("train", ["X"])
+            .files
+            for seed in range(10)
+        ]
+        assert all(len(files) == 2 for files in kept_files)
+        assert len({tuple(files) for files in kept_files}) > 1
+        same_files = ParquetData(str(tmp_path), sub_sample_frac=0.4, sub_sample_mode="files", sub_sample_seed=0)
+        assert same_files.get_dataset("train", ["X"]).files == kept_files[0]
+
+        data = ParquetData(str(tmp_path), sub_sample_frac=0.1, sub_sample_mode="rows", sub_sample_stratify_key="batch")
+        dataset = data.get_dataset("train", ["X", "batch", "cell_id"])
+        batch = next(iter(ParquetDataLoader(dataset, batch_size=1_000)))
+        assert len(batch["cell_id"]) == dataset.num_rows
+        assert abs(dataset.num_rows - 100) <= 3
+        assert len(np.unique(batch["batch"].numpy())) == 3
+        assert len(np.unique(batch["cell_id"].numpy())) == dataset.num_rows
+
+        same_data = ParquetData(
+            str(tmp_path), sub_sample_frac=0.1, sub_sample_mode="rows", sub_sample_stratify_key="batch"
+        )
+        same_batch = next(iter(ParquetDataLoader(same_data.get_dataset("train", ["cell_id"]), batch_size=1_000)))
+        np.testing.assert_array_equal(batch["cell_id"].numpy(), same_batch["cell_id"].numpy())
+
+    def test_validation_sub_sampling(self, tmp_path):
+        write_test_parquet_data(tmp_path, n=1_000, n_parts=5, row_group_size=50)
+        data = ParquetData(str(tmp_path))
+        DRVI.setup_merlin_data(data, layer="X", categorical_covariate_keys=["batch"])
+        model = DRVI(data, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+
+        data_splitter = model._data_splitter_cls(model.adata_manager, batch_size=64, val_sub_sample_frac=0.2)
+        val_dataset = data_splitter.get_dataset("val")
+        assert val_dataset.num_rows == 200
+        assert data_splitter.get_dataset("train").num_rows == 1_000
+        assert val_dataset.row_groups == data_splitter.get_dataset("val").row_groups
+
+        # sub-sampling composes with the sub-sampling of the data
+        data = ParquetData(str(tmp_path), sub_sample_frac=0.5, sub_sample_mode="rows")
+        dataset = data.get_dataset("val", ["cell_id"])
+        selected = set(next(iter(ParquetDataLoader(dataset, batch_size=1_000)))["cell_id"].numpy())
+        dataset.sub_sample(0.5, mode="row_groups")
+        assert set(next(iter(ParquetDataLoader(dataset, batch_size=1_000)))["cell_id"].numpy()) <= selected
+
+        model.train(
+            accelerator="cpu",
+            max_epochs=2,
+            batch_size=64,
+            val_every_n_steps=5,
+            datasplitter_kwargs={"val_sub_sample_frac": 0.2},
+        )
+
+    def test_metadata_cache(self, tmp_path, monkeypatch):
+        write_test_parquet_data(tmp_path)
+        data = ParquetData(str(tmp_path), metadata_manifest=True)
+        mapping = data.get_categorical_mapping("batch")
+        var = data.var
+        assert os.path.exists(tmp_path / ".drvi_metadata.json")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("parquet file read although metadata is cached")
+
+        # in-memory cache
+        monkeypatch.setattr(_parquet_data, "read_first_row", fail)
+        monkeypatch.setattr(_parquet_data.pd, "read_parquet", fail)
+        cached_data = ParquetData(str(tmp_path))
+        assert cached_data.get_categorical_mapping("batch") == mapping
+        pd.testing.assert_frame_equal(cached_data.var, var)
+
+        # manifest on disk
+        clear_metadata_cache()
+        cached_data = ParquetData(str(tmp_path), metadata_manifest=True)
+        assert cached_data.schema.equals(data.schema)
+        assert cached_data.n_vars == data.n_vars
+        assert cached_data.get_categorical_mapping("batch") == mapping
+        monkeypatch.undo()
+
+        # modified files are read again
+        os.utime(tmp_path / "categorical_lookup" / "batch.parquet", ns=(0, 0))
+        assert ParquetData(str(tmp_path), metadata_manifest=True).get_categorical_mapping("batch") == mapping
+
+    @pytest.mark.parametrize("n_workers", [1, 2])
+    def test_anndata_to_parquet(self, tmp_path, n_workers):
+        n, g = 500, 30
+        exp_matrix = np.random.poisson(1.0, [n, g]).astype(np.float32)
+        adata = ad.AnnData(X=sparse.csr_matrix(exp_matrix))
+        adata.obs["batch"] = pd.Categorical([f"batch_{i}" for i in np.random.choice(range(3), n)])
+        adata.obs["cell_id"] = np.arange(n)
+        adata.var_names = [f"gene_{i}" for i in range(g)]
+        adata.write_h5ad(tmp_path / "adata.h5ad")
+
+        output_path = str(tmp_path / "parquet")
+        anndata_to_parquet(
+            str(tmp_path / "adata.h5ad"),
+            output_path,
+            obs_keys=["batch", "cell_id"],
+            split_fractions=(0.8, 0.1, 0.1),
+            part_size=150,
+            row_group_size=50,
+            n_workers=n_workers,
+        )
+
+        data = ParquetData(output_path)
+        assert data.n_vars == g
+        assert list(data.var_names) == list(adata.var_names)
+        assert data.get_categorical_mapping("batch") == {"0": "batch_0", "1": "batch_1", "2": "batch_2"}
+
+        cell_ids = []
+        for split in ["train", "val", "test"]:
+            dataset = data.get_dataset(split, ["X", "batch", "cell_id"])
+            assert all(n_rows <= 50 for _, _, n_rows in dataset.row_groups)
+            for batch in ParquetDataLoader(dataset, batch_size=64):
+                ids = batch["cell_id"].numpy()
+                np.testing.assert_array_equal(batch["X"].numpy(), exp_matrix[ids])
+                np.testing.assert_array_equal(batch["batch"].numpy(), adata.obs["batch"].cat.codes.to_numpy()[ids])
+                cell_ids.append(ids)
+        assert sorted(np.concatenate(cell_ids)) == list(range(n))
+
+    def test_sparse_layer(self, tmp_path):
+        n, g = 400, 30
+        exp_matrix = np.random.poisson(0.3, [n, g]).astype(np.float32)
+        adata = ad.AnnData(X=sparse.csr_matrix(exp_matrix))
+        adata.obs["batch"] = pd.Categorical([f"batch_{i}" for i in np.random.choice(range(3), n)])
+        adata.obs["cell_id"] = np.arange(n)
+        output_path = str(tmp_path / "parquet")
+        anndata_to_parquet(adata, output_path, obs_keys=["batch", "cell_id"], row_group_size=50, sparse_layer=True)
+
+        data = ParquetData(output_path)
+        assert data.is_sparse_layer("X")
+        assert data.n_vars == g
+        DRVI.setup_merlin_data(data, layer="X", categorical_covariate_keys=["batch"])
+        model = DRVI(data, n_latent=8, encoder_dims=[32], decoder_dims=[32], categorical_covariates=["batch"])
+        mapping = model.adata_manager.get_fields_schema_mapping()
+        assert ("X", SparseColumnPair("X", g)) in mapping
+
+        dataset = data.get_dataset("train", ["X__indices", "X__values", "batch", "cell_id"])
+        loader = ParquetDataLoader(dataset, batch_size=64, shuffle=True, mapping=mapping + [("cell_id", "cell_id")])
+        for batch in loader:
+            np.testing.assert_array_equal(batch["X"].numpy(), exp_matrix[batch["cell_id"].numpy()])
+        loader.sparse_output = True
+        batch = next(iter(loader))
+        np.testing.assert_array_equal(batch["X"].to_dense().numpy(), exp_matrix[batch["cell_id"].numpy()])
+
+        # decoding into a recycled buffer leaves the ragged columns in the batch and clears stale values
+        csr = sparse.csr_matrix(exp_matrix[:10])
+        ragged_batch = {
+            "X__indices__offsets": torch.from_numpy(csr.indptr),
+            "X__indices__values": torch.from_numpy(csr.indices),
+            "X__values__values": torch.from_numpy(csr.data),
+        }
+        buffer = torch.full((10, g), 7.0)
+        for _ in range(2):
+            decoded = decode_sparse_batch(ragged_batch, SparseColumnPair("X", g), out=buffer)
+            assert decoded.data_ptr() == buffer.data_ptr()
+            np.testing.assert_array_equal(decoded.numpy(), exp_matrix[:10])
+
+        model.train(accelerator="cpu", max_epochs=1, batch_size=128)
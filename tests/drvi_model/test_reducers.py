@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+from drvi.scvi_tools_based.model.base._reducers import make_reducer, split_effect_share
+
+
+class TestSplitEffectReducers:
+    def make_params(self, n=64, s=4, g=20):
+        return torch.randn(n, s, g) * 3
+
+    def test_fused_effect_matches_padded_softmax(self):
+        # in double precision, as the padded softmax loses precision in float32 when a split dominates
+        params = self.make_params().double()
+        for add_to_counts in [0.1, 0.0]:
+            log_add_to_counts = np.log(add_to_counts) if add_to_counts > 0 else -np.inf
+            padded = F.pad(params, (0, 0, 0, 1), value=log_add_to_counts)
+            expected = -torch.log(1 - F.softmax(padded, dim=-2)[:, :-1, :])
+            np.testing.assert_allclose(
+                split_effect_share(params, "logsumexp", add_to_counts).numpy(), expected.numpy(), rtol=1e-6, atol=1e-8
+            )
+
+    def test_reducers_match_full_reduction(self):
+        effects = split_effect_share(self.make_params(), "logsumexp", 1.0)
+        for reduction, expected in [
+            ("max", effects.amax(dim=0)),
+            ("sum", effects.sum(dim=0)),
+            ("mean", effects.mean(dim=0)),
+        ]:
+            reducer = make_reducer(reduction)
+            other = make_reducer(reduction)
+            reducer.update(effects[:40])
+            other.update(effects[40:])
+            np.testing.assert_allclose(reducer.merge(other).result(), expected.numpy(), rtol=1e-5)
+
+    def test_quantile_reducer_is_close_to_exact_quantile(self):
+        effects = torch.rand(2000, 2, 3) * 10 + 0.01
+        reducer = make_reducer("quantile", quantiles=(0.5,), n_bins=512, min_value=1e-3, max_value=1e2)
+        for chunk in torch.split(effects, 128):
+            reducer.update(chunk)
+        result = reducer.result()
+        assert result.shape == (1, 2, 3)
+        np.testing.assert_allclose(result[0], effects.quantile(0.5, dim=0).numpy(), rtol=0.05)
@@ -0,0 +1,38 @@
+import torch
+
+from drvi.nn_modules.noise_model import (
+    LogNegativeBinomialNoiseModel,
+    NegativeBinomialNoiseModel,
+    NormalNoiseModel,
+    PoissonNoiseModel,
+    gather_features,
+)
+
+
+class TestNoiseModel:
+    n = 16
+    g = 50
+
+    def make_test_data(self):
+        x = torch.poisson(torch.rand(self.n, self.g) * 5)
+        parameters = {
+            "mean": torch.randn(self.n, self.g),
+            "var": torch.randn(self.n, self.g),
+            "r": torch.randn(self.g).unsqueeze(0).expand(self.n, -1),
+        }
+        return x, parameters
+
+    def test_gather_features(self):
+        x, parameters = self.make_test_data()
+        index = torch.randint(self.g, (self.n, 10))
+        for noise_model in [
+            NormalNoiseModel(model_var="dynamic"),
+            PoissonNoiseModel(),
+            NegativeBinomialNoiseModel(library_normalization="none"),
+            NegativeBinomialNoiseModel(mean_transformation="softmax"),
+            LogNegativeBinomialNoiseModel(),
+        ]:
+            dist = noise_model.dist({}, parameters, x.sum(dim=-1))
+            expected = torch.gather(dist.log_prob(x), 1, index)
+            gathered = gather_features(dist, index).log_prob(torch.gather(x, 1, index))
+            torch.testing.assert_close(gathered, expected)